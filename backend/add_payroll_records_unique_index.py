@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Script pour ajouter la clé unique (employee_id, period) sur payroll_records
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from app.db.database import engine
+
+INDEX_NAME = "uq_payroll_records_employee_period"
+
+def add_payroll_records_unique_index():
+    """Supprimer les doublons (on garde le plus récent) puis créer l'index unique"""
+    try:
+        inspector = inspect(engine)
+        existing = {index["name"] for index in inspector.get_indexes("payroll_records")}
+        existing |= {constraint["name"] for constraint in inspector.get_unique_constraints("payroll_records")}
+        if INDEX_NAME in existing:
+            print(f"[INFO] L'index {INDEX_NAME} existe déjà")
+            return
+
+        with engine.begin() as conn:
+            print("[INFO] Suppression des doublons (employee_id, period)...")
+            result = conn.execute(text("""
+                DELETE FROM payroll_records
+                WHERE id NOT IN (
+                    SELECT id FROM (
+                        SELECT MAX(id) AS id FROM payroll_records GROUP BY employee_id, period
+                    ) AS latest
+                )
+            """))
+            print(f"[INFO] {result.rowcount} doublon(s) supprimé(s)")
+
+            print(f"[INFO] Création de l'index {INDEX_NAME}...")
+            conn.execute(text(
+                f"CREATE UNIQUE INDEX {INDEX_NAME} ON payroll_records (employee_id, period)"
+            ))
+
+        print("[SUCCESS] Clé unique (employee_id, period) ajoutée sur payroll_records !")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la migration: {e}")
+
+if __name__ == "__main__":
+    add_payroll_records_unique_index()
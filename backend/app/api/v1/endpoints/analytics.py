@@ -115,6 +115,38 @@ async def get_costs_analytics(
     current_user: models.User = Depends(deps.get_current_active_hr_admin)
 ):
     """Analytics des coûts"""
+    # Coûts réels des 12 dernières périodes de paie (cube pré-agrégé, une requête)
+    periods = crud_payroll.get_cost_cube_by_period(db, current_user.company_id, limit=12)
+    if periods:
+        latest = periods[0]
+        previous = periods[1] if len(periods) > 1 else None
+        total_cost = latest["gross_salary"] + latest["cnss_employer"]
+        social_charges = latest["cnss_employee"] + latest["cnss_employer"]
+        
+        def share(amount: float) -> int:
+            return round(amount * 100 / total_cost) if total_cost else 0
+        
+        return {
+            "totalPayroll": latest["gross_salary"],
+            "change": round(
+                (latest["gross_salary"] - previous["gross_salary"]) * 100 / previous["gross_salary"], 1
+            ) if previous and previous["gross_salary"] else 0,
+            "averageSalary": latest["gross_salary"] / latest["headcount"] if latest["headcount"] else 0,
+            "benefitsCost": latest["cnss_employer"],
+            "recruitmentCost": 45000,
+            "period": latest["period"],
+            "byCategory": [
+                {"category": "Salaires nets", "amount": latest["net_salary"], "percent": share(latest["net_salary"])},
+                {"category": "Charges sociales", "amount": social_charges, "percent": share(social_charges)},
+                {"category": "IRPP", "amount": latest["irpp"], "percent": share(latest["irpp"])}
+            ],
+            "trend": [
+                {"period": row["period"], "value": round(row["gross_salary"], 1)}
+                for row in reversed(periods)
+            ]
+        }
+    
+    # Aucune paie enregistrée : estimation depuis les salaires des employés actifs
     employees = crud_employee.get_employees_by_company(db, current_user.company_id)
     active_employees = [emp for emp in employees if emp.status == "active"]
     
@@ -2,6 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.core.email import email_service
+from app.services.email_outbox import (
+    enqueue_email, cancel_pending_emails, detach_invitation_emails, retry_email, outbox_stats,
+    email_outbox_dispatcher
+)
 from app.api.deps import get_current_user
 from app.db import models
 from pydantic import BaseModel, EmailStr, Field
@@ -66,39 +70,40 @@ async def send_invitation(
             email_status="pending"
         )
         db.add(db_invitation)
-        db.commit()
+        db.flush()
         
-        # Envoyer l'email
+        # Email mis en file dans la même transaction que l'invitation ; le dispatcher met à jour email_status
         company = db.query(models.Company).filter(models.Company.id == current_user.company_id).first()
         company_logo = None
         if company and company.settings_appearance:
             company_logo = company.settings_appearance.get('company_logo')
         
-        success = email_service.send_invitation_email(
+        enqueue_email(
+            db,
             to_email=invitation.email,
-            first_name=invitation.first_name,
-            last_name=invitation.last_name,
-            company_name=company.name,
-            role=invitation.role,
-            invitation_token=invitation_token,
-            company_logo=company_logo,
-            smtp_config=company.settings_smtp
+            kind="invitation",
+            company_id=current_user.company_id,
+            invitation_id=db_invitation.id,
+            **email_service.compose_invitation_email(
+                first_name=invitation.first_name,
+                last_name=invitation.last_name,
+                company_name=company.name,
+                role=invitation.role,
+                invitation_token=invitation_token,
+                company_logo=company_logo
+            )
         )
-        
-        # Mettre à jour le statut email
-        if success:
-            db_invitation.email_status = "sent"
-            db_invitation.email_sent_at = datetime.utcnow()
-        else:
-            db_invitation.email_status = "failed"
-        
         db.commit()
+        email_outbox_dispatcher.wake()
         
-        if not success:
-            raise HTTPException(status_code=500, detail="Erreur envoi email")
-        
-        return {"message": "Invitation envoyée avec succès", "invitation_id": db_invitation.id}
+        return {
+            "message": "Invitation enregistrée, email en cours d'envoi",
+            "invitation_id": db_invitation.id,
+            "email_status": db_invitation.email_status
+        }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erreur envoi invitation: {e}")
         raise HTTPException(status_code=500, detail="Erreur lors de l'envoi de l'invitation")
@@ -131,9 +136,10 @@ async def resend_invitation(
     if not invitation:
         raise HTTPException(status_code=404, detail="Invitation non trouvée")
     
-    # Générer un nouveau token
+    # Générer un nouveau token ; les envois pas encore partis portent l'ancien lien
     invitation.token = secrets.token_urlsafe(32)
-    db.commit()
+    invitation.email_status = "pending"
+    cancel_pending_emails(db, invitation.id)
     
     # Renvoyer l'email
     company = db.query(models.Company).filter(models.Company.id == current_user.company_id).first()
@@ -141,21 +147,25 @@ async def resend_invitation(
     if company and company.settings_appearance:
         company_logo = company.settings_appearance.get('company_logo')
     
-    success = email_service.send_invitation_email(
+    enqueue_email(
+        db,
         to_email=invitation.email,
-        first_name=invitation.first_name,
-        last_name=invitation.last_name,
-        company_name=company.name,
-        role=invitation.role,
-        invitation_token=invitation.token,
-        company_logo=company_logo,
-        smtp_config=company.settings_smtp
+        kind="invitation",
+        company_id=current_user.company_id,
+        invitation_id=invitation.id,
+        **email_service.compose_invitation_email(
+            first_name=invitation.first_name,
+            last_name=invitation.last_name,
+            company_name=company.name,
+            role=invitation.role,
+            invitation_token=invitation.token,
+            company_logo=company_logo
+        )
     )
+    db.commit()
+    email_outbox_dispatcher.wake()
     
-    if not success:
-        raise HTTPException(status_code=500, detail="Erreur envoi email")
-    
-    return {"message": "Invitation renvoyée avec succès"}
+    return {"message": "Invitation renvoyée, email en cours d'envoi"}
 
 @router.delete("/invitations/{invitation_id}")
 async def cancel_invitation(
@@ -172,6 +182,7 @@ async def cancel_invitation(
     if not invitation:
         raise HTTPException(status_code=404, detail="Invitation non trouvée")
     
+    detach_invitation_emails(db, invitation.id)
     db.delete(invitation)
     db.commit()
     
@@ -219,6 +230,67 @@ async def get_invitation_stats(
     
     return stats
 
+@router.get("/outbox")
+async def get_outbox(
+    status: str = "dead",
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Emails de la file d'envoi (par défaut ceux abandonnés) et compteurs par statut"""
+    if current_user.role not in ["employer", "hr_admin"]:
+        raise HTTPException(status_code=403, detail="Permission insuffisante")
+    
+    messages = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.company_id == current_user.company_id,
+        models.EmailOutbox.status == status
+    ).order_by(models.EmailOutbox.id.desc()).limit(min(limit, 500)).all()
+    
+    return {
+        "stats": outbox_stats(db, current_user.company_id),
+        "messages": [
+            {
+                "id": message.id,
+                "kind": message.kind,
+                "to_email": message.to_email,
+                "subject": message.subject,
+                "status": message.status,
+                "attempts": message.attempts,
+                "next_attempt_at": message.next_attempt_at,
+                "last_error": message.last_error,
+                "created_at": message.created_at,
+                "sent_at": message.sent_at
+            }
+            for message in messages
+        ]
+    }
+
+@router.post("/outbox/{message_id}/retry")
+async def retry_outbox_message(
+    message_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Remet en file un email abandonné (après correction de la configuration SMTP par exemple)"""
+    if current_user.role not in ["employer", "hr_admin"]:
+        raise HTTPException(status_code=403, detail="Permission insuffisante")
+    
+    message = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.id == message_id,
+        models.EmailOutbox.company_id == current_user.company_id
+    ).first()
+    
+    if not message:
+        raise HTTPException(status_code=404, detail="Email non trouvé")
+    if message.status != "dead":
+        raise HTTPException(status_code=400, detail="Seuls les emails abandonnés peuvent être renvoyés")
+    
+    retry_email(db, message)
+    db.commit()
+    email_outbox_dispatcher.wake()
+    
+    return {"message": "Email remis en file d'envoi"}
+
 @router.get("/smtp-config")
 async def get_smtp_config(
     db: Session = Depends(get_db),
@@ -12,6 +12,7 @@ from app.core.config import settings
 import secrets
 from app.db import models
 from app.core.email import email_service
+from app.services.email_outbox import enqueue_email, email_outbox_dispatcher
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
@@ -109,15 +110,19 @@ async def register_company(
         is_active=True
     )
     db.add(admin_user)
-    db.commit()
-    db.refresh(admin_user)
+    db.flush()
     
-    # Envoyer email de bienvenue
-    email_service.send_welcome_email(
+    # Email de bienvenue mis en file dans la même transaction, envoyé par le dispatcher
+    enqueue_email(
+        db,
         to_email=admin_user.email,
-        first_name=admin_user.first_name,
-        company_name=company.name
+        kind="welcome",
+        company_id=company.id,
+        **email_service.compose_welcome_email(admin_user.first_name, company.name)
     )
+    db.commit()
+    db.refresh(admin_user)
+    email_outbox_dispatcher.wake()
     
     return {
         "message": "Entreprise créée avec succès",
@@ -239,7 +244,6 @@ async def reset_password(
         user_id=user.id
     )
     db.add(password_reset)
-    db.commit()
     
     # Récupérer le logo de l'entreprise
     company_logo = None
@@ -247,20 +251,22 @@ async def reset_password(
         appearance = user.company.settings_appearance or {}
         company_logo = appearance.get('company_logo')
     
-    # Envoyer l'email de réinitialisation
-    reset_link = f"{settings.FRONTEND_URL}/reset-password?token={reset_token}"
-    email_sent = email_service.send_password_reset_email(
+    # Email mis en file avec le token, dans la même transaction ; envoyé par le dispatcher
+    reset_link = f"{email_service.get_frontend_url()}/reset-password?token={reset_token}"
+    enqueue_email(
+        db,
         to_email=user.email,
-        first_name=user.first_name,
-        reset_link=reset_link,
-        company_logo=company_logo,
-        smtp_config=user.company.settings_smtp
+        kind="password_reset",
+        company_id=user.company_id,
+        **email_service.compose_password_reset_email(user.first_name, reset_link, company_logo)
     )
+    db.commit()
+    email_outbox_dispatcher.wake()
     
     return {
         "success": True,
-        "message": "Un lien de réinitialisation a été envoyé à votre adresse email",
-        "email_sent": email_sent
+        "message": "Un lien de réinitialisation va être envoyé à votre adresse email",
+        "email_sent": True  # Email en file d'envoi
     }
 
 @router.post("/confirm-reset")
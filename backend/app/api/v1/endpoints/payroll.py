@@ -30,7 +30,10 @@ async def create_payroll_record(
     if not employee or employee.company_id != current_admin.company_id:
         raise HTTPException(status_code=404, detail="Employé non trouvé")
     payroll_in.processed_by_id = current_admin.id
-    return crud_payroll.create_payroll_record(db=db, payroll=payroll_in)
+    try:
+        return crud_payroll.create_payroll_record(db=db, payroll=payroll_in)
+    except crud_payroll.PayrollPeriodClosedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 @router.put("/{payroll_id}", response_model=payroll_schema.PayrollRecord)
 async def update_payroll_record(
@@ -42,7 +45,10 @@ async def update_payroll_record(
     db_payroll = crud_payroll.get_payroll_record(db, payroll_id)
     if not db_payroll:
         raise HTTPException(status_code=404, detail="Enregistrement paie non trouvé")
-    return crud_payroll.update_payroll_record(db=db, db_payroll=db_payroll, payroll_in=payroll_in)
+    try:
+        return crud_payroll.update_payroll_record(db=db, db_payroll=db_payroll, payroll_in=payroll_in)
+    except crud_payroll.PayrollPeriodClosedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 @router.get("/payslips/{employee_id}/{period}")
 async def get_payslip(
@@ -179,6 +185,38 @@ async def calculate_employee_payroll(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur de calcul: {str(e)}")
 
+@router.post("/calculate/incremental", response_model=config_schema.PayrollCalculationResult)
+async def recalculate_employee_payroll(
+    recalculation_request: config_schema.PayrollRecalculationRequest,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Recalculer uniquement les variables impactées par une modification de la grille de paie"""
+    
+    previous_result = recalculation_request.previous_result
+    employee = db.query(models.Employee).filter(
+        models.Employee.id == previous_result.employee_id,
+        models.Employee.company_id == current_user.company_id
+    ).first()
+    
+    if not employee:
+        raise HTTPException(status_code=404, detail="Employé non trouvé")
+    
+    engine = PayrollCalculationEngine(db, current_user.company_id)
+    
+    validation_errors = engine.validate_calculation_inputs(recalculation_request.variable_values)
+    if validation_errors:
+        raise HTTPException(status_code=400, detail={"errors": validation_errors})
+    
+    try:
+        return engine.recalculate_payroll(
+            previous_result.dict(),
+            recalculation_request.variable_values,
+            recalculation_request.changed_codes
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur de calcul: {str(e)}")
+
 @router.post("/calculate/batch")
 async def calculate_batch_payroll(
     employee_ids: List[int],
@@ -232,47 +270,27 @@ async def save_payroll_calculation(
 ):
     """Sauvegarder un calcul de paie en base"""
     
-    # Vérifier si un enregistrement existe déjà
-    existing = db.query(models.PayrollRecord).filter(
+    try:
+        crud_payroll.upsert_payroll_records(db, [{
+            "employee_id": calculation_result.employee_id,
+            "period": calculation_result.period,
+            "gross_salary": calculation_result.gross_salary,
+            "total_allowances": calculation_result.total_allowances,
+            "total_deductions": calculation_result.total_deductions,
+            "taxable_income": calculation_result.taxable_income,
+            "tax_amount": calculation_result.tax_amount,
+            "social_contributions": calculation_result.social_contributions,
+            "net_salary": calculation_result.net_salary,
+            "salary_breakdown": calculation_result.salary_breakdown,
+            "processed_by_id": current_user.id
+        }])
+    except crud_payroll.PayrollPeriodClosedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return db.query(models.PayrollRecord).filter(
         models.PayrollRecord.employee_id == calculation_result.employee_id,
         models.PayrollRecord.period == calculation_result.period
     ).first()
-    
-    if existing:
-        # Mettre à jour
-        existing.gross_salary = calculation_result.gross_salary
-        existing.total_allowances = calculation_result.total_allowances
-        existing.total_deductions = calculation_result.total_deductions
-        existing.taxable_income = calculation_result.taxable_income
-        existing.tax_amount = calculation_result.tax_amount
-        existing.social_contributions = calculation_result.social_contributions
-        existing.net_salary = calculation_result.net_salary
-        existing.salary_breakdown = calculation_result.salary_breakdown
-        existing.processed_by_id = current_user.id
-        
-        db.commit()
-        db.refresh(existing)
-        return existing
-    else:
-        # Créer nouveau
-        new_record = models.PayrollRecord(
-            employee_id=calculation_result.employee_id,
-            period=calculation_result.period,
-            gross_salary=calculation_result.gross_salary,
-            total_allowances=calculation_result.total_allowances,
-            total_deductions=calculation_result.total_deductions,
-            taxable_income=calculation_result.taxable_income,
-            tax_amount=calculation_result.tax_amount,
-            social_contributions=calculation_result.social_contributions,
-            net_salary=calculation_result.net_salary,
-            salary_breakdown=calculation_result.salary_breakdown,
-            processed_by_id=current_user.id
-        )
-        
-        db.add(new_record)
-        db.commit()
-        db.refresh(new_record)
-        return new_record
 
 @router.post("/finalize")
 async def finalize_payroll(
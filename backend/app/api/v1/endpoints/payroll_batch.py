@@ -1,107 +1,215 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 from datetime import datetime
+import json
 
-from ....db.database import get_db
-from ....db.models import Employee, PayrollRecord, PayrollConfig
+from ....db.database import get_db, SessionLocal
+from ....db.models import Employee, PayrollRecord, PayrollConfig, EmployeePayrollData
 from ....services.payroll_calculator import PayrollCalculator
+from ....services.payroll_memo import payroll_input_hash, memo_config_version, start_memo_run
+from ....services.payroll_vectorized import split_payroll_values
 from ....core.auth import get_current_user
+from ....crud import crud_payroll
 
 router = APIRouter()
 
+def _simple_calculation(employee_id: int, employee_name: str, base_salary: float) -> Dict[str, Any]:
+    """Calcul simple par défaut (sans configuration de paie ou en cas d'erreur)"""
+    prime_transport = 25000
+    prime_fonction = base_salary * 0.1
+    gross_salary = base_salary + prime_transport + prime_fonction
+    cnss_employee = gross_salary * 0.036
+    taxable_income = gross_salary - cnss_employee
+    irpp = max(0, (taxable_income - 30000) * 0.05) if taxable_income <= 50000 else 1000 + (taxable_income - 50000) * 0.1
+    net_salary = gross_salary - cnss_employee - irpp
+    
+    return {
+        "employee_id": employee_id,
+        "employee_name": employee_name,
+        "gross_salary": round(gross_salary),
+        "net_salary": round(net_salary),
+        "total_allowances": round(prime_transport + prime_fonction),
+        "total_deductions": round(cnss_employee + irpp),
+        "taxable_income": round(taxable_income),
+        "tax_amount": round(irpp),
+        "social_contributions": round(cnss_employee),
+        "breakdown": {
+            "salaire_base": base_salary,
+            "prime_transport": prime_transport,
+            "prime_fonction": round(prime_fonction),
+            "cnss_employe": round(cnss_employee),
+            "irpp": round(irpp)
+        }
+    }
+
+def _load_batch_inputs(db: Session, company_id: int, period: str, employees_data: List[Dict[str, Any]]):
+    """Charger en deux requêtes les employés demandés et leurs données de paie de la période"""
+    
+    employee_query = db.query(Employee.id, Employee.name, Employee.salary).filter(
+        Employee.company_id == company_id
+    )
+    if employees_data:
+        requested_ids = {emp_data.get("employee_id") for emp_data in employees_data}
+        employee_query = employee_query.filter(Employee.id.in_(requested_ids))
+    else:
+        # Si pas d'employés fournis, tous les employés actifs
+        employee_query = employee_query.filter(Employee.status == "active")
+    
+    employees = {row.id: row for row in employee_query.order_by(Employee.id).all()}
+    if not employees_data:
+        employees_data = [{"employee_id": employee_id} for employee_id in employees]
+    
+    # Valeurs "current" d'abord : celles de la période l'emportent
+    # (tri explicite : ORDER BY placerait "current" après "YYYY-MM")
+    payroll_values: Dict[int, Dict[str, float]] = {}
+    if employees:
+        rows = db.query(
+            EmployeePayrollData.employee_id,
+            EmployeePayrollData.variable_code,
+            EmployeePayrollData.value,
+            EmployeePayrollData.period
+        ).filter(
+            EmployeePayrollData.employee_id.in_(list(employees)),
+            EmployeePayrollData.period.in_([period, "current"])
+        ).all()
+        for employee_id, code, value, _ in sorted(rows, key=lambda row: row.period != "current"):
+            payroll_values.setdefault(employee_id, {})[code] = value
+    
+    return employees_data, employees, payroll_values
+
+def _employee_inputs(emp_data: Dict[str, Any], stored: Dict[str, float]):
+    """Heures sup., absences et variables : heures de la demande, sinon données de paie de la période"""
+    stored_overtime, stored_absence, variables = split_payroll_values(stored)
+    overtime_hours = emp_data.get("variable_data", {}).get("overtime_hours", stored_overtime)
+    absence_hours = emp_data.get("attendance_data", {}).get("absence_hours", stored_absence)
+    return overtime_hours, absence_hours, variables
+
+def _batch_input_hashes(config_version, employees_data, employees, payroll_values) -> Dict[int, str]:
+    """Empreinte des entrées de chaque employé calculable"""
+    hashes = {}
+    for emp_data in employees_data:
+        employee_id = emp_data.get("employee_id")
+        employee = employees.get(employee_id)
+        if not employee or not employee.salary or employee_id in hashes:
+            continue
+        overtime_hours, absence_hours, variables = _employee_inputs(emp_data, payroll_values.get(employee_id, {}))
+        hashes[employee_id] = payroll_input_hash(
+            config_version, employee.salary, overtime_hours, absence_hours, variables
+        )
+    return hashes
+
+def _iter_batch_calculations(period, employees_data, employees, payroll_values, use_engine: bool, memo_run=None):
+    """Calculer chaque employé demandé (une seule fois), dans l'ordre de la demande"""
+    calculator = PayrollCalculator()
+    calculated: Dict[int, Dict[str, Any]] = {}
+    
+    for emp_data in employees_data:
+        employee_id = emp_data.get("employee_id")
+        employee = employees.get(employee_id)
+        
+        if not employee or not employee.salary or employee_id in calculated:
+            continue
+        
+        stored = payroll_values.get(employee_id, {})
+        calculation = None
+        
+        if use_engine:
+            # Résultat mémorisé si les entrées de l'employé n'ont pas changé
+            result = memo_run.lookup(employee_id) if memo_run else None
+            
+            if result is None:
+                # Utiliser le moteur de calcul complexe si config existe
+                overtime_hours, absence_hours, _ = _employee_inputs(emp_data, stored)
+                try:
+                    result = calculator.calculate_employee_payroll({
+                        "employee_id": employee_id,
+                        "employee_name": employee.name,
+                        "base_salary": employee.salary,
+                        "overtime_hours": overtime_hours,
+                        "absence_hours": absence_hours,
+                        "period": period
+                    })
+                    if memo_run:
+                        memo_run.store(employee_id, result)
+                except Exception:
+                    # Fallback vers calcul simple si erreur
+                    result = None
+            
+            if result is not None:
+                calculation = {"employee_id": employee_id, "employee_name": employee.name, **result}
+        
+        if calculation is None:
+            calculation = _simple_calculation(employee_id, employee.name, employee.salary)
+        
+        calculated[employee_id] = calculation
+        yield calculation
+
+def _stream_and_save(calculations, memo_run):
+    """Flux NDJSON ; les résultats recalculés sont mémorisés à la fin, dans une session dédiée"""
+    for calculation in calculations:
+        yield json.dumps(calculation, default=str) + "\n"
+    
+    if memo_run:
+        db = SessionLocal()
+        try:
+            memo_run.save(db)
+        finally:
+            db.close()
+
 @router.post("/calculate-batch")
 async def calculate_batch_payroll(
     payload: Dict[str, Any],
+    stream: bool = False,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Calcul par lot des salaires pour une période"""
+    """Calcul par lot des salaires pour une période (stream=true : une ligne NDJSON par employé)
+
+    Les employés dont les entrées n'ont pas changé depuis le dernier calcul sont servis
+    depuis les résultats mémorisés ; la réponse indique hits et recalculs.
+    """
     try:
         period = payload.get("period")
-        employees_data = payload.get("employees", [])
         
-        # Si pas d'employés fournis, charger tous les employés actifs
-        if not employees_data:
-            employees = db.query(Employee).filter(
-                Employee.company_id == current_user.company_id,
-                Employee.status == "active"
-            ).all()
-            employees_data = [{"employee_id": emp.id} for emp in employees]
+        employees_data, employees, payroll_values = _load_batch_inputs(
+            db, current_user.company_id, period, payload.get("employees", [])
+        )
         
         # Charger la configuration de paie
-        config = db.query(PayrollConfig).filter(
+        config = db.query(PayrollConfig.id).filter(
             PayrollConfig.company_id == current_user.company_id,
             PayrollConfig.is_active == True
         ).first()
         
-        calculations = []
+        hashes = _batch_input_hashes(
+            memo_config_version(db, current_user.company_id), employees_data, employees, payroll_values
+        )
+        # Seuls les calculs du moteur sont mémorisés (le calcul simple ne coûte rien)
+        memo_run = start_memo_run(db, current_user.company_id, period, hashes) if config is not None else None
+        cache_stats = memo_run.stats() if memo_run else {"hits": 0, "recomputed": len(hashes)}
         
-        for emp_data in employees_data:
-            employee_id = emp_data.get("employee_id")
-            
-            # Charger l'employé
-            employee = db.query(Employee).filter(
-                Employee.id == employee_id,
-                Employee.company_id == current_user.company_id
-            ).first()
-            
-            if not employee or not employee.salary:
-                continue
-            
-            if config:
-                # Utiliser le moteur de calcul complexe si config existe
-                try:
-                    calculator = PayrollCalculator()
-                    calculation = calculator.calculate_employee_payroll({
-                        "employee_id": employee_id,
-                        "employee_name": employee.name,
-                        "base_salary": employee.salary,
-                        "overtime_hours": emp_data.get("variable_data", {}).get("overtime_hours", 0),
-                        "absence_hours": emp_data.get("attendance_data", {}).get("absence_hours", 0),
-                        "period": period
-                    })
-                    
-                    calculations.append({
-                        "employee_id": employee_id,
-                        "employee_name": employee.name,
-                        **calculation
-                    })
-                except Exception:
-                    # Fallback vers calcul simple si erreur
-                    pass
-            
-            # Calcul simple par défaut
-            if not any(calc["employee_id"] == employee_id for calc in calculations):
-                base_salary = employee.salary
-                prime_transport = 25000
-                prime_fonction = base_salary * 0.1
-                gross_salary = base_salary + prime_transport + prime_fonction
-                cnss_employee = gross_salary * 0.036
-                taxable_income = gross_salary - cnss_employee
-                irpp = max(0, (taxable_income - 30000) * 0.05) if taxable_income <= 50000 else 1000 + (taxable_income - 50000) * 0.1
-                net_salary = gross_salary - cnss_employee - irpp
-                
-                calculations.append({
-                    "employee_id": employee_id,
-                    "employee_name": employee.name,
-                    "gross_salary": round(gross_salary),
-                    "net_salary": round(net_salary),
-                    "total_allowances": round(prime_transport + prime_fonction),
-                    "total_deductions": round(cnss_employee + irpp),
-                    "taxable_income": round(taxable_income),
-                    "tax_amount": round(irpp),
-                    "social_contributions": round(cnss_employee),
-                    "breakdown": {
-                        "salaire_base": base_salary,
-                        "prime_transport": prime_transport,
-                        "prime_fonction": round(prime_fonction),
-                        "cnss_employe": round(cnss_employee),
-                        "irpp": round(irpp)
-                    }
-                })
-        
-        return {"calculations": calculations}
+        calculations = _iter_batch_calculations(
+            period, employees_data, employees, payroll_values, use_engine=config is not None, memo_run=memo_run
+        )
+        
+        if stream:
+            # Toutes les données sont chargées : le flux ne dépend plus de la session
+            return StreamingResponse(
+                _stream_and_save(calculations, memo_run),
+                media_type="application/x-ndjson",
+                headers={
+                    "X-Payroll-Cache-Hits": str(cache_stats["hits"]),
+                    "X-Payroll-Cache-Recomputed": str(cache_stats["recomputed"])
+                }
+            )
+        
+        calculations = list(calculations)
+        if memo_run:
+            memo_run.save(db)
+        
+        return {"calculations": calculations, "cache": cache_stats}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -117,40 +225,43 @@ async def validate_batch_payroll(
         period = payload.get("period")
         calculations = payload.get("calculations", [])
         
-        for calc in calculations:
-            # Supprimer l'ancien enregistrement s'il existe
-            existing = db.query(PayrollRecord).filter(
-                PayrollRecord.employee_id == calc["employee_id"],
-                PayrollRecord.period == period
-            ).first()
-            
-            if existing:
-                db.delete(existing)
-            
-            # Créer le nouvel enregistrement
-            record = PayrollRecord(
-                employee_id=calc["employee_id"],
-                period=period,
-                gross_salary=calc["gross_salary"],
-                total_allowances=calc.get("total_allowances", 0),
-                total_deductions=calc.get("total_deductions", 0),
-                taxable_income=calc["taxable_income"],
-                tax_amount=calc["tax_amount"],
-                social_contributions=calc["social_contributions"],
-                net_salary=calc["net_salary"],
-                salary_breakdown=calc.get("breakdown", {}),
-                status="validated",
-                processed_date=datetime.utcnow(),
-                validated_date=datetime.utcnow(),
-                processed_by_id=current_user.id,
-                validated_by_id=current_user.id
-            )
-            
-            db.add(record)
+        now = datetime.utcnow()
+        records = [
+            {
+                "employee_id": calc["employee_id"],
+                "period": period,
+                "gross_salary": calc["gross_salary"],
+                "total_allowances": calc.get("total_allowances", 0),
+                "total_deductions": calc.get("total_deductions", 0),
+                "taxable_income": calc["taxable_income"],
+                "tax_amount": calc["tax_amount"],
+                "social_contributions": calc["social_contributions"],
+                "net_salary": calc["net_salary"],
+                # Calcul du moteur : le détail (dont cnss_employer) est au premier niveau
+                "salary_breakdown": calc.get("breakdown") or {
+                    key: value for key, value in calc.items() if key not in ("employee_id", "employee_name")
+                },
+                "status": "validated",
+                "processed_date": now,
+                "validated_date": now,
+                "processed_by_id": current_user.id,
+                "validated_by_id": current_user.id
+            }
+            for calc in calculations
+        ]
+        
+        # Remplace l'éventuel bulletin existant (clé unique employee_id + period)
+        counts = crud_payroll.upsert_payroll_records(db, records)
         
-        db.commit()
-        return {"message": f"Paie validée pour {len(calculations)} employé(s)"}
+        return {
+            "message": f"Paie validée pour {len(calculations)} employé(s)",
+            "inserted": counts["inserted"],
+            "updated": counts["updated"]
+        }
         
+    except crud_payroll.PayrollPeriodClosedError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
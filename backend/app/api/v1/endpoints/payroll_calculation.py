@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime, date
 import asyncio
 
 from app.db.database import get_db
-from app.db.models import PayrollVariable, EmployeePayrollData
+from app.db.models import PayrollVariable, EmployeePayrollData, PayrollCalculationJob, PayrollRetroAdjustment
 from app.schemas.payroll_calculation import (
     PayrollCalculationRequest,
     PayrollCalculationResult,
@@ -14,85 +14,50 @@ from app.schemas.payroll_calculation import (
 )
 from app.core.auth import get_current_user
 from app.services.payroll_calculator import PayrollCalculator as RealPayrollCalculator
+from app.services.payroll_vectorized import VectorizedPayrollCalculator, PayrollBatchInputs
+from app.services.payroll_executor import payroll_executor
+from app.services.payroll_jobs import payroll_job_worker, job_status
+from app.services.payroll_retro import payroll_retro, RETRO_FIELDS
+from app.crud import crud_payroll
 
 router = APIRouter()
 
-@router.post("/calculate", response_model=PayrollCalculationStatus)
+@router.post("/calculate", response_model=PayrollCalculationStatus, status_code=status.HTTP_202_ACCEPTED)
 async def start_payroll_calculation(
     request: PayrollCalculationRequest,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Lance le calcul de paie avec le vrai moteur"""
+    """Soumet un calcul de paie, exécuté en arrière-plan (suivi via /status)"""
     
-    calculator = RealPayrollCalculator()
-    
-    # Données d'employés avec informations complètes
-    mock_employees = [
-        {
-            "employee_id": 1,
-            "employee_name": "Jean Dupont",
-            "base_salary": 800000,  # 800k FCFA
-            "overtime_hours": 10,
-            "absence_hours": 0,
-            "period": request.period
-        },
-        {
-            "employee_id": 2,
-            "employee_name": "Marie Martin",
-            "base_salary": 1200000,  # 1.2M FCFA
-            "overtime_hours": 5,
-            "absence_hours": 8,
-            "period": request.period
-        },
-        {
-            "employee_id": 3,
-            "employee_name": "Pierre Durand",
-            "base_salary": 2500000,  # 2.5M FCFA
-            "overtime_hours": 0,
-            "absence_hours": 0,
-            "period": request.period
-        }
-    ]
-    
-    # Filtrage des employés si spécifié
-    employees_to_process = [
-        emp for emp in mock_employees 
-        if not request.employee_ids or emp["employee_id"] in request.employee_ids
-    ]
-    
-    # Calcul batch
-    results = calculator.calculate_batch_payroll(employees_to_process)
-    
-    return PayrollCalculationStatus(
-        calculation_id=f"calc_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-        status="completed",
-        total_employees=results["employees_count"],
-        completed_employees=results["employees_count"],
-        failed_employees=0,
-        calculations=results["calculations"],
-        started_at=datetime.now(),
-        completed_at=datetime.now()
+    job = payroll_job_worker.submit(
+        db,
+        current_user.company_id,
+        request.period,
+        employee_ids=request.employee_ids,
+        requested_by_id=current_user.id
     )
+    
+    return job_status(job)
 
 @router.get("/status/{calculation_id}", response_model=PayrollCalculationStatus)
 async def get_calculation_status(
     calculation_id: str,
+    include_results: bool = False,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Récupère le statut d'un calcul de paie"""
-    
-    return PayrollCalculationStatus(
-        calculation_id=calculation_id,
-        status="completed",
-        total_employees=3,
-        completed_employees=3,
-        failed_employees=0,
-        calculations=[],
-        started_at=datetime.now(),
-        completed_at=datetime.now()
-    )
+    """Récupère le statut d'un calcul de paie (et ses résultats si demandé)"""
+    
+    job = db.query(PayrollCalculationJob).filter(
+        PayrollCalculationJob.calculation_id == calculation_id,
+        PayrollCalculationJob.company_id == current_user.company_id
+    ).first()
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Calcul non trouvé")
+    
+    return job_status(job, include_results=include_results)
 
 @router.get("/history", response_model=List[PayrollCalculationStatus])
 async def get_calculation_history(
@@ -102,7 +67,11 @@ async def get_calculation_history(
 ):
     """Récupère l'historique des calculs de paie"""
     
-    return []
+    jobs = db.query(PayrollCalculationJob).filter(
+        PayrollCalculationJob.company_id == current_user.company_id
+    ).order_by(PayrollCalculationJob.created_at.desc()).limit(limit).all()
+    
+    return [job_status(job) for job in jobs]
 
 @router.get("/irpp-breakdown/{taxable_income}", response_model=List[Dict[str, Any]])
 async def get_irpp_breakdown(
@@ -120,16 +89,121 @@ async def get_irpp_breakdown(
 @router.post("/batch-calculate", response_model=Dict[str, Any])
 async def batch_calculate_payroll(
     employees_data: List[Dict[str, Any]],
+    vectorized: bool = False,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     """Calcule la paie pour plusieurs employés"""
     
+    if vectorized:
+        calculator = VectorizedPayrollCalculator()
+        return calculator.calculate_batch_payroll(PayrollBatchInputs.from_employees_data(employees_data))
+    
     calculator = RealPayrollCalculator()
     results = calculator.calculate_batch_payroll(employees_data)
     
     return results
 
+@router.post("/company-calculate/{period}", response_model=Dict[str, Any])
+async def calculate_company_payroll(
+    period: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Calcule en mode vectorisé la paie de tous les employés actifs de l'entreprise (hors boucle d'événements)"""
+    
+    calculator = VectorizedPayrollCalculator()
+    return await asyncio.to_thread(calculator.calculate_company_payroll, db, current_user.company_id, period)
+
+@router.post("/company-run/{period}", response_model=Dict[str, Any])
+async def run_company_payroll(
+    period: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Calcule la paie de toute l'entreprise sur le pool de processus (hors boucle d'événements)"""
+    
+    return await asyncio.to_thread(payroll_executor.run_company, db, current_user.company_id, period)
+
+@router.post("/retro/{target_period}", response_model=Dict[str, Any])
+async def run_retro_recalculation(
+    target_period: str,
+    payload: Dict[str, Any],
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Recalcule rétroactivement des périodes passées et reporte les écarts (rappels) sur target_period"""
+    
+    periods = payload.get("periods") or []
+    if not periods:
+        raise HTTPException(status_code=400, detail="Aucune période à recalculer")
+    if target_period in periods:
+        raise HTTPException(status_code=400, detail="La période de régularisation ne peut pas être recalculée")
+    if crud_payroll.is_period_closed(db, current_user.company_id, target_period):
+        raise HTTPException(status_code=409, detail=f"La période {target_period} est clôturée")
+    
+    return await asyncio.to_thread(
+        payroll_retro.run,
+        db,
+        current_user.company_id,
+        periods,
+        target_period,
+        payload.get("employee_ids"),
+        current_user.id,
+        bool(payload.get("dry_run", False))
+    )
+
+@router.post("/retro/{target_period}/apply", response_model=Dict[str, Any])
+async def apply_retro_adjustments(
+    target_period: str,
+    payload: Optional[Dict[str, Any]] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Verse les rappels en attente sur les bulletins de target_period (à lancer une fois sa paie calculée)"""
+    
+    if crud_payroll.is_period_closed(db, current_user.company_id, target_period):
+        raise HTTPException(status_code=409, detail=f"La période {target_period} est clôturée")
+    
+    try:
+        return await asyncio.to_thread(
+            payroll_retro.apply,
+            db,
+            current_user.company_id,
+            target_period,
+            (payload or {}).get("employee_ids")
+        )
+    except crud_payroll.PayrollPeriodClosedError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/retro/{target_period}", response_model=List[Dict[str, Any]])
+async def get_retro_adjustments(
+    target_period: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Rappels à verser sur une période"""
+    
+    adjustments = db.query(PayrollRetroAdjustment).filter(
+        PayrollRetroAdjustment.company_id == current_user.company_id,
+        PayrollRetroAdjustment.target_period == target_period
+    ).order_by(PayrollRetroAdjustment.employee_id, PayrollRetroAdjustment.source_period).all()
+    
+    return [
+        {
+            "id": adjustment.id,
+            "employee_id": adjustment.employee_id,
+            "source_period": adjustment.source_period,
+            "target_period": adjustment.target_period,
+            **{field: getattr(adjustment, field) for field in RETRO_FIELDS},
+            "status": adjustment.status,
+            "applied_at": adjustment.applied_at,
+            "created_at": adjustment.created_at
+        }
+        for adjustment in adjustments
+    ]
+
 @router.post("/validate", response_model=Dict[str, Any])
 async def validate_payroll_data(
     period: str,
@@ -1,5 +1,6 @@
 from typing import List, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
 import json
 import os
@@ -9,6 +10,9 @@ from app.api import deps
 from app.db import models
 from app.schemas import payroll_config as payroll_schema
 from app.core.auth import get_current_user
+from app.core.payroll_graph import check_for_cycles, PayrollDependencyError
+from app.core.payroll_formula import compile_formula, FormulaError
+from app.core.payroll_cache import payroll_engine_cache, json_file_cache
 
 router = APIRouter()
 
@@ -16,8 +20,7 @@ def load_payroll_templates() -> Dict[str, Any]:
     """Charger les templates de paie depuis le fichier JSON"""
     try:
         template_path = os.path.join(os.path.dirname(__file__), "../../../data/payroll_templates.json")
-        with open(template_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return json_file_cache.load(template_path)
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail="Fichier templates de paie non trouvé")
     except json.JSONDecodeError:
@@ -27,13 +30,51 @@ def load_tax_rates() -> Dict[str, Any]:
     """Charger les barèmes fiscaux depuis le fichier JSON"""
     try:
         tax_path = os.path.join(os.path.dirname(__file__), "../../../data/tax_rates.json")
-        with open(tax_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return json_file_cache.load(tax_path)
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail="Fichier barèmes fiscaux non trouvé")
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="Erreur format fichier barèmes")
 
+def check_variable_formulas(candidates: List[models.PayrollVariable]):
+    """Refuser l'enregistrement de formules invalides (syntaxe, opérateurs, exposants)"""
+    for variable in candidates:
+        if variable.calculation_method != "formula" or not variable.formula:
+            continue
+        # Une variable existante dont ni la formule ni la méthode ne changent n'est pas revérifiée
+        state = inspect(variable)
+        if state.persistent and not (
+            state.attrs.formula.history.has_changes()
+            or state.attrs.calculation_method.history.has_changes()
+        ):
+            continue
+        try:
+            compile_formula(variable.formula)
+        except FormulaError as e:
+            raise HTTPException(status_code=400, detail=f"Formule invalide pour {variable.code}: {e}")
+
+def check_variable_dependencies(db: Session, company_id: int, candidates: List[models.PayrollVariable]):
+    """Refuser l'enregistrement de variables aux formules invalides ou formant un cycle"""
+    check_variable_formulas(candidates)
+    
+    candidate_ids = {v.id for v in candidates if v.id is not None}
+    candidate_codes = {v.code for v in candidates}
+    
+    # Seules les variables actives entrent dans le graphe du moteur de calcul
+    existing = db.query(models.PayrollVariable).filter(
+        models.PayrollVariable.company_id == company_id,
+        models.PayrollVariable.is_active == True
+    ).all()
+    variables = [
+        v for v in existing
+        if v.id not in candidate_ids and v.code not in candidate_codes
+    ] + [v for v in candidates if v.is_active is not False]
+    
+    try:
+        check_for_cycles(variables)
+    except PayrollDependencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/templates")
 async def get_payroll_templates():
     """Récupérer tous les templates de paie disponibles"""
@@ -119,6 +160,7 @@ async def initialize_payroll_config(
         
         db.add(db_config)
         db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
         db.refresh(db_config)
         
         return {
@@ -162,24 +204,9 @@ async def setup_company_payroll(
         
         company_type = setup_data.get("company_type", "PME")
         
-        # Créer la configuration
-        db_config = models.PayrollConfig(
-            company_id=current_user.company_id,
-            company_type=company_type,
-            country_code=setup_data.get("country_code", "BJ"),
-            currency_code=setup_data.get("currency_code", "XOF"),
-            payroll_variables={"variables": []},
-            tax_rates=setup_data.get("tax_rates", {}),
-            formulas=setup_data.get("formulas", {}),
-            is_active=True
-        )
-        
-        db.add(db_config)
-        db.commit()
-        db.refresh(db_config)
-        
-        # Créer les variables si fournies
+        # Préparer les variables si fournies (refusées avant toute écriture en cas de cycle)
         variables = setup_data.get("variables", [])
+        pending_variables = []
         created_variables = []
         
         for var_data in variables:
@@ -197,10 +224,33 @@ async def setup_company_payroll(
                 description=var_data.get("description"),
                 display_order=var_data.get("display_order", 0)
             )
+            pending_variables.append(db_variable)
+        
+        check_variable_dependencies(db, current_user.company_id, pending_variables)
+        
+        # Créer la configuration
+        db_config = models.PayrollConfig(
+            company_id=current_user.company_id,
+            company_type=company_type,
+            country_code=setup_data.get("country_code", "BJ"),
+            currency_code=setup_data.get("currency_code", "XOF"),
+            payroll_variables={"variables": []},
+            tax_rates=setup_data.get("tax_rates", {}),
+            formulas=setup_data.get("formulas", {}),
+            is_active=True
+        )
+        
+        db.add(db_config)
+        db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
+        db.refresh(db_config)
+        
+        for db_variable in pending_variables:
             db.add(db_variable)
-            created_variables.append(var_data.get("code"))
+            created_variables.append(db_variable.code)
         
         db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
         
         return {
             "config": {
@@ -386,8 +436,11 @@ async def create_payroll_variable(
             display_order=variable_data.get("display_order", 0)
         )
         
+        check_variable_dependencies(db, current_user.company_id, [db_variable])
+        
         db.add(db_variable)
         db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
         db.refresh(db_variable)
         
         return {
@@ -442,7 +495,14 @@ async def update_payroll_variable(
             if hasattr(db_variable, key) and value is not None:
                 setattr(db_variable, key, value)
         
+        try:
+            check_variable_dependencies(db, current_user.company_id, [db_variable])
+        except HTTPException:
+            db.rollback()
+            raise
+        
         db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
         db.refresh(db_variable)
         
         return {
@@ -497,6 +557,7 @@ async def delete_payroll_variable(
         
         db.delete(db_variable)
         db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
         
         return {
             "message": "Variable supprimée avec succès",
@@ -530,7 +591,14 @@ async def toggle_payroll_variable(
             raise HTTPException(status_code=400, detail="Impossible de désactiver une variable obligatoire")
         
         db_variable.is_active = not db_variable.is_active
+        if db_variable.is_active:
+            try:
+                check_variable_dependencies(db, current_user.company_id, [db_variable])
+            except HTTPException:
+                db.rollback()
+                raise
         db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
         
         return {
             "message": f"Variable {'activée' if db_variable.is_active else 'désactivée'}", 
@@ -583,6 +651,7 @@ async def create_bulk_variables(
         Base.metadata.create_all(bind=engine)
         
         variables = variables_data.get("variables", [])
+        pending_variables = []
         created_variables = []
         errors = []
         
@@ -613,14 +682,20 @@ async def create_bulk_variables(
                     display_order=var_data.get("display_order", 0)
                 )
                 
-                db.add(db_variable)
-                created_variables.append(var_data.get("code"))
+                pending_variables.append(db_variable)
                 
             except Exception as e:
                 errors.append(f"Erreur pour {var_data.get('code', 'variable')}: {str(e)}")
         
+        check_variable_dependencies(db, current_user.company_id, pending_variables)
+        
+        for db_variable in pending_variables:
+            db.add(db_variable)
+            created_variables.append(db_variable.code)
+        
         if created_variables:
             db.commit()
+            payroll_engine_cache.invalidate(current_user.company_id)
         
         return {
             "created_count": len(created_variables),
@@ -629,6 +704,8 @@ async def create_bulk_variables(
             "message": f"{len(created_variables)} variables créées avec succès"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur création en lot: {str(e)}")
@@ -657,6 +734,7 @@ async def reorder_variables(
                 db_variable.display_order = new_order
         
         db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
         
         return {"message": "Ordre des variables mis à jour avec succès"}
         
@@ -709,8 +787,7 @@ async def get_variable_templates():
                 "code": "IRPP",
                 "name": "Impôt sur le revenu",
                 "variable_type": "IMPOT",
-                "calculation_method": "formula",
-                "formula": "calculate_irpp(taxable_income)",
+                "calculation_method": "progressive",
                 "description": "Impôt progressif sur le revenu",
                 "display_order": 6
             },
@@ -753,6 +830,7 @@ async def create_variables_from_template(
         templates_response = await get_variable_templates()
         templates = templates_response["templates"]
         
+        pending_variables = []
         created_variables = []
         errors = []
         
@@ -782,12 +860,17 @@ async def create_variables_from_template(
                     description=template["description"],
                     display_order=template["display_order"]
                 )
-                
-                db.add(db_variable)
-                created_variables.append(template["code"])
+                pending_variables.append(db_variable)
+        
+        check_variable_dependencies(db, current_user.company_id, pending_variables)
+        
+        for db_variable in pending_variables:
+            db.add(db_variable)
+            created_variables.append(db_variable.code)
         
         if created_variables:
             db.commit()
+            payroll_engine_cache.invalidate(current_user.company_id)
         
         return {
             "created_count": len(created_variables),
@@ -796,6 +879,8 @@ async def create_variables_from_template(
             "message": f"{len(created_variables)} variables créées à partir du template"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur création depuis template: {str(e)}")
@@ -877,6 +962,7 @@ async def quick_setup_payroll(
         
         db.add(db_config)
         db.commit()
+        payroll_engine_cache.invalidate(current_user.company_id)
         db.refresh(db_config)
         
         # Créer les variables par défaut selon le type d'entreprise
@@ -955,6 +1041,16 @@ async def get_payroll_status(
             "setup_complete": False
         }
 
+@router.get("/engine-cache")
+async def get_engine_cache_stats(
+    current_user: models.User = Depends(get_current_user)
+):
+    """Compteurs du cache du moteur de paie et des fichiers de référence"""
+    return {
+        "engine": payroll_engine_cache.stats(),
+        "reference_files": json_file_cache.stats()
+    }
+
 @router.get("/debug")
 async def debug_payroll_config():
     """Debug endpoint pour diagnostiquer les problèmes de configuration"""
@@ -6,6 +6,8 @@ from datetime import datetime
 from app.db.database import get_db
 from app.db import models
 from app.core.auth import get_current_user
+from app.api.deps import get_current_active_hr_admin
+from app.crud import crud_payroll
 
 router = APIRouter()
 
@@ -17,53 +19,47 @@ async def create_payroll_records_bulk(
 ):
     """Créer plusieurs enregistrements de paie en lot"""
     try:
-        created_records = []
-        
-        for record_data in records:
-            # Vérifier que l'employé appartient à l'entreprise
-            employee = db.query(models.Employee).filter(
-                models.Employee.id == record_data["employee_id"],
+        # Ne garder que les employés de l'entreprise (une seule requête)
+        employee_ids = {record_data["employee_id"] for record_data in records}
+        company_employee_ids = {
+            employee_id for (employee_id,) in db.query(models.Employee.id).filter(
+                models.Employee.id.in_(employee_ids),
                 models.Employee.company_id == current_user.company_id
-            ).first()
-            
-            if not employee:
-                continue
-            
-            # Supprimer l'ancien enregistrement pour la même période
-            existing_record = db.query(models.PayrollRecord).filter(
-                models.PayrollRecord.employee_id == record_data["employee_id"],
-                models.PayrollRecord.period == record_data["period"]
-            ).first()
-            
-            if existing_record:
-                db.delete(existing_record)
-            
-            # Créer le nouvel enregistrement
-            payroll_record = models.PayrollRecord(
-                employee_id=record_data["employee_id"],
-                period=record_data["period"],
-                gross_salary=record_data["gross_salary"],
-                total_allowances=record_data["total_allowances"],
-                total_deductions=record_data["total_deductions"],
-                taxable_income=record_data["taxable_income"],
-                tax_amount=record_data["tax_amount"],
-                social_contributions=record_data["social_contributions"],
-                net_salary=record_data["net_salary"],
-                salary_breakdown=record_data["salary_breakdown"],
-                status=record_data.get("status", "draft"),
-                processed_by_id=current_user.id
-            )
-            
-            db.add(payroll_record)
-            created_records.append(payroll_record)
+            ).all()
+        }
+        
+        payroll_records = [
+            {
+                "employee_id": record_data["employee_id"],
+                "period": record_data["period"],
+                "gross_salary": record_data["gross_salary"],
+                "total_allowances": record_data["total_allowances"],
+                "total_deductions": record_data["total_deductions"],
+                "taxable_income": record_data["taxable_income"],
+                "tax_amount": record_data["tax_amount"],
+                "social_contributions": record_data["social_contributions"],
+                "net_salary": record_data["net_salary"],
+                "salary_breakdown": record_data["salary_breakdown"],
+                "status": record_data.get("status", "draft"),
+                "processed_by_id": current_user.id
+            }
+            for record_data in records
+            if record_data["employee_id"] in company_employee_ids
+        ]
         
-        db.commit()
+        # Remplace l'ancien enregistrement de la même période (clé unique employee_id + period)
+        counts = crud_payroll.upsert_payroll_records(db, payroll_records)
         
         return {
-            "message": f"{len(created_records)} enregistrements de paie créés",
-            "records_count": len(created_records)
+            "message": f"{len(payroll_records)} enregistrements de paie créés",
+            "records_count": len(payroll_records),
+            "inserted": counts["inserted"],
+            "updated": counts["updated"]
         }
         
+    except crud_payroll.PayrollPeriodClosedError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -119,43 +115,81 @@ async def get_payroll_stats(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    """Statistiques de paie pour le dashboard"""
+    """Statistiques de paie pour le dashboard (cube pré-agrégé pour une période clôturée)"""
     try:
-        query = db.query(models.PayrollRecord).join(models.Employee).filter(
-            models.Employee.company_id == current_user.company_id
-        )
+        # Période courante par défaut
+        period = period or datetime.now().strftime("%Y-%m")
         
-        if period:
-            query = query.filter(models.PayrollRecord.period == period)
-        else:
-            # Période courante par défaut
-            current_period = datetime.now().strftime("%Y-%m")
-            query = query.filter(models.PayrollRecord.period == current_period)
-        
-        records = query.all()
-        
-        if not records:
-            return {
-                "total_payroll": 0,
-                "employee_count": 0,
-                "average_salary": 0,
-                "processed_count": 0,
-                "pending_count": 0
+        # Le cube n'est rafraîchi qu'à la validation et à la clôture : une période ouverte est lue en direct
+        if crud_payroll.is_period_closed(db, current_user.company_id, period):
+            cube = crud_payroll.get_cost_cube(db, current_user.company_id, period)
+            stats = {
+                field: sum(getattr(row, field) for row in cube)
+                for field in ("headcount", "validated_count", "draft_count", "net_salary")
             }
+        else:
+            stats = crud_payroll.get_period_stats(db, current_user.company_id, period)
         
-        total_payroll = sum(r.net_salary for r in records)
-        employee_count = len(records)
+        total_payroll = stats["net_salary"]
+        employee_count = stats["headcount"]
         average_salary = total_payroll / employee_count if employee_count > 0 else 0
-        processed_count = len([r for r in records if r.status in ["validated", "paid"]])
-        pending_count = len([r for r in records if r.status == "draft"])
         
         return {
             "total_payroll": round(total_payroll),
             "employee_count": employee_count,
             "average_salary": round(average_salary),
-            "processed_count": processed_count,
-            "pending_count": pending_count
+            "processed_count": stats["validated_count"],
+            "pending_count": stats["draft_count"]
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/breakdown-totals/{period}")
+async def get_payroll_breakdown_totals(
+    period: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Totaux par variable de paie d'une période (agrégés en base)"""
+    try:
+        totals = crud_payroll.get_breakdown_totals(db, current_user.company_id, period)
+        return {"period": period, "variables": totals}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/periods")
+async def get_payroll_periods(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Périodes de paie de l'entreprise et leur statut de clôture"""
+    return {"periods": crud_payroll.get_payroll_periods(db, current_user.company_id)}
+
+@router.post("/periods/{period}/close")
+async def close_payroll_period(
+    period: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_hr_admin)
+):
+    """Clôturer une période : ses bulletins ne peuvent plus être modifiés"""
+    unvalidated = crud_payroll.count_unvalidated_records(db, current_user.company_id, period)
+    if unvalidated:
+        raise HTTPException(
+            status_code=409,
+            detail=f"{unvalidated} bulletin(s) non validé(s) pour la période {period}"
+        )
+    
+    closure = crud_payroll.set_payroll_period_status(db, current_user.company_id, period, "closed", current_user.id)
+    return {"period": closure.period, "status": closure.status, "closed_at": closure.closed_at.isoformat()}
+
+@router.post("/periods/{period}/reopen")
+async def reopen_payroll_period(
+    period: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_hr_admin)
+):
+    """Rouvrir une période clôturée"""
+    closure = crud_payroll.set_payroll_period_status(db, current_user.company_id, period, "open")
+    return {"period": closure.period, "status": closure.status, "closed_at": None}
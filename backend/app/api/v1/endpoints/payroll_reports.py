@@ -1,15 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 from datetime import datetime
 import io
+import os
 import base64
+import asyncio
 
-from ....db.database import get_db
+from ....db.database import get_db, SessionLocal
 from ....db.models import Employee, PayrollRecord, Company
-from ....services.pdf_generator import PayslipPDFGenerator as PayslipGenerator
+from ....services.pdf_generator import PayslipPDFGenerator as PayslipGenerator, PAYSLIP_RENDERERS
+from ....services.payslip_bulk import payslip_bulk_renderer, iter_period_payslips, payslip_filename
+from ....services.payslip_cache import serve_payslip_pdf
+from ....services.payroll_print_run import PayrollPrintRun
+from ....services.email_outbox import enqueue_payslip_email, email_outbox_dispatcher
 from ....core.auth import get_current_user
+from ....core.config import settings
+from ....crud import crud_payroll
 
 router = APIRouter()
 
@@ -17,114 +25,190 @@ router = APIRouter()
 async def generate_payslip(
     employee_id: int,
     period: str,
+    request: Request,
+    renderer: str = "platypus",
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Génère le bulletin de paie PDF d'un employé"""
-    try:
-        # Récupérer l'employé
-        employee = db.query(Employee).filter(
-            Employee.id == employee_id,
-            Employee.company_id == current_user.company_id
-        ).first()
-        
-        if not employee:
-            raise HTTPException(status_code=404, detail="Employé non trouvé")
-        
-        # Récupérer l'enregistrement de paie
-        payroll_record = db.query(PayrollRecord).filter(
-            PayrollRecord.employee_id == employee_id,
-            PayrollRecord.period == period
-        ).first()
-        
-        if not payroll_record:
-            raise HTTPException(status_code=404, detail="Enregistrement de paie non trouvé")
-        
-        # Récupérer les infos entreprise
-        company = db.query(Company).filter(Company.id == current_user.company_id).first()
-        company_info = {
-            'name': company.name if company else 'Entreprise',
-            'address': 'Adresse entreprise'
-        }
-        
-        # Préparer les données
-        employee_data = {
-            'id': employee.id,
-            'name': employee.name,
-            'role': employee.role,
-            'department': employee.department.name if employee.department else '',
-            'marital_status': employee.marital_status
-        }
+    """Génère le bulletin de paie PDF d'un employé (cache disque, ETag / If-None-Match)"""
+    if renderer not in PAYSLIP_RENDERERS:
+        raise HTTPException(status_code=400, detail="renderer doit valoir 'canvas' ou 'platypus'")
+    
+    # Récupérer l'employé
+    employee = db.query(Employee).filter(
+        Employee.id == employee_id,
+        Employee.company_id == current_user.company_id
+    ).first()
+    
+    if not employee:
+        raise HTTPException(status_code=404, detail="Employé non trouvé")
+    
+    # Récupérer l'enregistrement de paie
+    payroll_record = db.query(PayrollRecord.id, PayrollRecord.status).filter(
+        PayrollRecord.employee_id == employee_id,
+        PayrollRecord.period == period
+    ).first()
+    
+    if not payroll_record:
+        raise HTTPException(status_code=404, detail="Enregistrement de paie non trouvé")
+    
+    # Données du bulletin (détail et cumuls annuels), comme pour la génération en masse
+    payslip_data = next(iter_period_payslips(db, current_user.company_id, period, employee_ids=[employee_id]))
+    
+    def render() -> bytes:
+        return PayslipGenerator().generate_payslip_pdf(payslip_data, renderer).getvalue()
+    
+    # Seuls les bulletins validés ou payés, qui ne changent plus, sont conservés sur disque
+    return await asyncio.to_thread(
+        serve_payslip_pdf,
+        request,
+        payroll_record.id,
+        payslip_data,
+        render,
+        payslip_filename(employee_id, employee.name, period),
+        renderer,
+        payroll_record.status in crud_payroll.YTD_STATUSES
+    )
+
+@router.get("/payslips/{period}/bulk")
+async def generate_payslips_bulk(
+    period: str,
+    output: str = "zip",
+    include_drafts: bool = False,
+    renderer: str = "canvas",
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Bulletins PDF de toute une période, rendus en parallèle
+
+    output=zip : archive envoyée au fil des bulletins terminés ;
+    output=directory : fichiers écrits dans PAYSLIP_OUTPUT_DIR/<entreprise>/<période>.
+    renderer=canvas (gabarit précalculé) ou platypus (mise en page historique).
+    """
+    if output not in ("zip", "directory"):
+        raise HTTPException(status_code=400, detail="output doit valoir 'zip' ou 'directory'")
+    if renderer not in PAYSLIP_RENDERERS:
+        raise HTTPException(status_code=400, detail="renderer doit valoir 'canvas' ou 'platypus'")
+    
+    statuses = None if include_drafts else crud_payroll.YTD_STATUSES
+    exists = db.query(PayrollRecord.id).join(Employee).filter(
+        Employee.company_id == current_user.company_id,
+        PayrollRecord.period == period,
+        *([PayrollRecord.status.in_(statuses)] if statuses else [])
+    ).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Aucun bulletin pour cette période")
+    
+    company_id = current_user.company_id
+    
+    if output == "directory":
+        output_dir = os.path.join(settings.PAYSLIP_OUTPUT_DIR, str(company_id), period)
         
-        payroll_data = {
-            'gross_salary': payroll_record.gross_salary,
-            'taxable_income': payroll_record.taxable_income,
-            'tax_amount': payroll_record.tax_amount,
-            'net_salary': payroll_record.net_salary,
-            'total_cost': payroll_record.gross_salary + (payroll_record.salary_breakdown or {}).get('cnss_employer', 0),
-            'breakdown': payroll_record.salary_breakdown or {}
-        }
+        def write():
+            session = SessionLocal()
+            try:
+                payslips = iter_period_payslips(session, company_id, period, statuses=statuses)
+                return payslip_bulk_renderer.write_directory(payslips, output_dir, renderer)
+            finally:
+                session.close()
         
-        # Générer le PDF
-        generator = PayslipGenerator(company_info)
-        pdf_content = generator.generate_payslip(employee_data, payroll_data, period)
+        return await asyncio.to_thread(write)
+    
+    def archive():
+        # Session dédiée : la lecture continue pendant l'envoi de la réponse
+        session = SessionLocal()
+        try:
+            yield from payslip_bulk_renderer.stream_zip(
+                iter_period_payslips(session, company_id, period, statuses=statuses), renderer
+            )
+        finally:
+            session.close()
+    
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=bulletins_{period}.zip"}
+    )
+
+async def _print_run_response(
+    db: Session,
+    current_user,
+    period: str,
+    print_run: PayrollPrintRun,
+    output: str,
+    statuses,
+    filename: str
+):
+    """Tirage envoyé en flux (output=stream) ou écrit dans PAYSLIP_OUTPUT_DIR (output=file)"""
+    if output not in ("stream", "file"):
+        raise HTTPException(status_code=400, detail="output doit valoir 'stream' ou 'file'")
+    
+    exists = db.query(PayrollRecord.id).join(Employee).filter(
+        Employee.company_id == current_user.company_id,
+        PayrollRecord.period == period,
+        *([PayrollRecord.status.in_(statuses)] if statuses else [])
+    ).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Aucun enregistrement trouvé")
+    
+    company_id = current_user.company_id
+    company = db.query(Company).filter(Company.id == company_id).first()
+    company_name = company.name if company else 'Entreprise'
+    
+    if output == "file":
+        output_dir = os.path.join(settings.PAYSLIP_OUTPUT_DIR, str(company_id), period)
+        path = os.path.join(output_dir, filename)
         
-        return StreamingResponse(
-            io.BytesIO(pdf_content),
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=bulletin_{employee.name}_{period}.pdf"}
-        )
+        def write():
+            os.makedirs(output_dir, exist_ok=True)
+            session = SessionLocal()
+            try:
+                size = print_run.write_file(session, company_id, company_name, period, path, statuses)
+            finally:
+                session.close()
+            return {"file": os.path.abspath(path), "size": size}
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return await asyncio.to_thread(write)
+    
+    def pdf_chunks():
+        # Session dédiée : la lecture continue pendant l'envoi de la réponse
+        session = SessionLocal()
+        try:
+            yield from print_run.iter_pdf(session, company_id, company_name, period, statuses)
+        finally:
+            session.close()
+    
+    return StreamingResponse(
+        pdf_chunks(),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.get("/print-run/{period}")
+async def generate_print_run(
+    period: str,
+    output: str = "stream",
+    include_drafts: bool = False,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Tirage de la période : tous les bulletins puis le journal, dans un seul PDF écrit au fil des pages"""
+    statuses = None if include_drafts else crud_payroll.YTD_STATUSES
+    return await _print_run_response(
+        db, current_user, period, PayrollPrintRun(), output, statuses, f"tirage_paie_{period}.pdf"
+    )
 
 @router.get("/journal/{period}")
 async def generate_payroll_journal(
     period: str,
+    output: str = "stream",
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Génère le journal de paie PDF"""
-    try:
-        # Récupérer tous les enregistrements de paie de la période
-        payroll_records = db.query(PayrollRecord).join(Employee).filter(
-            Employee.company_id == current_user.company_id,
-            PayrollRecord.period == period
-        ).all()
-        
-        if not payroll_records:
-            raise HTTPException(status_code=404, detail="Aucun enregistrement trouvé")
-        
-        # Préparer les données
-        records_data = []
-        for record in payroll_records:
-            records_data.append({
-                'employee_name': record.employee.name,
-                'gross_salary': record.gross_salary,
-                'tax_amount': record.tax_amount,
-                'net_salary': record.net_salary,
-                'salary_breakdown': record.salary_breakdown or {}
-            })
-        
-        # Récupérer les infos entreprise
-        company = db.query(Company).filter(Company.id == current_user.company_id).first()
-        company_info = {
-            'name': company.name if company else 'Entreprise',
-            'address': 'Adresse entreprise'
-        }
-        
-        # Générer le PDF
-        generator = PayslipGenerator(company_info)
-        pdf_content = generator.generate_payroll_journal(records_data, period)
-        
-        return StreamingResponse(
-            io.BytesIO(pdf_content),
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=journal_paie_{period}.pdf"}
-        )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """Génère le journal de paie PDF (écrit au fil des pages, mémoire constante)"""
+    return await _print_run_response(
+        db, current_user, period, PayrollPrintRun(include_payslips=False), output, None, f"journal_paie_{period}.pdf"
+    )
 
 @router.post("/send-payslips/{period}")
 async def send_payslips_by_email(
@@ -132,66 +216,38 @@ async def send_payslips_by_email(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Envoie les bulletins de paie par email"""
-    try:
-        # Récupérer tous les employés avec paie validée
-        payroll_records = db.query(PayrollRecord).join(Employee).filter(
-            Employee.company_id == current_user.company_id,
-            PayrollRecord.period == period,
-            PayrollRecord.status == "validated"
-        ).all()
-        
-        sent_count = 0
-        errors = []
-        
-        for record in payroll_records:
-            try:
-                # Générer le bulletin
-                employee_data = {
-                    'id': record.employee.id,
-                    'name': record.employee.name,
-                    'role': record.employee.role,
-                    'department': record.employee.department.name if record.employee.department else '',
-                    'marital_status': record.employee.marital_status
-                }
-                
-                company = db.query(Company).filter(Company.id == current_user.company_id).first()
-                company_info = {'name': company.name if company else 'Entreprise', 'address': ''}
-                
-                payroll_data = {
-                    'gross_salary': record.gross_salary,
-                    'taxable_income': record.taxable_income,
-                    'tax_amount': record.tax_amount,
-                    'net_salary': record.net_salary,
-                    'total_cost': record.gross_salary + (record.salary_breakdown or {}).get('cnss_employer', 0),
-                    'breakdown': record.salary_breakdown or {}
-                }
-                
-                generator = PayslipGenerator(company_info)
-                pdf_content = generator.generate_payslip(employee_data, payroll_data, period)
-                
-                # TODO: Intégrer service email
-                # await send_email_with_attachment(
-                #     to=record.employee.email,
-                #     subject=f"Bulletin de paie {period}",
-                #     body="Veuillez trouver ci-joint votre bulletin de paie.",
-                #     attachment=pdf_content,
-                #     filename=f"bulletin_{record.employee.name}_{period}.pdf"
-                # )
-                
-                sent_count += 1
-                
-            except Exception as e:
-                errors.append(f"{record.employee.name}: {str(e)}")
-        
-        return {
-            "message": f"Bulletins envoyés: {sent_count}",
-            "sent_count": sent_count,
-            "errors": errors
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """Met en file l'envoi des bulletins validés de la période (PDF joints par le dispatcher)"""
+    records = db.query(
+        PayrollRecord.id, Employee.name, Employee.email
+    ).join(Employee, Employee.id == PayrollRecord.employee_id).filter(
+        Employee.company_id == current_user.company_id,
+        PayrollRecord.period == period,
+        PayrollRecord.status == "validated"
+    ).all()
+    
+    company = db.query(Company).filter(Company.id == current_user.company_id).first()
+    company_name = company.name if company else 'Entreprise'
+    
+    queued_count = 0
+    errors = []
+    for record in records:
+        if not record.email:
+            errors.append(f"{record.name}: aucune adresse email")
+            continue
+        enqueue_payslip_email(
+            db, record.id, record.email, record.name, period, current_user.company_id, company_name
+        )
+        queued_count += 1
+    
+    # Tous les envois enregistrés ensemble ; le dispatcher les envoie à son rythme
+    db.commit()
+    email_outbox_dispatcher.wake()
+    
+    return {
+        "message": f"Bulletins mis en file d'envoi: {queued_count}",
+        "sent_count": queued_count,
+        "errors": errors
+    }
 
 @router.get("/analytics/{period}")
 async def get_payroll_analytics(
@@ -199,34 +255,20 @@ async def get_payroll_analytics(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Analyse des coûts salariaux par département"""
+    """Analyse des coûts salariaux par département (cube pré-agrégé)"""
     try:
-        # Récupérer les données par département
-        from sqlalchemy import func
-        
-        results = db.query(
-            Employee.department_id,
-            func.count(PayrollRecord.id).label('employee_count'),
-            func.sum(PayrollRecord.gross_salary).label('total_gross'),
-            func.sum(PayrollRecord.net_salary).label('total_net'),
-            func.avg(PayrollRecord.net_salary).label('avg_salary')
-        ).join(PayrollRecord).filter(
-            Employee.company_id == current_user.company_id,
-            PayrollRecord.period == period
-        ).group_by(Employee.department_id).all()
-        
-        analytics = []
-        for result in results:
-            dept = db.query(Employee).filter(Employee.department_id == result.department_id).first()
-            dept_name = dept.department.name if dept and dept.department else 'Non assigné'
-            
-            analytics.append({
-                'department': dept_name,
-                'employee_count': result.employee_count,
-                'total_gross': float(result.total_gross or 0),
-                'total_net': float(result.total_net or 0),
-                'average_salary': float(result.avg_salary or 0)
-            })
+        analytics = [
+            {
+                'department': row.department_name,
+                'employee_count': row.headcount,
+                'total_gross': row.gross_salary,
+                'total_net': row.net_salary,
+                'average_salary': row.net_salary / row.headcount if row.headcount else 0,
+                'employer_charges': row.cnss_employer,
+                'total_irpp': row.irpp
+            }
+            for row in crud_payroll.get_cost_cube(db, current_user.company_id, period)
+        ]
         
         return {'analytics': analytics}
         
@@ -237,48 +279,46 @@ async def get_payroll_analytics(
 async def export_accounting_data(
     period: str,
     format: str = "csv",
-    db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Export des données comptables"""
-    try:
-        payroll_records = db.query(PayrollRecord).join(Employee).filter(
-            Employee.company_id == current_user.company_id,
-            PayrollRecord.period == period
-        ).all()
-        
-        if format == "csv":
-            import csv
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # En-têtes
-            writer.writerow([
-                'Employé', 'Salaire Brut', 'CNSS Employé', 'IRPP', 
-                'Net à Payer', 'CNSS Patronale', 'Coût Total'
-            ])
-            
-            # Données
-            for record in payroll_records:
-                breakdown = record.salary_breakdown or {}
-                writer.writerow([
-                    record.employee.name,
-                    record.gross_salary,
-                    breakdown.get('cnss_employee', 0),
-                    record.tax_amount,
-                    record.net_salary,
-                    breakdown.get('cnss_employer', 0),
-                    breakdown.get('cout_total', 0)
-                ])
-            
-            output.seek(0)
-            return StreamingResponse(
-                io.StringIO(output.getvalue()),
-                media_type="text/csv",
-                headers={"Content-Disposition": f"attachment; filename=export_paie_{period}.csv"}
-            )
-        
+    """Export des données comptables (CSV envoyé au fil de la lecture)"""
+    if format != "csv":
         return {"message": "Format non supporté"}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    
+    return StreamingResponse(
+        _accounting_csv(current_user.company_id, period),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=export_paie_{period}.csv"}
+    )
+
+# Taille visée d'un morceau envoyé au client
+CSV_CHUNK_SIZE = 64 * 1024
+
+def _accounting_csv(company_id: int, period: str):
+    """CSV comptable par morceaux ; session dédiée, fermée à la fin du flux"""
+    import csv
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    # En-têtes : envoyés immédiatement
+    writer.writerow([
+        'Employé', 'Salaire Brut', 'CNSS Employé', 'IRPP',
+        'Net à Payer', 'CNSS Patronale', 'Coût Total'
+    ])
+    yield output.getvalue()
+    output.seek(0)
+    output.truncate()
+    
+    db = SessionLocal()
+    try:
+        for row in crud_payroll.iter_accounting_rows(db, company_id, period):
+            writer.writerow(row)
+            if output.tell() >= CSV_CHUNK_SIZE:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+    finally:
+        db.close()
+    
+    if output.tell():
+        yield output.getvalue()
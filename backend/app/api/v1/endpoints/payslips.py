@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-import io
+import asyncio
 
 from app.db.database import get_db
-from app.db.models import PayrollVariable, EmployeePayrollData
+from app.db.models import PayrollVariable, EmployeePayrollData, PayrollRecord, Employee
 from app.schemas.payslips import (
     PayslipCreate,
     PayslipResponse,
@@ -167,82 +167,82 @@ async def send_payslip(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Envoie un bulletin de paie par email"""
-    
-    from app.services.pdf_generator import PayslipPDFGenerator
-    from app.services.payroll_calculator import PayrollCalculator
-    from app.services.email_service import EmailService
-    
-    # Récupération des données (simulation)
-    calculator = PayrollCalculator()
-    
-    employee_data = {
-        1: {"employee_id": 1, "employee_name": "Jean Dupont", "email": "jean.dupont@example.com", "base_salary": 800000, "overtime_hours": 10, "absence_hours": 0, "period": "2024-03"},
-        2: {"employee_id": 2, "employee_name": "Marie Martin", "email": "marie.martin@example.com", "base_salary": 1200000, "overtime_hours": 5, "absence_hours": 8, "period": "2024-03"},
-        3: {"employee_id": 3, "employee_name": "Pierre Durand", "email": "pierre.durand@example.com", "base_salary": 2500000, "overtime_hours": 0, "absence_hours": 0, "period": "2024-03"}
-    }.get(payslip_id, {"employee_id": payslip_id, "employee_name": "Employé Inconnu", "email": "test@example.com", "base_salary": 500000, "period": "2024-03"})
-    
-    # Calcul et génération PDF
-    payslip_data = calculator.calculate_employee_payroll(employee_data)
-    pdf_generator = PayslipPDFGenerator()
-    pdf_buffer = pdf_generator.generate_payslip_pdf(payslip_data)
-    
-    # Envoi par email
-    email_service = EmailService()
-    success = email_service.send_payslip_email(
-        to_email=employee_data["email"],
-        employee_name=employee_data["employee_name"],
-        period=employee_data["period"],
-        pdf_buffer=pdf_buffer
+    """Met en file l'envoi d'un bulletin de paie par email (PDF joint par le dispatcher)"""
+    
+    from app.db.models import Company
+    from app.services.email_outbox import enqueue_payslip_email, email_outbox_dispatcher
+    from app.crud.crud_payroll import YTD_STATUSES
+    
+    record = db.query(
+        PayrollRecord.id, PayrollRecord.period, PayrollRecord.status, Employee.name, Employee.email
+    ).join(Employee, Employee.id == PayrollRecord.employee_id).filter(
+        PayrollRecord.id == payslip_id,
+        Employee.company_id == current_user.company_id
+    ).first()
+    
+    if not record:
+        raise HTTPException(status_code=404, detail="Bulletin de paie non trouvé")
+    if record.status not in YTD_STATUSES:
+        raise HTTPException(status_code=400, detail="Seuls les bulletins validés peuvent être envoyés")
+    
+    company = db.query(Company).filter(Company.id == current_user.company_id).first()
+    message = enqueue_payslip_email(
+        db, record.id, record.email, record.name, record.period,
+        current_user.company_id, company.name if company else "Entreprise"
     )
+    db.commit()
+    email_outbox_dispatcher.wake()
     
-    if success:
-        return {
-            "message": "Bulletin de paie envoyé avec succès",
-            "payslip_id": payslip_id,
-            "sent_to": employee_data["email"],
-            "sent_at": datetime.now().isoformat()
-        }
-    else:
-        raise HTTPException(
-            status_code=500,
-            detail="Erreur lors de l'envoi du bulletin"
-        )
+    return {
+        "message": "Bulletin de paie mis en file d'envoi",
+        "payslip_id": payslip_id,
+        "sent_to": record.email,
+        "email_id": message.id
+    }
 
 @router.get("/{payslip_id}/download")
 async def download_payslip(
     payslip_id: int,
+    request: Request,
+    renderer: str = "platypus",
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Télécharge un bulletin de paie en PDF"""
-    
-    from app.services.pdf_generator import PayslipPDFGenerator
-    from app.services.payroll_calculator import PayrollCalculator
-    from fastapi.responses import StreamingResponse
-    
-    # Récupération des données du bulletin (simulation)
-    calculator = PayrollCalculator()
-    
-    # Données simulées selon l'ID
-    employee_data = {
-        1: {"employee_id": 1, "employee_name": "Jean Dupont", "base_salary": 800000, "overtime_hours": 10, "absence_hours": 0, "period": "2024-03"},
-        2: {"employee_id": 2, "employee_name": "Marie Martin", "base_salary": 1200000, "overtime_hours": 5, "absence_hours": 8, "period": "2024-03"},
-        3: {"employee_id": 3, "employee_name": "Pierre Durand", "base_salary": 2500000, "overtime_hours": 0, "absence_hours": 0, "period": "2024-03"}
-    }.get(payslip_id, {"employee_id": payslip_id, "employee_name": "Employé Inconnu", "base_salary": 500000, "period": "2024-03"})
-    
-    # Calcul de la paie
-    payslip_data = calculator.calculate_employee_payroll(employee_data)
-    
-    # Génération du PDF
-    pdf_generator = PayslipPDFGenerator()
-    pdf_buffer = pdf_generator.generate_payslip_pdf(payslip_data)
-    
-    # Retour du PDF
-    filename = f"bulletin_paie_{payslip_data['employee_name'].replace(' ', '_')}_{payslip_data['period']}.pdf"
-    
-    return StreamingResponse(
-        io.BytesIO(pdf_buffer.read()),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
\ No newline at end of file
+    """Télécharge un bulletin de paie en PDF (cache disque, ETag / If-None-Match)"""
+    
+    from app.services.pdf_generator import PayslipPDFGenerator, PAYSLIP_RENDERERS
+    from app.services.payslip_bulk import iter_period_payslips, payslip_filename
+    from app.services.payslip_cache import serve_payslip_pdf
+    from app.crud.crud_payroll import YTD_STATUSES
+    
+    if renderer not in PAYSLIP_RENDERERS:
+        raise HTTPException(status_code=400, detail="renderer doit valoir 'canvas' ou 'platypus'")
+    
+    # Bulletin enregistré de l'entreprise
+    record = db.query(
+        PayrollRecord.id, PayrollRecord.employee_id, PayrollRecord.period, PayrollRecord.status
+    ).join(Employee, Employee.id == PayrollRecord.employee_id).filter(
+        PayrollRecord.id == payslip_id,
+        Employee.company_id == current_user.company_id
+    ).first()
+    
+    if not record:
+        raise HTTPException(status_code=404, detail="Bulletin de paie non trouvé")
+    
+    payslip_data = next(iter_period_payslips(
+        db, current_user.company_id, record.period, employee_ids=[record.employee_id]
+    ))
+    
+    def render() -> bytes:
+        return PayslipPDFGenerator().generate_payslip_pdf(payslip_data, renderer).getvalue()
+    
+    return await asyncio.to_thread(
+        serve_payslip_pdf,
+        request,
+        record.id,
+        payslip_data,
+        render,
+        payslip_filename(record.employee_id, payslip_data["employee_name"], record.period),
+        renderer,
+        record.status in YTD_STATUSES
+    )
@@ -1,117 +1,144 @@
-from typing import List, Dict, Any
-from datetime import datetime, date
-from fastapi import APIRouter, Depends, HTTPException, Response
+from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 from app.api import deps
 from app.db import models
-from app.crud import crud_employee, crud_attendance, crud_payroll
-import io
-import csv
-import json
+from app.services.report_export import ReportExport, ReportExportError, export_format, stream_report
 
 router = APIRouter()
 
+# Aperçu renvoyé par /generate (l'export complet passe par /export)
+GENERATE_DEFAULT_LIMIT = 500
+
+def _employee_overview(db: Session, company_id: int, params: Dict[str, Any]):
+    return db.query(
+        models.Employee.id.label("id"),
+        models.Employee.name.label("name"),
+        models.Department.name.label("department"),
+        models.Employee.role.label("position"),
+        models.Employee.hire_date.label("hire_date"),
+        models.Employee.salary.label("salary"),
+        models.Employee.status.label("status")
+    ).outerjoin(
+        models.Department, models.Department.id == models.Employee.department_id
+    ).filter(
+        models.Employee.company_id == company_id
+    ).order_by(models.Employee.id)
+
+def _attendance_summary(db: Session, company_id: int, params: Dict[str, Any]):
+    present = case((models.AttendanceRecord.status.in_(("present", "remote")), 1), else_=0)
+    return db.query(
+        models.Employee.id.label("employee_id"),
+        models.Employee.name.label("employee_name"),
+        func.max(models.Department.name).label("department"),
+        func.coalesce(func.sum(models.AttendanceRecord.total_hours), 0).label("total_hours"),
+        func.coalesce(
+            func.round(100.0 * func.sum(present) / func.nullif(func.count(models.AttendanceRecord.id), 0), 1), 0
+        ).label("attendance_rate")
+    ).outerjoin(
+        models.Department, models.Department.id == models.Employee.department_id
+    ).outerjoin(
+        models.AttendanceRecord, models.AttendanceRecord.employee_id == models.Employee.id
+    ).filter(
+        models.Employee.company_id == company_id
+    ).group_by(models.Employee.id, models.Employee.name).order_by(models.Employee.id)
+
+def _payroll_summary(db: Session, company_id: int, params: Dict[str, Any]):
+    query = db.query(
+        models.PayrollRecord.employee_id.label("employee_id"),
+        models.Employee.name.label("employee_name"),
+        models.PayrollRecord.gross_salary.label("gross_salary"),
+        models.PayrollRecord.net_salary.label("net_salary"),
+        models.PayrollRecord.period.label("period"),
+        models.PayrollRecord.processed_date.label("processed_date")
+    ).join(
+        models.Employee, models.Employee.id == models.PayrollRecord.employee_id
+    ).filter(
+        models.Employee.company_id == company_id
+    )
+    # "period" au format YYYY-MM : une seule période
+    period = params.get("period")
+    if period and len(period) == 7 and period[4] == "-":
+        query = query.filter(models.PayrollRecord.period == period)
+    return query.order_by(models.PayrollRecord.period.desc(), models.PayrollRecord.employee_id)
+
+REPORTS = {
+    "employee-overview": _employee_overview,
+    "attendance-summary": _attendance_summary,
+    "payroll-summary": _payroll_summary
+}
+
+def _report_source(report_data: Dict[str, Any], company_id: int):
+    """Constructeur de la requête du rapport demandé (db -> Query)"""
+    report = REPORTS.get(report_data.get("report_id"))
+    if not report:
+        raise HTTPException(status_code=400, detail="Type de rapport non supporté")
+    return lambda db: report(db, company_id, report_data)
+
+def _report_limit(report_data: Dict[str, Any], default: Optional[int] = None) -> Optional[int]:
+    limit = report_data.get("limit", default)
+    try:
+        return None if limit is None else int(limit)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Limite invalide")
+
 @router.post("/generate")
 async def generate_report(
     report_data: Dict[str, Any],
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_hr_admin)
 ):
-    """Générer un rapport"""
+    """Générer un rapport (aperçu limité, colonnes au choix)"""
     report_id = report_data.get("report_id")
-    period = report_data.get("period", "month")
+    build_source = _report_source(report_data, current_user.company_id)
+    limit = _report_limit(report_data, GENERATE_DEFAULT_LIMIT)
     
-    if report_id == "employee-overview":
-        employees = crud_employee.get_employees_by_company(db, current_user.company_id)
-        data = [
-            {
-                "id": emp.id,
-                "name": f"{emp.first_name} {emp.last_name}",
-                "department": emp.department,
-                "position": emp.position,
-                "hire_date": emp.hire_date.isoformat() if emp.hire_date else None,
-                "salary": emp.salary,
-                "status": emp.status
-            }
-            for emp in employees
-        ]
-    elif report_id == "attendance-summary":
-        # Récupérer les données de présence
-        employees = crud_employee.get_employees_by_company(db, current_user.company_id)
-        data = []
-        for emp in employees:
-            attendance_records = crud_attendance.get_attendance_by_employee(db, emp.id)
-            total_hours = sum(
-                (record.total_hours or 0) for record in attendance_records
-            )
-            data.append({
-                "employee_id": emp.id,
-                "employee_name": f"{emp.first_name} {emp.last_name}",
-                "department": emp.department,
-                "total_hours": total_hours,
-                "attendance_rate": 95.0  # Calcul simplifié
-            })
-    elif report_id == "payroll-summary":
-        # Récupérer les données de paie
-        payroll_records = crud_payroll.get_payroll_records(db, current_user.company_id)
-        data = [
-            {
-                "employee_id": record.employee_id,
-                "employee_name": record.employee.first_name + " " + record.employee.last_name,
-                "gross_salary": record.gross_salary,
-                "net_salary": record.net_salary,
-                "period": record.pay_period,
-                "processed_date": record.processed_date.isoformat() if record.processed_date else None
-            }
-            for record in payroll_records
-        ]
-    else:
-        raise HTTPException(status_code=400, detail="Type de rapport non supporté")
+    try:
+        # Une ligne de plus que la limite pour savoir si l'aperçu est tronqué
+        export = ReportExport(
+            build_source(db), report_data.get("columns"), None if limit is None else limit + 1
+        )
+        data = list(export.dicts())
+    except ReportExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {"status": "success", "data": data, "url": f"/reports/view/{report_id}"}
+    truncated = limit is not None and len(data) > limit
+    return {
+        "status": "success",
+        "data": data[:limit] if truncated else data,
+        "truncated": truncated,
+        "url": f"/reports/view/{report_id}"
+    }
 
 @router.post("/export")
 async def export_report(
     export_data: Dict[str, Any],
-    db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_hr_admin)
 ):
-    """Exporter un rapport"""
+    """Exporter un rapport en flux (CSV, JSON, NDJSON ou XLSX)"""
     report_id = export_data.get("report_id")
-    format_type = export_data.get("format", "CSV")
-    
-    # Générer les données
-    report_response = await generate_report(export_data, db, current_user)
-    data = report_response["data"]
-    
-    if format_type.upper() == "CSV":
-        # Créer un CSV
-        output = io.StringIO()
-        if data:
-            writer = csv.DictWriter(output, fieldnames=data[0].keys())
-            writer.writeheader()
-            writer.writerows(data)
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        return StreamingResponse(
-            io.BytesIO(csv_content.encode('utf-8')),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={report_id}.csv"}
-        )
+    format_type = export_data.get("format", "CSV").lower()
+    build_source = _report_source(export_data, current_user.company_id)
     
-    elif format_type.upper() == "JSON":
-        json_content = json.dumps(data, indent=2, ensure_ascii=False)
-        return StreamingResponse(
-            io.BytesIO(json_content.encode('utf-8')),
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename={report_id}.json"}
+    try:
+        media_type, extension = export_format(format_type)
+        body = stream_report(
+            build_source,
+            format_type,
+            columns=export_data.get("columns"),
+            limit=_report_limit(export_data),
+            title=report_id
         )
+    except ReportExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    else:
-        raise HTTPException(status_code=400, detail="Format non supporté")
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={report_id}.{extension}"}
+    )
 
 @router.get("/history")
 async def get_report_history(
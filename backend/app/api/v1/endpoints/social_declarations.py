@@ -13,13 +13,15 @@ from app.schemas.social_declarations import (
     DISADeclaration
 )
 from app.core.auth import get_current_user
+from app.crud import crud_payroll
 from app.services.payroll_calculator import PayrollCalculator
 
 router = APIRouter()
 
 class SocialDeclarationsService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, company_id: Optional[int] = None):
         self.db = db
+        self.company_id = company_id
         self.calculator = PayrollCalculator()
     
     def generate_cnss_declaration(self, period: str) -> Dict[str, Any]:
@@ -78,16 +80,32 @@ class SocialDeclarationsService:
     def generate_disa_declaration(self, year: str) -> Dict[str, Any]:
         """Génère la DISA (Déclaration Sociale Annuelle)"""
         
-        # Simulation des données annuelles
+        # Une ligne de cumuls par employé (tenue à jour à la validation des bulletins)
+        ledger = crud_payroll.get_company_ytd_ledger(self.db, self.company_id, int(year))
+        
         annual_data = {
             "type": "DISA_ANNUAL",
             "period": year,
-            "total_employees": 3,
-            "total_annual_salary": 54000000,  # 12 mois * totaux mensuels
-            "total_annual_cnss_employee": 3024000,
-            "total_annual_cnss_employer": 4536000,
-            "total_annual_irpp": 3293436,
-            "due_date": f"{int(year)+1}-01-31",
+            "total_employees": len(ledger),
+            "total_annual_salary": sum(row.gross_salary for row in ledger),
+            "total_annual_taxable_income": sum(row.taxable_income for row in ledger),
+            "total_annual_cnss_employee": sum(row.cnss_employee for row in ledger),
+            "total_annual_cnss_employer": sum(row.cnss_employer for row in ledger),
+            "total_annual_irpp": sum(row.irpp for row in ledger),
+            "employees_details": [
+                {
+                    "employee_id": row.employee_id,
+                    "months": row.periods_count,
+                    "gross_salary": row.gross_salary,
+                    "taxable_income": row.taxable_income,
+                    "cnss_employee": row.cnss_employee,
+                    "cnss_employer": row.cnss_employer,
+                    "irpp": row.irpp,
+                    "net_salary": row.net_salary
+                }
+                for row in ledger
+            ],
+            "due_date": self._get_due_date(year, "DISA"),
             "status": "generated"
         }
         
@@ -122,7 +140,7 @@ async def generate_declaration(
 ):
     """Génère une déclaration sociale"""
     
-    service = SocialDeclarationsService(db)
+    service = SocialDeclarationsService(db, current_user.company_id)
     
     if request.type == "CNSS_MONTHLY":
         declaration = service.generate_cnss_declaration(request.period)
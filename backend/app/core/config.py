@@ -11,6 +11,27 @@ class Settings(BaseSettings):
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+    # Calcul de paie parallèle (0 = nombre de processeurs)
+    PAYROLL_WORKERS: int = int(os.getenv("PAYROLL_WORKERS", 0))
+    PAYROLL_CHUNK_SIZE: int = int(os.getenv("PAYROLL_CHUNK_SIZE", 2000))
+
+    # Génération des bulletins PDF en masse (0 = nombre de processeurs)
+    PAYSLIP_WORKERS: int = int(os.getenv("PAYSLIP_WORKERS", 0))
+    PAYSLIP_CHUNK_SIZE: int = int(os.getenv("PAYSLIP_CHUNK_SIZE", 25))
+    PAYSLIP_OUTPUT_DIR: str = os.getenv("PAYSLIP_OUTPUT_DIR", "generated_payslips")
+
+    # Bulletins PDF déjà rendus, servis au téléchargement
+    PAYSLIP_CACHE_DIR: str = os.getenv("PAYSLIP_CACHE_DIR", "payslip_cache")
+
+    # File d'envoi des emails (table email_outbox)
+    EMAIL_DISPATCH_BATCH: int = int(os.getenv("EMAIL_DISPATCH_BATCH", 50))
+    EMAIL_DISPATCH_WORKERS: int = int(os.getenv("EMAIL_DISPATCH_WORKERS", 4))
+    EMAIL_POLL_INTERVAL: float = float(os.getenv("EMAIL_POLL_INTERVAL", 5))
+    EMAIL_RATE_PER_MINUTE: int = int(os.getenv("EMAIL_RATE_PER_MINUTE", 120))  # Par serveur SMTP
+    EMAIL_MAX_ATTEMPTS: int = int(os.getenv("EMAIL_MAX_ATTEMPTS", 6))
+    EMAIL_RETRY_BASE_SECONDS: float = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+    EMAIL_RETRY_MAX_SECONDS: float = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", 3600))
+
     model_config = {"case_sensitive": True}
 
 settings = Settings()
\ No newline at end of file
@@ -1,10 +1,13 @@
-import smtplib
+import asyncio
 import os
+from email.mime.application import MIMEApplication
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import logging
 
+from app.core.smtp_pool import smtp_pools
+
 logger = logging.getLogger(__name__)
 
 class EmailService:
@@ -21,48 +24,74 @@ class EmailService:
         """Récupère l'URL du frontend depuis les variables d'environnement"""
         return self.frontend_url
 
+    def smtp_settings(self, smtp_config: dict = None) -> Dict[str, Any]:
+        """Serveur, compte et expéditeur : settings_smtp de l'entreprise si activé, sinon config par défaut"""
+        if smtp_config and smtp_config.get('enabled'):
+            user = smtp_config.get('user', self.smtp_user)
+            return {
+                'host': smtp_config.get('host', self.smtp_host),
+                'port': int(smtp_config.get('port', self.smtp_port)),
+                'user': user,
+                'password': smtp_config.get('password', self.smtp_password),
+                'from_name': smtp_config.get('fromName', self.from_name),
+                'from_email': smtp_config.get('fromEmail', user)
+            }
+        return {
+            'host': self.smtp_host,
+            'port': self.smtp_port,
+            'user': self.smtp_user,
+            'password': self.smtp_password,
+            'from_name': self.from_name,
+            'from_email': self.from_email
+        }
+
+    def deliver(self, to_email: str, subject: str, html_content: str, text_content: str = None,
+                smtp_config: dict = None, attachments: List[Tuple[str, bytes]] = None):
+        """Envoie un email via SMTP ; les erreurs SMTP sont levées (pièces jointes : nom, contenu PDF)"""
+        config = self.smtp_settings(smtp_config)
+
+        body = MIMEMultipart('alternative')
+        if text_content:
+            body.attach(MIMEText(text_content, 'plain', 'utf-8'))
+        body.attach(MIMEText(html_content, 'html', 'utf-8'))
+
+        if attachments:
+            msg = MIMEMultipart('mixed')
+            msg.attach(body)
+            for filename, content in attachments:
+                part = MIMEApplication(content, 'pdf')
+                part.add_header('Content-Disposition', 'attachment', filename=filename)
+                msg.attach(part)
+        else:
+            msg = body
+        msg['Subject'] = subject
+        msg['From'] = f"{config['from_name']} <{config['from_email']}>"
+        msg['To'] = to_email
+
+        # Session SMTP du pool de cette configuration : STARTTLS et login déjà faits
+        smtp_pools.get(config['host'], config['port'], config['user'], config['password']).send_message(msg)
+
     def send_email(self, to_email: str, subject: str, html_content: str, text_content: str = None, smtp_config: dict = None):
         """Envoie un email via SMTP"""
         try:
-            # Utiliser la config SMTP fournie ou celle par défaut
-            if smtp_config and smtp_config.get('enabled'):
-                host = smtp_config.get('host', self.smtp_host)
-                port = smtp_config.get('port', self.smtp_port)
-                user = smtp_config.get('user', self.smtp_user)
-                password = smtp_config.get('password', self.smtp_password)
-                from_name = smtp_config.get('fromName', self.from_name)
-                from_email = smtp_config.get('fromEmail', user)
-            else:
-                host = self.smtp_host
-                port = self.smtp_port
-                user = self.smtp_user
-                password = self.smtp_password
-                from_name = self.from_name
-                from_email = self.from_email
-            
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = f"{from_name} <{from_email}>"
-            msg['To'] = to_email
-
-            if text_content:
-                msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
-            msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-
-            with smtplib.SMTP(host, port) as server:
-                server.starttls()
-                server.login(user, password)
-                server.send_message(msg)
-            
+            self.deliver(to_email, subject, html_content, text_content, smtp_config)
             logger.info(f"Email envoyé à {to_email}")
             return True
         except Exception as e:
             logger.error(f"Erreur envoi email à {to_email}: {e}")
             return False
 
-    def send_invitation_email(self, to_email: str, first_name: str, last_name: str, 
-                            company_name: str, role: str, invitation_token: str, company_logo: str = None, smtp_config: dict = None):
-        """Envoie un email d'invitation"""
+    async def send_email_async(self, *args, **kwargs) -> bool:
+        """send_email sans bloquer la boucle asyncio (thread dédié, session SMTP du pool)"""
+        return await asyncio.to_thread(self.send_email, *args, **kwargs)
+
+    async def send_many_async(self, emails: List[Dict[str, Any]]) -> List[bool]:
+        """Envoyer de nombreux emails (arguments de send_email) en parallèle sur les sessions du pool"""
+        return list(await asyncio.gather(*(self.send_email_async(**email) for email in emails)))
+
+    def compose_invitation_email(self, first_name: str, last_name: str, company_name: str, role: str,
+                                 invitation_token: str, company_logo: str = None) -> Dict[str, str]:
+        """Sujet et contenus (HTML, texte) de l'email d'invitation"""
         invitation_link = f"{self.frontend_url}/accept-invitation?token={invitation_token}"
         
         subject = f"Invitation à rejoindre {company_name} sur NovaCore"
@@ -133,10 +162,17 @@ class EmailService:
         À bientôt sur NovaCore !
         """
         
-        return self.send_email(to_email, subject, html_content, text_content, smtp_config)
+        return {'subject': subject, 'html_content': html_content, 'text_content': text_content}
 
-    def send_welcome_email(self, to_email: str, first_name: str, company_name: str):
-        """Envoie un email de bienvenue après inscription"""
+    def send_invitation_email(self, to_email: str, first_name: str, last_name: str, 
+                            company_name: str, role: str, invitation_token: str, company_logo: str = None, smtp_config: dict = None):
+        """Envoie un email d'invitation"""
+        return self.send_email(to_email, smtp_config=smtp_config, **self.compose_invitation_email(
+            first_name, last_name, company_name, role, invitation_token, company_logo
+        ))
+
+    def compose_welcome_email(self, first_name: str, company_name: str) -> Dict[str, str]:
+        """Sujet et contenu HTML de l'email de bienvenue"""
         subject = f"Bienvenue sur NovaCore, {first_name} !"
         
         html_content = f"""
@@ -174,10 +210,14 @@ class EmailService:
         </html>
         """
         
-        return self.send_email(to_email, subject, html_content)
+        return {'subject': subject, 'html_content': html_content, 'text_content': None}
 
-    def send_password_reset_email(self, to_email: str, first_name: str, reset_link: str, company_logo: str = None, smtp_config: dict = None):
-        """Envoie un email de réinitialisation de mot de passe"""
+    def send_welcome_email(self, to_email: str, first_name: str, company_name: str):
+        """Envoie un email de bienvenue après inscription"""
+        return self.send_email(to_email, **self.compose_welcome_email(first_name, company_name))
+
+    def compose_password_reset_email(self, first_name: str, reset_link: str, company_logo: str = None) -> Dict[str, str]:
+        """Sujet et contenus (HTML, texte) de l'email de réinitialisation de mot de passe"""
         subject = "Réinitialisation de votre mot de passe NovaCore"
         
         logo_section = f'<img src="{company_logo}" alt="Logo" style="height: 40px; margin-bottom: 20px;" />' if company_logo else ''
@@ -242,7 +282,49 @@ class EmailService:
         Si vous n'avez pas demandé cette réinitialisation, ignorez cet email.
         """
         
-        return self.send_email(to_email, subject, html_content, text_content, smtp_config)
+        return {'subject': subject, 'html_content': html_content, 'text_content': text_content}
+
+    def send_password_reset_email(self, to_email: str, first_name: str, reset_link: str, company_logo: str = None, smtp_config: dict = None):
+        """Envoie un email de réinitialisation de mot de passe"""
+        return self.send_email(to_email, smtp_config=smtp_config, **self.compose_password_reset_email(
+            first_name, reset_link, company_logo
+        ))
+
+    def compose_payslip_email(self, employee_name: str, period: str, company_name: str) -> Dict[str, str]:
+        """Sujet et contenus de l'email accompagnant un bulletin de paie (PDF en pièce jointe)"""
+        subject = f"Bulletin de paie {period} - {company_name}"
+        
+        html_content = f"""
+        <!DOCTYPE html>
+        <html>
+        <head><meta charset="utf-8"></head>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <p>Bonjour <strong>{employee_name}</strong>,</p>
+            <p>Veuillez trouver ci-joint votre bulletin de paie pour la période <strong>{period}</strong>.</p>
+            <p>Cordialement,<br>Le service RH de {company_name}</p>
+        </body>
+        </html>
+        """
+        
+        text_content = f"""
+        Bonjour {employee_name},
+        
+        Veuillez trouver ci-joint votre bulletin de paie pour la période {period}.
+        
+        Cordialement,
+        Le service RH de {company_name}
+        """
+        
+        return {'subject': subject, 'html_content': html_content, 'text_content': text_content}
+
+    async def send_invitation_email_async(self, *args, **kwargs) -> bool:
+        return await asyncio.to_thread(self.send_invitation_email, *args, **kwargs)
+
+    async def send_password_reset_email_async(self, *args, **kwargs) -> bool:
+        return await asyncio.to_thread(self.send_password_reset_email, *args, **kwargs)
+
+    async def send_welcome_email_async(self, *args, **kwargs) -> bool:
+        return await asyncio.to_thread(self.send_welcome_email, *args, **kwargs)
 
 # Instance globale
 email_service = EmailService()
\ No newline at end of file
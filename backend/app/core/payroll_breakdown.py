@@ -0,0 +1,77 @@
+"""Détail des bulletins en lignes compactes : (clé de variable internée, montant en centimes entiers)"""
+
+import math
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Montants stockés en centimes entiers
+MINOR_UNITS = 100
+
+# Clé internée : (code, detailed, name, variable_type, calculation_method)
+# detailed=False : montant simple {code: montant}, les autres champs valent ""
+BreakdownKey = Tuple[str, bool, str, str, str]
+
+# Forme détaillée produite par PayrollCalculationEngine : {"name", "type", "value", "calculation_method"}
+_DETAILED_FIELDS = {"name", "type", "value", "calculation_method"}
+
+
+def _is_amount(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def to_minor_units(value: float) -> int:
+    """Montant -> centimes entiers (arrondi half-up, comme PayrollCalculator)"""
+    return int((Decimal(str(value)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor_units(amount: int):
+    """Centimes entiers -> montant (entier si le montant est rond)"""
+    units, cents = divmod(amount, MINOR_UNITS)
+    return units if cents == 0 else amount / MINOR_UNITS
+
+
+def _text(value: Any) -> str:
+    # Les types de variables peuvent arriver sous forme d'Enum
+    value = getattr(value, "value", value)
+    return "" if value is None else str(value)
+
+
+def split_breakdown(breakdown: Optional[Dict[str, Any]]) -> Tuple[List[Tuple[BreakdownKey, int]], Optional[Dict[str, Any]]]:
+    """Séparer un détail en lignes compactes et en reste JSON (valeurs non numériques, formes inconnues)"""
+    lines: List[Tuple[BreakdownKey, int]] = []
+    leftover: Dict[str, Any] = {}
+
+    for code, value in (breakdown or {}).items():
+        if _is_amount(value) and len(code) <= 50:
+            lines.append(((code, False, "", "", ""), to_minor_units(value)))
+        elif (
+            isinstance(value, dict)
+            and set(value) == _DETAILED_FIELDS
+            and _is_amount(value["value"])
+            and len(code) <= 50
+        ):
+            key = (code, True, _text(value["name"])[:100], _text(value["type"])[:20], _text(value["calculation_method"])[:20])
+            lines.append((key, to_minor_units(value["value"])))
+        else:
+            leftover[code] = value
+
+    return lines, (leftover or None)
+
+
+def join_breakdown(lines: Iterable[Tuple[BreakdownKey, int]], leftover: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Reconstituer le détail au format historique de salary_breakdown"""
+    breakdown: Dict[str, Any] = {}
+    for (code, detailed, name, variable_type, calculation_method), amount in lines:
+        value = from_minor_units(amount)
+        if detailed:
+            breakdown[code] = {
+                "name": name,
+                "type": variable_type,
+                "value": value,
+                "calculation_method": calculation_method or None
+            }
+        else:
+            breakdown[code] = value
+    if leftover:
+        breakdown.update(leftover)
+    return breakdown
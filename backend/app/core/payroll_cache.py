@@ -0,0 +1,182 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.core.payroll_formula import formula_cache
+from app.core.payroll_graph import PayrollDependencyGraph
+from app.core.tax_table import TaxTable, get_tax_table
+
+# Attributs recopiés depuis les modèles SQLAlchemy (les instances ne survivent pas à leur session)
+_CONFIG_FIELDS = ("id", "company_id", "company_type", "tax_rates", "formulas", "updated_at")
+_VARIABLE_FIELDS = (
+    "id", "company_id", "code", "name", "variable_type", "is_mandatory", "is_active",
+    "calculation_method", "fixed_amount", "percentage_rate", "formula",
+    "display_order", "updated_at"
+)
+
+
+class PayrollConfigSnapshot:
+    """Copie en lecture seule d'une PayrollConfig, partageable entre sessions"""
+
+    __slots__ = _CONFIG_FIELDS
+
+    def __init__(self, config: models.PayrollConfig):
+        for field in _CONFIG_FIELDS:
+            setattr(self, field, getattr(config, field))
+
+
+class PayrollVariableSnapshot:
+    """Copie en lecture seule d'une PayrollVariable, partageable entre sessions"""
+
+    __slots__ = _VARIABLE_FIELDS
+
+    def __init__(self, variable: models.PayrollVariable):
+        for field in _VARIABLE_FIELDS:
+            setattr(self, field, getattr(variable, field))
+
+
+def parse_irpp_table(tax_rates: Optional[Dict[str, Any]]) -> Optional[TaxTable]:
+    """Barème IRPP préparé de la configuration (None si absent)"""
+    if not tax_rates or "irpp" not in tax_rates:
+        return None
+    brackets = tax_rates["irpp"].get("brackets", [])
+    if not brackets:
+        return None
+    return get_tax_table(brackets, config_format=True)
+
+
+class PayrollEngineState:
+    """État préparé du moteur de paie d'une entreprise : config, variables ordonnées, formules, barème"""
+
+    def __init__(self, company_id: int, version: Tuple, config, variables: List[PayrollVariableSnapshot]):
+        self.company_id = company_id
+        self.version = version
+        self.config = config
+        self.variables = variables
+        self.graph = PayrollDependencyGraph(variables)
+        self.formulas = {
+            v.code: formula_cache.get(v)
+            for v in variables
+            if v.calculation_method == "formula" and v.formula
+        }
+        self.irpp_table = parse_irpp_table(config.tax_rates if config else None)
+
+
+class PayrollEngineCache:
+    """Cache process de l'état du moteur de paie, par entreprise et version de configuration"""
+
+    def __init__(self):
+        self._entries: Dict[int, PayrollEngineState] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def config_version(self, db: Session, company_id: int) -> Tuple:
+        """Empreinte de la configuration (une requête agrégée) : détecte les écritures des autres processus"""
+        config_updated_at = db.query(func.max(models.PayrollConfig.updated_at)).filter(
+            models.PayrollConfig.company_id == company_id
+        ).scalar()
+        variables_count, variables_updated_at = db.query(
+            func.count(models.PayrollVariable.id),
+            func.max(models.PayrollVariable.updated_at)
+        ).filter(
+            models.PayrollVariable.company_id == company_id,
+            models.PayrollVariable.is_active == True
+        ).one()
+        return (config_updated_at, variables_count, variables_updated_at)
+
+    def get(self, db: Session, company_id: int) -> PayrollEngineState:
+        """Retourner l'état préparé de l'entreprise, en le reconstruisant si la configuration a changé"""
+        version = self.config_version(db, company_id)
+
+        with self._lock:
+            state = self._entries.get(company_id)
+            if state is not None and state.version == version:
+                self.hits += 1
+                return state
+            self.misses += 1
+
+        state = self._build(db, company_id, version)
+        with self._lock:
+            self._entries[company_id] = state
+        return state
+
+    def _build(self, db: Session, company_id: int, version: Tuple) -> PayrollEngineState:
+        """Charger la configuration et les variables actives de l'entreprise"""
+        config = db.query(models.PayrollConfig).filter(
+            models.PayrollConfig.company_id == company_id
+        ).first()
+        variables = db.query(models.PayrollVariable).filter(
+            models.PayrollVariable.company_id == company_id,
+            models.PayrollVariable.is_active == True
+        ).order_by(models.PayrollVariable.display_order).all()
+
+        return PayrollEngineState(
+            company_id,
+            version,
+            PayrollConfigSnapshot(config) if config else None,
+            [PayrollVariableSnapshot(v) for v in variables]
+        )
+
+    def invalidate(self, company_id: int = None):
+        """Oublier l'état d'une entreprise (ou de toutes)"""
+        with self._lock:
+            self.invalidations += 1
+            if company_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(company_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du cache"""
+        total = self.hits + self.misses
+        return {
+            "companies": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0
+        }
+
+
+class JsonFileCache:
+    """Cache des fichiers JSON de référence (templates, barèmes), relus seulement si modifiés"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: str) -> Any:
+        """Contenu du fichier, relu si sa date de modification a changé (objet partagé : ne pas le modifier)"""
+        path = os.path.abspath(path)
+        mtime = os.path.getmtime(path)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == mtime:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with self._lock:
+            self._entries[path] = (mtime, data)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du cache"""
+        return {"files": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Instances globales
+payroll_engine_cache = PayrollEngineCache()
+json_file_cache = JsonFileCache()
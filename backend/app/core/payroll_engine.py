@@ -1,8 +1,8 @@
 from typing import Dict, Any, List
 from sqlalchemy.orm import Session
 from app.db import models
-import json
-import re
+from app.core.payroll_formula import FormulaError
+from app.core.payroll_cache import payroll_engine_cache
 
 class PayrollCalculationEngine:
     """Moteur de calcul de paie dynamique"""
@@ -10,23 +10,16 @@ class PayrollCalculationEngine:
     def __init__(self, db: Session, company_id: int):
         self.db = db
         self.company_id = company_id
-        self.config = self._load_config()
-        self.variables = self._load_variables()
+        
+        # Config, variables ordonnées, formules compilées et barème : préparés une fois par version
+        state = payroll_engine_cache.get(db, company_id)
+        self.config = state.config
+        self.variables = state.variables
+        self.graph = state.graph
+        self.formulas = state.formulas
+        self.irpp_table = state.irpp_table
         self.tax_rates = self.config.tax_rates if self.config else {}
     
-    def _load_config(self) -> models.PayrollConfig:
-        """Charger la configuration de paie de l'entreprise"""
-        return self.db.query(models.PayrollConfig).filter(
-            models.PayrollConfig.company_id == self.company_id
-        ).first()
-    
-    def _load_variables(self) -> List[models.PayrollVariable]:
-        """Charger les variables actives de l'entreprise"""
-        return self.db.query(models.PayrollVariable).filter(
-            models.PayrollVariable.company_id == self.company_id,
-            models.PayrollVariable.is_active == True
-        ).order_by(models.PayrollVariable.display_order).all()
-    
     def calculate_payroll(self, employee_id: int, period: str, input_values: Dict[str, float]) -> Dict[str, Any]:
         """Calculer la paie d'un employé pour une période donnée"""
         
@@ -42,12 +35,69 @@ class PayrollCalculationEngine:
         if not employee:
             raise ValueError("Employé non trouvé")
         
-        # Initialiser les totaux
-        calculation_context = {
+        calculation_context = self._build_context(employee, period, input_values)
+        
+        # Calculer chaque variable dans l'ordre topologique des dépendances
+        salary_breakdown = {}
+        
+        for variable in self.graph.order:
+            self._evaluate_into(variable, calculation_context, salary_breakdown)
+        
+        return self._build_result(employee_id, period, calculation_context, salary_breakdown)
+    
+    def recalculate_payroll(
+        self,
+        previous_result: Dict[str, Any],
+        input_values: Dict[str, float],
+        changed_codes: List[str]
+    ) -> Dict[str, Any]:
+        """Recalculer uniquement les variables en aval des entrées modifiées d'un calcul existant"""
+        
+        if not self.config:
+            raise ValueError("Configuration de paie non trouvée pour cette entreprise")
+        
+        previous_breakdown = previous_result.get("salary_breakdown") or {}
+        salary_breakdown = {
+            code: dict(line) for code, line in previous_breakdown.items()
+            if code.lower() in self.graph.by_code
+        }
+        
+        # Variables absentes du calcul précédent (ajoutées depuis) : à recalculer aussi
+        affected = self.graph.affected_by(changed_codes)
+        affected.update(
+            code for code, variable in self.graph.by_code.items()
+            if variable.code not in salary_breakdown
+        )
+        
+        calculation_context = self._build_context(None, previous_result.get("period"), input_values)
+        for code, line in salary_breakdown.items():
+            if code.lower() not in affected:
+                calculation_context["calculated_values"][code] = line.get("value", 0)
+                calculation_context["formula_values"][code.lower()] = line.get("value", 0)
+        
+        recalculated = []
+        for variable in self.graph.order:
+            if variable.code.lower() in affected:
+                self._evaluate_into(variable, calculation_context, salary_breakdown)
+                recalculated.append(variable.code)
+        
+        result = self._build_result(
+            previous_result.get("employee_id"),
+            previous_result.get("period"),
+            calculation_context,
+            salary_breakdown
+        )
+        result["recalculated_variables"] = recalculated
+        return result
+    
+    def _build_context(self, employee, period: str, input_values: Dict[str, float]) -> Dict[str, Any]:
+        """Initialiser le contexte de calcul et les totaux"""
+        return {
             "employee": employee,
             "period": period,
             "input_values": input_values,
             "calculated_values": {},
+            "formula_values": self._build_formula_values(input_values),
             "totals": {
                 "gross_salary": 0,
                 "total_allowances": 0,
@@ -58,47 +108,53 @@ class PayrollCalculationEngine:
                 "net_salary": 0
             }
         }
+    
+    def _evaluate_into(self, variable: models.PayrollVariable, context: Dict[str, Any], salary_breakdown: Dict[str, Any]):
+        """Calculer une variable et la rendre disponible pour les formules qui en dépendent"""
+        value = self._calculate_variable(variable, context)
+        salary_breakdown[variable.code] = {
+            "name": variable.name,
+            "type": variable.variable_type,
+            "value": value,
+            "calculation_method": variable.calculation_method
+        }
+        context["calculated_values"][variable.code] = value
+        context["formula_values"][variable.code.lower()] = value
+    
+    def _build_result(self, employee_id: int, period: str, context: Dict[str, Any], salary_breakdown: Dict[str, Any]) -> Dict[str, Any]:
+        """Calculer les totaux, l'IRPP et le net à partir du détail des variables"""
+        totals = context["totals"]
         
-        # Calculer chaque variable
-        salary_breakdown = {}
-        
-        for variable in self.variables:
-            value = self._calculate_variable(variable, calculation_context)
-            salary_breakdown[variable.code] = {
-                "name": variable.name,
-                "type": variable.variable_type,
-                "value": value,
-                "calculation_method": variable.calculation_method
-            }
-            
-            # Ajouter aux totaux selon le type
-            self._add_to_totals(variable, value, calculation_context["totals"])
+        # Ajouter aux totaux selon le type
+        for variable in self.graph.order:
+            if variable.code in salary_breakdown:
+                self._add_to_totals(variable, salary_breakdown[variable.code]["value"], totals)
         
         # Calculer l'impôt sur le revenu
-        if "IRPP" in [v.code for v in self.variables]:
-            tax_amount = self._calculate_irpp(calculation_context["totals"]["taxable_income"])
-            calculation_context["totals"]["tax_amount"] = tax_amount
+        if "IRPP" in salary_breakdown:
+            tax_amount = self._calculate_irpp(totals["taxable_income"])
+            totals["tax_amount"] = tax_amount
             salary_breakdown["IRPP"]["value"] = tax_amount
         
         # Calculer le net à payer
         net_salary = (
-            calculation_context["totals"]["gross_salary"] + 
-            calculation_context["totals"]["total_allowances"] - 
-            calculation_context["totals"]["total_deductions"] - 
-            calculation_context["totals"]["tax_amount"] - 
-            calculation_context["totals"]["social_contributions"]
+            totals["gross_salary"] + 
+            totals["total_allowances"] - 
+            totals["total_deductions"] - 
+            totals["tax_amount"] - 
+            totals["social_contributions"]
         )
-        calculation_context["totals"]["net_salary"] = net_salary
+        totals["net_salary"] = net_salary
         
         return {
             "employee_id": employee_id,
             "period": period,
-            "gross_salary": calculation_context["totals"]["gross_salary"],
-            "total_allowances": calculation_context["totals"]["total_allowances"],
-            "total_deductions": calculation_context["totals"]["total_deductions"],
-            "taxable_income": calculation_context["totals"]["taxable_income"],
-            "tax_amount": calculation_context["totals"]["tax_amount"],
-            "social_contributions": calculation_context["totals"]["social_contributions"],
+            "gross_salary": totals["gross_salary"],
+            "total_allowances": totals["total_allowances"],
+            "total_deductions": totals["total_deductions"],
+            "taxable_income": totals["taxable_income"],
+            "tax_amount": totals["tax_amount"],
+            "social_contributions": totals["social_contributions"],
             "net_salary": net_salary,
             "salary_breakdown": salary_breakdown
         }
@@ -119,7 +175,7 @@ class PayrollCalculationEngine:
             return base_salary * (variable.percentage_rate / 100)
         
         elif variable.calculation_method == "formula":
-            return self._evaluate_formula(variable.formula, context)
+            return self._evaluate_formula(variable, context)
         
         elif variable.calculation_method == "progressive" and variable.code == "IRPP":
             # L'IRPP sera calculé séparément
@@ -127,32 +183,25 @@ class PayrollCalculationEngine:
         
         return 0
     
-    def _evaluate_formula(self, formula: str, context: Dict[str, Any]) -> float:
-        """Évaluer une formule dynamique"""
-        if not formula:
+    def _build_formula_values(self, input_values: Dict[str, float]) -> Dict[str, float]:
+        """Construire l'espace de noms (code en minuscules -> valeur) utilisé par les formules"""
+        values = {code.lower(): value for code, value in input_values.items()}
+        values.setdefault("sb", input_values.get("SB", 0))
+        return values
+    
+    def _evaluate_formula(self, variable: models.PayrollVariable, context: Dict[str, Any]) -> float:
+        """Évaluer une formule dynamique (compilée une seule fois par variable)"""
+        if not variable.formula:
+            return 0
+        
+        compiled = self.formulas.get(variable.code)
+        if compiled is None:
             return 0
         
         try:
-            # Remplacer les variables dans la formule
-            eval_formula = formula
-            
-            # Variables d'entrée
-            for code, value in context["input_values"].items():
-                eval_formula = eval_formula.replace(code.lower(), str(value))
-            
-            # Variables calculées
-            for code, value in context["calculated_values"].items():
-                eval_formula = eval_formula.replace(code.lower(), str(value))
-            
-            # Constantes communes
-            eval_formula = eval_formula.replace("salaire_base", str(context["input_values"].get("SB", 0)))
-            
-            # Évaluer l'expression (attention : sécuriser en production)
-            result = eval(eval_formula)
-            return float(result)
-        
-        except Exception as e:
-            print(f"Erreur dans l'évaluation de la formule '{formula}': {e}")
+            return compiled(context["formula_values"])
+        except (FormulaError, ArithmeticError, TypeError) as e:
+            print(f"Erreur dans l'évaluation de la formule '{variable.formula}': {e}")
             return 0
     
     def _add_to_totals(self, variable: models.PayrollVariable, value: float, totals: Dict[str, float]):
@@ -175,33 +224,10 @@ class PayrollCalculationEngine:
     def _calculate_irpp(self, taxable_income: float) -> float:
         """Calculer l'impôt sur le revenu selon le barème progressif"""
         
-        if not self.tax_rates or "irpp" not in self.tax_rates:
+        if self.irpp_table is None:
             return 0
         
-        irpp_config = self.tax_rates["irpp"]
-        brackets = irpp_config.get("brackets", [])
-        
-        total_tax = 0
-        remaining_income = taxable_income
-        
-        for bracket in brackets:
-            if remaining_income <= 0:
-                break
-            
-            bracket_min = bracket["min"]
-            bracket_max = bracket["max"]
-            rate = bracket["rate"] / 100
-            
-            if bracket_max is None:  # Dernière tranche
-                taxable_in_bracket = remaining_income
-            else:
-                taxable_in_bracket = min(remaining_income, bracket_max - bracket_min + 1)
-            
-            if taxable_in_bracket > 0:
-                total_tax += taxable_in_bracket * rate
-                remaining_income -= taxable_in_bracket
-        
-        return total_tax
+        return self.irpp_table.tax(taxable_income)
     
     def validate_calculation_inputs(self, input_values: Dict[str, float]) -> List[str]:
         """Valider les valeurs d'entrée pour le calcul"""
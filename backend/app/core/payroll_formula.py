@@ -0,0 +1,217 @@
+import ast
+import operator
+from datetime import datetime
+from typing import Any, Callable, Dict, FrozenSet, Mapping, Optional, Tuple
+
+# Alias historiques utilisés dans les formules (nom -> code de variable)
+FORMULA_ALIASES = {
+    "salaire_base": "sb",
+}
+
+# Exposant maximal de ** : une formule comme 9**9**9 bloquerait le calcul de paie
+MAX_POWER_EXPONENT = 10
+
+
+def _bounded_pow(base, exponent) -> float:
+    """Puissance à exposant borné, calculée en flottants"""
+    if abs(exponent) > MAX_POWER_EXPONENT:
+        raise FormulaError(f"Exposant trop grand: {exponent} (maximum {MAX_POWER_EXPONENT})")
+    try:
+        result = float(base) ** float(exponent)
+    except OverflowError:
+        raise FormulaError("Puissance trop grande")
+    if isinstance(result, complex):
+        raise FormulaError("Puissance sans résultat réel")
+    return result
+
+
+# Opérateurs autorisés dans une formule
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _bounded_pow,
+}
+
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_COMPARE_OPERATORS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+# Fonctions autorisées dans une formule
+_FUNCTIONS = {
+    "min": min,
+    "max": max,
+    "abs": abs,
+    "round": round,
+}
+
+
+class FormulaError(ValueError):
+    """Formule invalide ou non évaluable"""
+
+
+class CompiledFormula:
+    """Formule de paie analysée une seule fois et évaluable sur un dictionnaire nom -> valeur"""
+
+    __slots__ = ("source", "names", "_evaluate")
+
+    def __init__(self, source: str, names: FrozenSet[str], evaluate: Callable[[Mapping[str, float]], Any]):
+        self.source = source
+        self.names = names
+        self._evaluate = evaluate
+
+    def __call__(self, values: Mapping[str, float]) -> float:
+        return float(self._evaluate(values))
+
+    def __repr__(self) -> str:
+        return f"CompiledFormula({self.source!r})"
+
+
+def _compile_node(node: ast.AST, names: set) -> Callable[[Mapping[str, float]], Any]:
+    """Transformer un noeud AST autorisé en fermeture Python"""
+
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body, names)
+
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise FormulaError(f"Constante non autorisée: {node.value!r}")
+        value = node.value
+        return lambda values: value
+
+    if isinstance(node, ast.Name):
+        name = node.id.lower()
+        name = FORMULA_ALIASES.get(name, name)
+        names.add(name)
+
+        def load(values, name=name):
+            try:
+                return values[name]
+            except KeyError:
+                raise FormulaError(f"Variable inconnue: {name}")
+        return load
+
+    if isinstance(node, ast.BinOp):
+        op = _BINARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise FormulaError(f"Opérateur non autorisé: {type(node.op).__name__}")
+        left = _compile_node(node.left, names)
+        right_names: set = set()
+        right = _compile_node(node.right, right_names)
+        names.update(right_names)
+        if op is _bounded_pow and not right_names:
+            # Exposant constant : vérifié dès la compilation (enregistrement de la variable)
+            try:
+                _bounded_pow(1, right({}))
+            except ArithmeticError as e:
+                raise FormulaError(f"Exposant invalide: {e}")
+        return lambda values: op(left(values), right(values))
+
+    if isinstance(node, ast.UnaryOp):
+        op = _UNARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise FormulaError(f"Opérateur non autorisé: {type(node.op).__name__}")
+        operand = _compile_node(node.operand, names)
+        return lambda values: op(operand(values))
+
+    if isinstance(node, ast.Compare):
+        ops = []
+        for cmp_op in node.ops:
+            op = _COMPARE_OPERATORS.get(type(cmp_op))
+            if op is None:
+                raise FormulaError(f"Comparaison non autorisée: {type(cmp_op).__name__}")
+            ops.append(op)
+        left = _compile_node(node.left, names)
+        comparators = [_compile_node(c, names) for c in node.comparators]
+
+        def compare(values):
+            current = left(values)
+            for op, comparator in zip(ops, comparators):
+                right = comparator(values)
+                if not op(current, right):
+                    return 0
+                current = right
+            return 1
+        return compare
+
+    if isinstance(node, ast.IfExp):
+        test = _compile_node(node.test, names)
+        body = _compile_node(node.body, names)
+        orelse = _compile_node(node.orelse, names)
+        return lambda values: body(values) if test(values) else orelse(values)
+
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+            raise FormulaError("Appel de fonction non autorisé")
+        func = _FUNCTIONS[node.func.id]
+        args = [_compile_node(arg, names) for arg in node.args]
+        return lambda values: func(*[arg(values) for arg in args])
+
+    raise FormulaError(f"Expression non autorisée: {type(node).__name__}")
+
+
+def compile_formula(source: str) -> CompiledFormula:
+    """Analyser une formule en AST restreint et la compiler en fermeture"""
+    if not source or not source.strip():
+        raise FormulaError("Formule vide")
+
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        raise FormulaError(f"Syntaxe invalide: {e.msg}")
+
+    names: set = set()
+    evaluate = _compile_node(tree, names)
+    return CompiledFormula(source, frozenset(names), evaluate)
+
+
+class FormulaCache:
+    """Cache des formules compilées par variable de paie (id + updated_at)"""
+
+    def __init__(self):
+        self._entries: Dict[int, Tuple[Optional[datetime], Optional[str], Optional[CompiledFormula]]] = {}
+
+    def get(self, variable) -> Optional[CompiledFormula]:
+        """Retourner la formule compilée d'une variable, None si elle n'en a pas ou si elle est invalide"""
+        entry = self._entries.get(variable.id)
+        # La formule est comparée aussi : une variable modifiée mais pas encore enregistrée garde son ancien updated_at
+        if entry is not None and entry[0] == variable.updated_at and entry[1] == variable.formula:
+            return entry[2]
+
+        compiled = None
+        if variable.formula:
+            try:
+                compiled = compile_formula(variable.formula)
+            except FormulaError as e:
+                print(f"Erreur de compilation de la formule '{variable.formula}': {e}")
+
+        if variable.id is not None:
+            self._entries[variable.id] = (variable.updated_at, variable.formula, compiled)
+        return compiled
+
+    def invalidate(self, variable_id: int = None):
+        """Supprimer une entrée (ou tout le cache)"""
+        if variable_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(variable_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Instance globale
+formula_cache = FormulaCache()
@@ -0,0 +1,114 @@
+from collections import defaultdict
+import heapq
+from typing import Dict, FrozenSet, Iterable, List, Set
+
+from app.core.payroll_formula import formula_cache
+
+
+class PayrollDependencyError(ValueError):
+    """Dépendance circulaire entre variables de paie"""
+
+    def __init__(self, cycle: List[str]):
+        self.cycle = cycle
+        super().__init__(f"Dépendance circulaire entre variables: {' -> '.join(cycle)}")
+
+
+def variable_dependencies(variable) -> FrozenSet[str]:
+    """Noms (en minuscules) dont dépend la valeur d'une variable"""
+    if variable.calculation_method == "percentage":
+        return frozenset({"sb"})
+
+    if variable.calculation_method == "formula" and variable.formula:
+        compiled = formula_cache.get(variable)
+        if compiled is not None:
+            return compiled.names
+
+    return frozenset()
+
+
+class PayrollDependencyGraph:
+    """Graphe orienté acyclique des variables de paie (dépendance -> variable dépendante)"""
+
+    def __init__(self, variables: Iterable):
+        self.variables = list(variables)
+        self.by_code = {v.code.lower(): v for v in self.variables}
+        self.dependencies: Dict[str, FrozenSet[str]] = {}
+        self.dependents: Dict[str, Set[str]] = defaultdict(set)
+
+        for variable in self.variables:
+            code = variable.code.lower()
+            deps = variable_dependencies(variable)
+            if code in deps:
+                if variable.calculation_method == "formula":
+                    # Une formule qui se référence elle-même est un cycle de longueur 1
+                    raise PayrollDependencyError([variable.code, variable.code])
+                deps = deps - {code}
+            self.dependencies[code] = deps
+            for dep in deps:
+                self.dependents[dep].add(code)
+
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List:
+        """Tri topologique (Kahn), départagé par display_order pour garder un ordre stable"""
+        position = {
+            v.code.lower(): (v.display_order or 0, index)
+            for index, v in enumerate(self.variables)
+        }
+        in_degree = {
+            code: sum(1 for dep in deps if dep in self.by_code)
+            for code, deps in self.dependencies.items()
+        }
+
+        ready = [(position[code], code) for code, degree in in_degree.items() if degree == 0]
+        heapq.heapify(ready)
+        order = []
+
+        while ready:
+            _, code = heapq.heappop(ready)
+            order.append(self.by_code[code])
+            for dependent in self.dependents.get(code, ()):
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    heapq.heappush(ready, (position[dependent], dependent))
+
+        if len(order) != len(self.variables):
+            remaining = {code for code, degree in in_degree.items() if degree > 0}
+            raise PayrollDependencyError(self._find_cycle(remaining))
+
+        return order
+
+    def _find_cycle(self, remaining: Set[str]) -> List[str]:
+        """Extraire un cycle parmi les variables non triées (pour le message d'erreur)"""
+        start = min(remaining)
+        path = [start]
+        seen = {start: 0}
+        current = start
+        while True:
+            current = min(dep for dep in self.dependencies[current] if dep in remaining)
+            if current in seen:
+                cycle = path[seen[current]:] + [current]
+                return [self.by_code[code].code for code in cycle]
+            seen[current] = len(path)
+            path.append(current)
+
+    def affected_by(self, changed_names: Iterable[str]) -> Set[str]:
+        """Codes des variables à recalculer quand les entrées `changed_names` changent"""
+        pending = [name.lower() for name in changed_names]
+        affected: Set[str] = set()
+
+        while pending:
+            name = pending.pop()
+            if name in self.by_code and name not in affected:
+                affected.add(name)
+            for dependent in self.dependents.get(name, ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    pending.append(dependent)
+
+        return affected
+
+
+def check_for_cycles(variables: Iterable) -> None:
+    """Lever PayrollDependencyError si les variables forment un cycle"""
+    PayrollDependencyGraph(variables)
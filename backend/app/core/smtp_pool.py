@@ -0,0 +1,161 @@
+"""Pool de sessions SMTP authentifiées, réutilisées d'un message à l'autre (une par configuration SMTP)"""
+
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from email.message import Message
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sessions ouvertes au plus par configuration SMTP
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+# Session inutilisée depuis plus longtemps : fermée plutôt que réutilisée (secondes)
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "120"))
+# Session inutilisée depuis plus longtemps : vérifiée par NOOP avant réutilisation (secondes)
+SMTP_NOOP_INTERVAL = float(os.getenv("SMTP_NOOP_INTERVAL", "10"))
+# Messages par session avant reconnexion (limite fréquente des serveurs)
+SMTP_MAX_MESSAGES = int(os.getenv("SMTP_MAX_MESSAGES", "100"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+
+# Erreurs de connexion : la session est jetée et le message renvoyé sur une nouvelle
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class _Session:
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.last_used = time.monotonic()
+        self.messages = 0
+
+
+def _close(session: _Session):
+    try:
+        session.server.quit()
+    except Exception:
+        try:
+            session.server.close()
+        except Exception:
+            pass
+
+
+class SMTPConnectionPool:
+    """Sessions SMTP (STARTTLS + login faits une fois) pour un serveur et un compte"""
+
+    def __init__(self, host: str, port: int, user: Optional[str], password: Optional[str],
+                 max_size: int = None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.max_size = max_size or SMTP_POOL_SIZE
+        self._idle: Deque[_Session] = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+
+    def _connect(self) -> _Session:
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            server.starttls()
+        if self.user:
+            server.login(self.user, self.password)
+        logger.debug(f"Session SMTP ouverte vers {self.host}:{self.port}")
+        return _Session(server)
+
+    def _alive(self, session: _Session) -> bool:
+        """Session réutilisable : pas trop ancienne, et NOOP accepté si elle a dormi"""
+        idle = time.monotonic() - session.last_used
+        if idle > SMTP_IDLE_TIMEOUT or session.messages >= SMTP_MAX_MESSAGES:
+            return False
+        if idle > SMTP_NOOP_INTERVAL:
+            try:
+                return session.server.noop()[0] == 250
+            except Exception:
+                return False
+        return True
+
+    def _checkout(self) -> _Session:
+        while True:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                return self._connect()
+            if self._alive(session):
+                return session
+            _close(session)
+
+    @contextmanager
+    def session(self) -> Iterator[smtplib.SMTP]:
+        """Session du pool ; rendue au pool après usage, jetée si la connexion a échoué"""
+        self._slots.acquire()
+        session = None
+        try:
+            session = self._checkout()
+            yield session.server
+            self._release(session)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            # Message refusé par le serveur : la session reste utilisable
+            if session is not None:
+                self._release(session)
+            raise
+        except BaseException:
+            if session is not None:
+                _close(session)
+            raise
+        finally:
+            self._slots.release()
+
+    def _release(self, session: _Session):
+        session.messages += 1
+        session.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(session)
+
+    def send_message(self, msg: Message):
+        """Envoyer un message ; une reconnexion est tentée si la session a été coupée"""
+        try:
+            with self.session() as server:
+                server.send_message(msg)
+        except RECONNECT_ERRORS as e:
+            logger.info(f"Session SMTP {self.host}:{self.port} perdue ({e}), reconnexion")
+            with self.session() as server:
+                server.send_message(msg)
+
+    def close(self):
+        """Fermer les sessions inactives"""
+        with self._lock:
+            sessions, self._idle = list(self._idle), deque()
+        for session in sessions:
+            _close(session)
+
+
+class SMTPPoolManager:
+    """Un pool par configuration SMTP (serveur par défaut ou settings_smtp d'une entreprise)"""
+
+    def __init__(self):
+        self._pools: Dict[Tuple, SMTPConnectionPool] = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str, port: int, user: Optional[str], password: Optional[str]) -> SMTPConnectionPool:
+        key = (host, int(port), user, password)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = SMTPConnectionPool(host, int(port), user, password)
+            return pool
+
+    def close_all(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+
+# Instance globale
+smtp_pools = SMTPPoolManager()
@@ -0,0 +1,215 @@
+from bisect import bisect_right
+from decimal import Decimal
+from functools import lru_cache
+from math import lcm
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class TaxTable:
+    """Barème progressif préparé : bornes inférieures, taux et impôt cumulé à chaque borne"""
+
+    def __init__(self, brackets: Iterable[Tuple[float, Optional[float], float]]):
+        """brackets : tranches contiguës (borne inférieure, borne supérieure ou None, taux décimal)"""
+        brackets = sorted(brackets, key=lambda b: b[0])
+
+        self.lower_bounds: List[Decimal] = [Decimal(str(b[0])) for b in brackets]
+        self.upper_bounds: List[Optional[Decimal]] = [
+            Decimal(str(b[1])) if b[1] is not None else None for b in brackets
+        ]
+        self.rates: List[Decimal] = [Decimal(str(b[2])) for b in brackets]
+
+        # Impôt dû sur le revenu égal à chaque borne inférieure
+        self.cumulative_tax: List[Decimal] = []
+        total = Decimal('0')
+        for i, lower in enumerate(self.lower_bounds):
+            if i > 0:
+                total += (lower - self.lower_bounds[i - 1]) * self.rates[i - 1]
+            self.cumulative_tax.append(total)
+
+        self._lower_floats = [float(b) for b in self.lower_bounds]
+        self._rate_floats = [float(r) for r in self.rates]
+        self._cumulative_floats = [float(t) for t in self.cumulative_tax]
+
+        self.lower_array = np.array(self._lower_floats, dtype=np.float64)
+        self.rate_array = np.array(self._rate_floats, dtype=np.float64)
+        self.cumulative_array = np.array(self._cumulative_floats, dtype=np.float64)
+
+        self._minor_unit_tables: Dict[int, Tuple[List[int], List[Tuple]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.lower_bounds)
+
+    @classmethod
+    def from_brackets(cls, brackets: List[Dict]) -> "TaxTable":
+        """Depuis un barème {min, max (inf pour la dernière tranche), rate décimal} à tranches contiguës"""
+        return cls(
+            (b["min"], b["max"] if b["max"] != float('inf') else None, b["rate"])
+            for b in brackets
+        )
+
+    @classmethod
+    def from_config(cls, brackets: List[Dict]) -> "TaxTable":
+        """Depuis le barème d'une PayrollConfig {min, max inclus ou None, rate en %}
+
+        Chaque tranche couvre max - min + 1 unités de revenu, à la suite de la précédente.
+        """
+        table = []
+        lower = 0
+        for bracket in brackets:
+            if bracket["max"] is None:
+                table.append((lower, None, bracket["rate"] / 100))
+                break
+            width = bracket["max"] - bracket["min"] + 1
+            table.append((lower, lower + width, bracket["rate"] / 100))
+            lower += width
+        return cls(table)
+
+    def _bracket_index(self, bounds: List, income) -> int:
+        """Indice de la tranche contenant le revenu (bisect sur les bornes inférieures)"""
+        return bisect_right(bounds, income) - 1
+
+    def _in_last_bracket(self, index: int, income) -> bool:
+        upper = self.upper_bounds[index]
+        return upper is None or income <= upper
+
+    def tax(self, income: float) -> float:
+        """Impôt (non arrondi) en float"""
+        if income <= 0 or not self.lower_bounds:
+            return 0.0
+        index = self._bracket_index(self._lower_floats, income)
+        if index < 0:
+            return 0.0
+        taxable = income - self._lower_floats[index]
+        if not self._in_last_bracket(index, income):
+            taxable = float(self.upper_bounds[index]) - self._lower_floats[index]
+        return self._cumulative_floats[index] + taxable * self._rate_floats[index]
+
+    def tax_decimal(self, income: Decimal) -> Decimal:
+        """Impôt (non arrondi) en Decimal"""
+        if income <= 0 or not self.lower_bounds:
+            return Decimal('0')
+        index = self._bracket_index(self.lower_bounds, income)
+        if index < 0:
+            return Decimal('0')
+        taxable = income - self.lower_bounds[index]
+        if not self._in_last_bracket(index, income):
+            taxable = self.upper_bounds[index] - self.lower_bounds[index]
+        return self.cumulative_tax[index] + taxable * self.rates[index]
+
+    def _minor_unit_table(self, scale: int) -> Tuple[List[int], List[Tuple]]:
+        """Barème en entiers pour des revenus exprimés en 1/scale d'unité monétaire"""
+        table = self._minor_unit_tables.get(scale)
+        if table is not None:
+            return table
+
+        lowers, brackets = [], []
+        for lower, upper, rate, cumulative in zip(
+            self.lower_bounds, self.upper_bounds, self.rates, self.cumulative_tax
+        ):
+            cum_num, cum_den = cumulative.as_integer_ratio()
+            rate_num, rate_den = rate.as_integer_ratio()
+            denominator = lcm(cum_den, scale * rate_den)
+            lowers.append(int(lower * scale))
+            brackets.append((
+                int(lower * scale),
+                int(upper * scale) if upper is not None else None,
+                cum_num * (denominator // cum_den),
+                rate_num * (denominator // (scale * rate_den)),
+                denominator
+            ))
+
+        table = (lowers, brackets)
+        self._minor_unit_tables[scale] = table
+        return table
+
+    def tax_minor_units(self, income: int, scale: int = 100) -> Tuple[int, int]:
+        """Impôt exact (numérateur, dénominateur) d'un revenu entier en 1/scale d'unité monétaire"""
+        if income <= 0 or not self.lower_bounds:
+            return 0, 1
+        lowers, brackets = self._minor_unit_table(scale)
+        index = bisect_right(lowers, income) - 1
+        if index < 0:
+            return 0, 1
+        lower, upper, cum_num, rate_num, denominator = brackets[index]
+        taxable = income - lower
+        if upper is not None and income > upper:
+            taxable = upper - lower
+        return cum_num + taxable * rate_num, denominator
+
+    def tax_minor_units_array(self, incomes: np.ndarray, scale: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+        """Impôt exact (numérateurs, dénominateurs) d'un tableau de revenus entiers en 1/scale d'unité (int64)"""
+        lowers, brackets = self._minor_unit_table(scale)
+        if not lowers:
+            return np.zeros_like(incomes), np.ones_like(incomes)
+        lower, upper, cum_num, rate_num, denominator = (
+            np.array([b[i] if b[i] is not None else np.iinfo(np.int64).max for b in brackets], dtype=np.int64)
+            for i in range(5)
+        )
+        index = np.searchsorted(lower, incomes, side="right") - 1
+        valid = (incomes > 0) & (index >= 0)
+        index = np.clip(index, 0, None)
+        taxable = np.minimum(incomes, upper[index]) - lower[index]
+        numerators = cum_num[index] + taxable * rate_num[index]
+        return np.where(valid, numerators, 0), np.where(valid, denominator[index], 1)
+
+    def tax_array(self, incomes: np.ndarray) -> np.ndarray:
+        """Impôt (non arrondi) d'un tableau de revenus (np.searchsorted)"""
+        if not self.lower_bounds:
+            return np.zeros_like(incomes, dtype=np.float64)
+        index = np.searchsorted(self.lower_array, incomes, side="right") - 1
+        valid = (incomes > 0) & (index >= 0)
+        index = np.clip(index, 0, None)
+        taxable = incomes - self.lower_array[index]
+        last_upper = self.upper_bounds[-1]
+        if last_upper is not None:
+            # Barème fermé : rien n'est imposé au-delà de la dernière borne
+            taxable = np.where(
+                index == len(self) - 1,
+                np.minimum(taxable, float(last_upper) - self._lower_floats[-1]),
+                taxable
+            )
+        tax = self.cumulative_array[index] + taxable * self.rate_array[index]
+        return np.where(valid, tax, 0.0)
+
+    def breakdown(self, income: Decimal) -> List[Dict]:
+        """Détail de l'impôt par tranche atteinte"""
+        if income <= 0 or not self.lower_bounds:
+            return []
+        last = self._bracket_index(self.lower_bounds, income)
+
+        breakdown = []
+        for i in range(last + 1):
+            lower = self.lower_bounds[i]
+            upper = self.upper_bounds[i]
+            if i < last or (upper is not None and income > upper):
+                taxable_in_bracket = upper - lower
+            else:
+                taxable_in_bracket = income - lower
+            if i == last and taxable_in_bracket <= 0:
+                break
+
+            breakdown.append({
+                "tranche": i + 1,
+                "min": float(lower),
+                "max": float(upper) if upper is not None else None,
+                "rate": float(self.rates[i] * 100),
+                "taxable_amount": float(taxable_in_bracket),
+                "tax_amount": float(taxable_in_bracket * self.rates[i])
+            })
+        return breakdown
+
+
+@lru_cache(maxsize=64)
+def _cached_table(kind: str, key: Tuple) -> TaxTable:
+    brackets = [{"min": b[0], "max": b[1], "rate": b[2]} for b in key]
+    if kind == "config":
+        return TaxTable.from_config(brackets)
+    return TaxTable.from_brackets(brackets)
+
+
+def get_tax_table(brackets: List[Dict], config_format: bool = False) -> TaxTable:
+    """TaxTable partagée, construite une seule fois par barème"""
+    key = tuple((b["min"], b["max"], b["rate"]) for b in brackets)
+    return _cached_table("config" if config_format else "brackets", key)
@@ -1,7 +1,53 @@
+from datetime import datetime
+from sqlalchemy import case, func, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Iterable
+from app.core.payroll_breakdown import BreakdownKey, from_minor_units, join_breakdown, split_breakdown
 from app.db import models
 from app.schemas import payroll as payroll_schema
+from app.services.payslip_cache import payslip_pdf_cache
+
+# Nombre de lignes par instruction INSERT ... ON DUPLICATE KEY UPDATE
+UPSERT_BATCH_SIZE = 1000
+
+# Statuts des bulletins pris en compte dans les cumuls annuels
+YTD_STATUSES = ("validated", "paid")
+YTD_FIELDS = ("gross_salary", "taxable_income", "cnss_employee", "cnss_employer", "irpp", "net_salary")
+
+# Montant du rappel -> code du détail du bulletin de la période de versement
+RETRO_BREAKDOWN_CODES = {
+    "gross_salary": "rappel_brut",
+    "cnss_employee": "rappel_cnss_salarie",
+    "cnss_employer": "rappel_cnss_patronale",
+    "irpp": "rappel_irpp",
+    "net_salary": "rappel_net"
+}
+
+class PayrollPeriodClosedError(ValueError):
+    """Écriture refusée : la période de paie est clôturée"""
+
+def check_periods_open(db: Session, keys: Iterable[tuple]):
+    """Lever PayrollPeriodClosedError si l'un des bulletins (employee_id, period) tombe sur une période clôturée"""
+    keys = set(keys)
+    if not keys:
+        return
+    employee_ids = {employee_id for employee_id, _ in keys}
+    periods = {period for _, period in keys}
+    closed = db.query(models.Employee.id, models.PayrollPeriod.period).join(
+        models.PayrollPeriod, models.PayrollPeriod.company_id == models.Employee.company_id
+    ).filter(
+        models.Employee.id.in_(employee_ids),
+        models.PayrollPeriod.period.in_(periods),
+        models.PayrollPeriod.status == "closed"
+    ).all()
+    frozen = sorted({period for employee_id, period in closed if (employee_id, period) in keys})
+    if frozen:
+        raise PayrollPeriodClosedError(
+            f"Période(s) clôturée(s) : {', '.join(frozen)} - utiliser un rappel sur une période ouverte"
+        )
 
 def get_payroll_record(db: Session, record_id: int) -> Optional[models.PayrollRecord]:
     return db.query(models.PayrollRecord).filter(models.PayrollRecord.id == record_id).first()
@@ -15,17 +61,777 @@ def get_payroll_by_employee(db: Session, employee_id: int) -> List[models.Payrol
     return db.query(models.PayrollRecord).filter(models.PayrollRecord.employee_id == employee_id).all()
 
 def create_payroll_record(db: Session, payroll: payroll_schema.PayrollRecordCreate) -> models.PayrollRecord:
+    check_periods_open(db, [(payroll.employee_id, payroll.period)])
     db_payroll = models.PayrollRecord(**payroll.dict())
     db.add(db_payroll)
+    db.flush()
+    # Cumuls annuels et cube suivent les bulletins validés : un brouillon ne les touche pas
+    new_amounts = _ytd_amounts(_record_ytd_values(db_payroll))
+    if new_amounts is not None:
+        ytd_deltas: Dict[tuple, list] = {}
+        _add_ytd_delta(ytd_deltas, (db_payroll.employee_id, db_payroll.period), None, new_amounts)
+        _apply_ytd_deltas(db, ytd_deltas)
+        _refresh_cost_cubes(db, [(db_payroll.employee_id, db_payroll.period)])
     db.commit()
     db.refresh(db_payroll)
     return db_payroll
 
 def update_payroll_record(db: Session, db_payroll: models.PayrollRecord, payroll_in: payroll_schema.PayrollRecordUpdate) -> models.PayrollRecord:
     update_data = payroll_in.dict(exclude_unset=True)
+    check_periods_open(db, {
+        (db_payroll.employee_id, db_payroll.period),
+        (update_data.get("employee_id", db_payroll.employee_id), update_data.get("period", db_payroll.period))
+    })
+    previous_key = (db_payroll.employee_id, db_payroll.period)
+    old_amounts = _ytd_amounts(_record_ytd_values(db_payroll))
     for key, value in update_data.items():
         setattr(db_payroll, key, value)
     db.add(db_payroll)
+    db.flush()
+    # Validation, dévalidation ou correction d'un bulletin validé : cumuls annuels et cube changent
+    new_key = (db_payroll.employee_id, db_payroll.period)
+    new_amounts = _ytd_amounts(_record_ytd_values(db_payroll))
+    if (previous_key, old_amounts) != (new_key, new_amounts):
+        ytd_deltas: Dict[tuple, list] = {}
+        _add_ytd_delta(ytd_deltas, previous_key, old_amounts, None)
+        _add_ytd_delta(ytd_deltas, new_key, None, new_amounts)
+        _apply_ytd_deltas(db, ytd_deltas)
+    if old_amounts is not None or new_amounts is not None:
+        _refresh_cost_cubes(db, [previous_key, new_key])
     db.commit()
+    payslip_pdf_cache.invalidate([db_payroll.id])
     db.refresh(db_payroll)
-    return db_payroll
\ No newline at end of file
+    return db_payroll
+
+def add_retro_amounts(values: Dict[str, Any], delta: Dict[str, float]) -> Dict[str, Any]:
+    """Bulletin augmenté de rappels (delta par montant de RETRO_BREAKDOWN_CODES), détail « rappel_* » compris"""
+    breakdown = dict(values.get("salary_breakdown") or {})
+    for field, code in RETRO_BREAKDOWN_CODES.items():
+        breakdown[code] = round((breakdown.get(code) or 0) + delta[field], 2)
+    breakdown["cnss_employer"] = round((breakdown.get("cnss_employer") or 0) + delta["cnss_employer"], 2)
+    if "cout_total" in breakdown:
+        breakdown["cout_total"] = round((breakdown["cout_total"] or 0) + delta["gross_salary"] + delta["cnss_employer"], 2)
+
+    adjusted = {
+        "gross_salary": delta["gross_salary"],
+        "taxable_income": delta["gross_salary"] - delta["cnss_employee"],
+        "social_contributions": delta["cnss_employee"],
+        "tax_amount": delta["irpp"],
+        "net_salary": delta["net_salary"]
+    }
+    return {
+        **values,
+        **{column: round((values[column] or 0) + amount, 2) for column, amount in adjusted.items() if column in values},
+        "salary_breakdown": breakdown
+    }
+
+def _merge_applied_retro(db: Session, unique_records: Dict[tuple, Dict[str, Any]], existing: Dict[tuple, Dict[str, Any]]):
+    """Reporter sur les bulletins recalculés les rappels qu'ils avaient déjà versés
+
+    Un bulletin recalculé arrive sans détail « rappel_* » : sans ce report, les rappels marqués
+    versés disparaîtraient de la paie sans jamais être réémis.
+    """
+    recalculated = {
+        previous["id"]: key
+        for key, previous in existing.items()
+        if "salary_breakdown" in unique_records[key]
+        and not set(RETRO_BREAKDOWN_CODES.values()) & set(unique_records[key]["salary_breakdown"] or {})
+    }
+    record_ids = list(recalculated)
+    adjustment = models.PayrollRetroAdjustment
+    for start in range(0, len(record_ids), UPSERT_BATCH_SIZE):
+        applied = db.query(
+            adjustment.applied_record_id,
+            *(func.sum(getattr(adjustment, field)) for field in RETRO_BREAKDOWN_CODES)
+        ).filter(
+            adjustment.applied_record_id.in_(record_ids[start:start + UPSERT_BATCH_SIZE]),
+            adjustment.status == "applied"
+        ).group_by(adjustment.applied_record_id).all()
+        for record_id, *amounts in applied:
+            row = unique_records[recalculated[record_id]]
+            row.update(add_retro_amounts(row, dict(zip(RETRO_BREAKDOWN_CODES, (amount or 0 for amount in amounts)))))
+
+def _upsert_statement(
+    db: Session,
+    table,
+    rows: List[Dict[str, Any]],
+    update_columns: List[str],
+    index_elements: List[str] = ("employee_id", "period"),
+    increment_columns: List[str] = ()
+):
+    """INSERT multi-lignes avec mise à jour sur la clé unique, selon le SGBD
+
+    Les colonnes de increment_columns sont ajoutées à la valeur existante au lieu de la remplacer.
+    """
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "mysql":
+        stmt = mysql_insert(table).values(rows)
+        new_values = stmt.inserted
+    else:
+        insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        stmt = insert(table).values(rows)
+        new_values = stmt.excluded
+
+    values = {col: new_values[col] for col in update_columns}
+    values.update({col: table.c[col] + new_values[col] for col in increment_columns})
+
+    if dialect == "mysql":
+        return stmt.on_duplicate_key_update(**values)
+    return stmt.on_conflict_do_update(index_elements=list(index_elements), set_=values)
+
+def _ytd_amounts(values: Dict[str, Any]) -> Optional[tuple]:
+    """Montants d'un bulletin pour les cumuls annuels (None s'il n'est ni validé ni payé)"""
+    if values.get("status") not in YTD_STATUSES:
+        return None
+    breakdown = values.get("salary_breakdown") or {}
+    return (
+        values.get("gross_salary") or 0,
+        values.get("taxable_income") or 0,
+        values.get("social_contributions") or 0,
+        breakdown.get("cnss_employer") or 0,
+        values.get("tax_amount") or 0,
+        values.get("net_salary") or 0
+    )
+
+def _record_ytd_values(record: models.PayrollRecord) -> Dict[str, Any]:
+    """Valeurs d'un bulletin ORM au format attendu par _ytd_amounts"""
+    return {
+        "status": record.status,
+        "gross_salary": record.gross_salary,
+        "taxable_income": record.taxable_income,
+        "social_contributions": record.social_contributions,
+        "tax_amount": record.tax_amount,
+        "net_salary": record.net_salary,
+        "salary_breakdown": record.salary_breakdown
+    }
+
+def _add_ytd_delta(deltas: Dict[tuple, list], key: tuple, old_amounts: Optional[tuple], new_amounts: Optional[tuple]):
+    """Ajouter à deltas l'écart de cumul annuel d'un bulletin (employee_id, period) remplacé"""
+    delta = deltas.setdefault((key[0], int(key[1][:4])), [0] * (len(YTD_FIELDS) + 1))
+    for position, amount in enumerate(new_amounts or ()):
+        delta[position] += amount
+    for position, amount in enumerate(old_amounts or ()):
+        delta[position] -= amount
+    delta[-1] += (new_amounts is not None) - (old_amounts is not None)
+
+def _apply_ytd_deltas(db: Session, deltas: Dict[tuple, list]):
+    """Ajouter des écarts aux cumuls annuels : deltas = {(employee_id, year): [montants..., nb_mois]}"""
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    employee_ids = {employee_id for employee_id, _ in deltas}
+    companies = dict(db.query(models.Employee.id, models.Employee.company_id).filter(
+        models.Employee.id.in_(employee_ids)
+    ).all())
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "company_id": companies.get(employee_id),
+            "employee_id": employee_id,
+            "year": year,
+            **dict(zip(YTD_FIELDS, delta[:-1])),
+            "periods_count": delta[-1],
+            "updated_at": now
+        }
+        for (employee_id, year), delta in deltas.items()
+    ]
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        db.execute(_upsert_statement(
+            db, models.PayrollYTDLedger.__table__, rows[start:start + UPSERT_BATCH_SIZE],
+            ["updated_at"],
+            index_elements=("employee_id", "year"),
+            increment_columns=list(YTD_FIELDS) + ["periods_count"]
+        ))
+
+def _intern_breakdown_keys(db: Session, keys: Iterable[BreakdownKey]) -> Dict[BreakdownKey, int]:
+    """Identifiants des clés de détail, créées au besoin (insertion idempotente)"""
+    keys = sorted(set(keys))
+    columns = ("code", "detailed", "name", "variable_type", "calculation_method")
+    table = models.PayrollBreakdownKey.__table__
+    key_ids: Dict[BreakdownKey, int] = {}
+    for start in range(0, len(keys), UPSERT_BATCH_SIZE):
+        chunk = keys[start:start + UPSERT_BATCH_SIZE]
+        codes = {key[0] for key in chunk}
+        known = {
+            tuple(row[1:]): row[0]
+            for row in db.query(
+                models.PayrollBreakdownKey.id,
+                *(getattr(models.PayrollBreakdownKey, column) for column in columns)
+            ).filter(models.PayrollBreakdownKey.code.in_(codes)).all()
+        }
+        missing = [dict(zip(columns, key)) for key in chunk if key not in known]
+        if missing:
+            # Une écriture concurrente peut créer la même clé : le doublon est ignoré puis relu
+            db.execute(_upsert_statement(db, table, missing, ["code"], index_elements=columns))
+            known.update(
+                (tuple(row[1:]), row[0])
+                for row in db.query(
+                    models.PayrollBreakdownKey.id,
+                    *(getattr(models.PayrollBreakdownKey, column) for column in columns)
+                ).filter(models.PayrollBreakdownKey.code.in_(codes)).all()
+            )
+        key_ids.update((key, known[key]) for key in chunk)
+    return key_ids
+
+def _replace_breakdown_lines(db: Session, breakdown_lines: Dict[int, list]):
+    """Remplacer les lignes de détail des bulletins {record_id: [(clé, centimes)]}"""
+    key_ids = _intern_breakdown_keys(db, (key for lines in breakdown_lines.values() for key, _ in lines))
+
+    record_ids = list(breakdown_lines)
+    for start in range(0, len(record_ids), UPSERT_BATCH_SIZE):
+        chunk = record_ids[start:start + UPSERT_BATCH_SIZE]
+        db.query(models.PayrollBreakdownLine).filter(
+            models.PayrollBreakdownLine.record_id.in_(chunk)
+        ).delete(synchronize_session=False)
+
+        lines = [
+            {"record_id": record_id, "key_id": key_ids[key], "position": position, "amount": amount}
+            for record_id in chunk
+            for position, (key, amount) in enumerate(breakdown_lines[record_id])
+        ]
+        if lines:
+            db.execute(models.PayrollBreakdownLine.__table__.insert(), lines)
+
+def _record_ids(db: Session, keys: List[tuple]) -> Dict[tuple, int]:
+    """Identifiants des bulletins {(employee_id, period): id}"""
+    record_ids = {}
+    for start in range(0, len(keys), UPSERT_BATCH_SIZE):
+        record_ids.update(
+            ((employee_id, period), record_id)
+            for record_id, employee_id, period in db.query(
+                models.PayrollRecord.id,
+                models.PayrollRecord.employee_id,
+                models.PayrollRecord.period
+            ).filter(
+                tuple_(models.PayrollRecord.employee_id, models.PayrollRecord.period).in_(
+                    keys[start:start + UPSERT_BATCH_SIZE]
+                )
+            ).all()
+        )
+    return record_ids
+
+def load_breakdowns(db: Session, breakdown_json: Dict[int, Any]) -> Dict[int, Any]:
+    """Détails au format historique de bulletins {record_id: reste JSON} (une requête par lot)"""
+    record_ids = list(breakdown_json)
+    lines: Dict[int, list] = {}
+    for start in range(0, len(record_ids), UPSERT_BATCH_SIZE):
+        rows = db.query(
+            models.PayrollBreakdownLine.record_id,
+            models.PayrollBreakdownLine.amount,
+            models.PayrollBreakdownKey.code,
+            models.PayrollBreakdownKey.detailed,
+            models.PayrollBreakdownKey.name,
+            models.PayrollBreakdownKey.variable_type,
+            models.PayrollBreakdownKey.calculation_method
+        ).join(
+            models.PayrollBreakdownKey, models.PayrollBreakdownKey.id == models.PayrollBreakdownLine.key_id
+        ).filter(
+            models.PayrollBreakdownLine.record_id.in_(record_ids[start:start + UPSERT_BATCH_SIZE])
+        ).order_by(models.PayrollBreakdownLine.record_id, models.PayrollBreakdownLine.position).all()
+        for record_id, amount, *key in rows:
+            lines.setdefault(record_id, []).append((tuple(key), amount))
+
+    return {
+        record_id: join_breakdown(lines[record_id], leftover) if record_id in lines else leftover
+        for record_id, leftover in breakdown_json.items()
+    }
+
+def compact_payroll_breakdowns(db: Session, batch_size: int = UPSERT_BATCH_SIZE) -> int:
+    """Convertir en lignes compactes les détails encore stockés en JSON ; retourne le nombre de bulletins traités"""
+    has_lines = db.query(models.PayrollBreakdownLine.record_id).filter(
+        models.PayrollBreakdownLine.record_id == models.PayrollRecord.id
+    ).exists()
+
+    compacted = 0
+    last_id = 0
+    while True:
+        records = db.query(models.PayrollRecord.id, models.PayrollRecord.breakdown_json).filter(
+            models.PayrollRecord.id > last_id,
+            models.PayrollRecord.breakdown_json.isnot(None),
+            ~has_lines
+        ).order_by(models.PayrollRecord.id).limit(batch_size).all()
+        if not records:
+            return compacted
+        last_id = records[-1].id
+
+        breakdown_lines = {}
+        for record_id, breakdown in records:
+            lines, leftover = split_breakdown(breakdown)
+            if not lines:
+                continue
+            breakdown_lines[record_id] = lines
+            db.query(models.PayrollRecord).filter(models.PayrollRecord.id == record_id).update(
+                {models.PayrollRecord.breakdown_json: leftover}, synchronize_session=False
+            )
+        _replace_breakdown_lines(db, breakdown_lines)
+        db.commit()
+        compacted += len(breakdown_lines)
+
+def get_breakdown_totals(db: Session, company_id: int, period: str) -> List[Dict[str, Any]]:
+    """Totaux par variable d'une période, calculés en SQL sur les lignes compactes"""
+    rows = db.query(
+        models.PayrollBreakdownKey.code,
+        func.max(models.PayrollBreakdownKey.name),
+        func.sum(models.PayrollBreakdownLine.amount),
+        func.count(models.PayrollBreakdownLine.record_id)
+    ).join(
+        models.PayrollBreakdownLine, models.PayrollBreakdownLine.key_id == models.PayrollBreakdownKey.id
+    ).join(
+        models.PayrollRecord, models.PayrollRecord.id == models.PayrollBreakdownLine.record_id
+    ).join(
+        models.Employee, models.Employee.id == models.PayrollRecord.employee_id
+    ).filter(
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period == period
+    ).group_by(models.PayrollBreakdownKey.code).order_by(models.PayrollBreakdownKey.code).all()
+
+    return [
+        {"code": code, "name": name or code, "total": from_minor_units(int(total or 0)), "records_count": count}
+        for code, name, total, count in rows
+    ]
+
+def upsert_payroll_records(db: Session, records: List[Dict[str, Any]], commit: bool = True) -> Dict[str, int]:
+    """Insérer ou mettre à jour des bulletins en quelques instructions ; retourne inserted/updated
+
+    Tous les enregistrements doivent avoir les mêmes colonnes ; en cas de doublon
+    (employee_id, period) dans la liste, le dernier l'emporte. Les cumuls annuels
+    (payroll_ytd_ledger) sont mis à jour dans la même transaction ; les rappels déjà
+    versés sur un bulletin recalculé y sont reportés.
+    """
+    if not records:
+        return {"inserted": 0, "updated": 0}
+
+    now = datetime.utcnow()
+    unique_records: Dict[tuple, Dict[str, Any]] = {}
+    for record in records:
+        row = dict(record)
+        row.setdefault("created_at", now)
+        row["updated_at"] = now
+        unique_records[(row["employee_id"], row["period"])] = row
+    rows = list(unique_records.values())
+
+    columns = set(rows[0])
+    if any(set(row) != columns for row in rows):
+        raise ValueError("Tous les enregistrements de paie doivent avoir les mêmes colonnes")
+    update_columns = sorted(columns - {"employee_id", "period", "created_at"})
+
+    # Une requête pour distinguer insertions et mises à jour, et connaître les montants remplacés
+    keys = list(unique_records)
+    check_periods_open(db, keys)
+    existing: Dict[tuple, Dict[str, Any]] = {}
+    for start in range(0, len(keys), UPSERT_BATCH_SIZE):
+        previous = db.query(
+            models.PayrollRecord.employee_id,
+            models.PayrollRecord.period,
+            models.PayrollRecord.status,
+            models.PayrollRecord.gross_salary,
+            models.PayrollRecord.taxable_income,
+            models.PayrollRecord.social_contributions,
+            models.PayrollRecord.tax_amount,
+            models.PayrollRecord.net_salary,
+            models.PayrollRecord.id,
+            models.PayrollRecord.breakdown_json
+        ).filter(
+            tuple_(models.PayrollRecord.employee_id, models.PayrollRecord.period).in_(
+                keys[start:start + UPSERT_BATCH_SIZE]
+            )
+        ).all()
+        breakdowns = load_breakdowns(db, {record.id: record.breakdown_json for record in previous})
+        for record in previous:
+            existing[(record.employee_id, record.period)] = {
+                **record._asdict(), "salary_breakdown": breakdowns[record.id]
+            }
+    _merge_applied_retro(db, unique_records, existing)
+
+    # Cumuls annuels : écart entre le bulletin remplacé et le nouveau, s'ils sont validés
+    ytd_deltas: Dict[tuple, list] = {}
+    # Périodes dont les bulletins validés changent : seul leur cube est rafraîchi
+    validated_keys = set()
+    for key, row in unique_records.items():
+        previous = existing.get(key, {})
+        old_amounts = _ytd_amounts(previous)
+        new_amounts = _ytd_amounts({"status": "draft", **previous, **row})
+        if old_amounts == new_amounts:
+            continue
+        validated_keys.add(key)
+        _add_ytd_delta(ytd_deltas, key, old_amounts, new_amounts)
+
+    # Détail : les montants partent en lignes compactes, seul le reste non numérique reste en JSON
+    breakdown_lines: Dict[tuple, list] = {}
+    if "salary_breakdown" in columns:
+        for key, row in unique_records.items():
+            breakdown_lines[key], row["salary_breakdown"] = split_breakdown(row["salary_breakdown"])
+
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        db.execute(_upsert_statement(
+            db, models.PayrollRecord.__table__, rows[start:start + UPSERT_BATCH_SIZE], update_columns
+        ))
+    if breakdown_lines:
+        record_ids = _record_ids(db, list(breakdown_lines))
+        _replace_breakdown_lines(db, {record_ids[key]: lines for key, lines in breakdown_lines.items()})
+    _apply_ytd_deltas(db, ytd_deltas)
+    _refresh_cost_cubes(db, validated_keys)
+
+    if commit:
+        db.commit()
+    # Bulletins réécrits (dont revalidés) : leurs PDF en cache ne servent plus
+    payslip_pdf_cache.invalidate(previous["id"] for previous in existing.values())
+
+    return {"inserted": len(rows) - len(existing), "updated": len(existing)}
+
+def get_cached_payroll_results(db: Session, period: str, employee_ids: List[int]) -> Dict[int, tuple]:
+    """Résultats mémorisés d'une période : {employee_id: (input_hash, result)}"""
+    cached = {}
+    employee_ids = list(employee_ids)
+    for start in range(0, len(employee_ids), UPSERT_BATCH_SIZE):
+        rows = db.query(
+            models.PayrollResultCache.employee_id,
+            models.PayrollResultCache.input_hash,
+            models.PayrollResultCache.result
+        ).filter(
+            models.PayrollResultCache.period == period,
+            models.PayrollResultCache.employee_id.in_(employee_ids[start:start + UPSERT_BATCH_SIZE])
+        ).all()
+        for employee_id, input_hash, result in rows:
+            cached[employee_id] = (input_hash, result)
+    return cached
+
+def upsert_payroll_results(db: Session, company_id: int, period: str, entries: Dict[int, tuple], commit: bool = True):
+    """Mémoriser des résultats de paie : entries = {employee_id: (input_hash, result)}"""
+    if not entries:
+        return
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "company_id": company_id,
+            "employee_id": employee_id,
+            "period": period,
+            "input_hash": input_hash,
+            "result": result,
+            "created_at": now,
+            "updated_at": now
+        }
+        for employee_id, (input_hash, result) in entries.items()
+    ]
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        db.execute(_upsert_statement(
+            db, models.PayrollResultCache.__table__, rows[start:start + UPSERT_BATCH_SIZE],
+            ["input_hash", "result", "updated_at"]
+        ))
+
+    if commit:
+        db.commit()
+
+def get_ytd_ledger(db: Session, employee_id: int, year: int) -> Optional[models.PayrollYTDLedger]:
+    return db.query(models.PayrollYTDLedger).filter(
+        models.PayrollYTDLedger.employee_id == employee_id,
+        models.PayrollYTDLedger.year == year
+    ).first()
+
+def get_company_ytd_ledger(db: Session, company_id: int, year: int) -> List[models.PayrollYTDLedger]:
+    return db.query(models.PayrollYTDLedger).filter(
+        models.PayrollYTDLedger.company_id == company_id,
+        models.PayrollYTDLedger.year == year,
+        models.PayrollYTDLedger.periods_count > 0
+    ).order_by(models.PayrollYTDLedger.employee_id).all()
+
+def rebuild_ytd_ledger(db: Session, year: int, commit: bool = True) -> int:
+    """Recalculer les cumuls d'une année depuis les bulletins (reprise de l'existant) ; retourne le nombre de lignes"""
+    db.query(models.PayrollYTDLedger).filter(models.PayrollYTDLedger.year == year).delete(synchronize_session=False)
+
+    records = db.query(
+        models.PayrollRecord.employee_id,
+        models.PayrollRecord.status,
+        models.PayrollRecord.gross_salary,
+        models.PayrollRecord.taxable_income,
+        models.PayrollRecord.social_contributions,
+        models.PayrollRecord.tax_amount,
+        models.PayrollRecord.net_salary,
+        models.PayrollRecord.id,
+        models.PayrollRecord.breakdown_json
+    ).filter(
+        # Bornes plutôt que LIKE : seules les partitions de l'année sont lues
+        models.PayrollRecord.period.between(f"{year}-01", f"{year}-12"),
+        models.PayrollRecord.status.in_(YTD_STATUSES)
+    ).order_by(models.PayrollRecord.id).all()
+
+    deltas: Dict[tuple, list] = {}
+    for start in range(0, len(records), UPSERT_BATCH_SIZE):
+        chunk = records[start:start + UPSERT_BATCH_SIZE]
+        breakdowns = load_breakdowns(db, {record.id: record.breakdown_json for record in chunk})
+        for record in chunk:
+            delta = deltas.setdefault((record.employee_id, year), [0] * (len(YTD_FIELDS) + 1))
+            values = {**record._asdict(), "salary_breakdown": breakdowns[record.id]}
+            for position, amount in enumerate(_ytd_amounts(values)):
+                delta[position] += amount
+            delta[-1] += 1
+    _apply_ytd_deltas(db, deltas)
+
+    if commit:
+        db.commit()
+    return len(deltas)
+
+def get_payroll_periods(db: Session, company_id: int) -> List[Dict[str, Any]]:
+    """Périodes de l'entreprise : nombre de bulletins, bulletins validés ou payés, statut de clôture"""
+    counts = db.query(
+        models.PayrollRecord.period,
+        func.count(models.PayrollRecord.id),
+        func.sum(case((models.PayrollRecord.status.in_(YTD_STATUSES), 1), else_=0))
+    ).join(models.Employee, models.Employee.id == models.PayrollRecord.employee_id).filter(
+        models.Employee.company_id == company_id
+    ).group_by(models.PayrollRecord.period).all()
+    closures = {
+        closure.period: closure
+        for closure in db.query(models.PayrollPeriod).filter(models.PayrollPeriod.company_id == company_id).all()
+    }
+
+    periods = {
+        period: {"period": period, "records_count": count, "validated_count": int(validated or 0)}
+        for period, count, validated in counts
+    }
+    for period, closure in closures.items():
+        periods.setdefault(period, {"period": period, "records_count": 0, "validated_count": 0})
+    for period, summary in periods.items():
+        closure = closures.get(period)
+        summary["status"] = closure.status if closure else "open"
+        summary["closed_at"] = closure.closed_at.isoformat() if closure and closure.closed_at else None
+    return sorted(periods.values(), key=lambda summary: summary["period"], reverse=True)
+
+def is_period_closed(db: Session, company_id: int, period: str) -> bool:
+    return db.query(models.PayrollPeriod.id).filter(
+        models.PayrollPeriod.company_id == company_id,
+        models.PayrollPeriod.period == period,
+        models.PayrollPeriod.status == "closed"
+    ).first() is not None
+
+def set_payroll_period_status(
+    db: Session,
+    company_id: int,
+    period: str,
+    status: str,
+    user_id: Optional[int] = None,
+    commit: bool = True
+) -> models.PayrollPeriod:
+    """Clôturer (status="closed") ou rouvrir (status="open") une période de paie"""
+    closure = db.query(models.PayrollPeriod).filter(
+        models.PayrollPeriod.company_id == company_id,
+        models.PayrollPeriod.period == period
+    ).first()
+    if not closure:
+        closure = models.PayrollPeriod(company_id=company_id, period=period)
+        db.add(closure)
+
+    closure.status = status
+    closure.closed_at = datetime.utcnow() if status == "closed" else None
+    closure.closed_by_id = user_id if status == "closed" else None
+    if status == "closed":
+        # Agrégats figés avec la période (brouillons compris)
+        refresh_cost_cube(db, company_id, period)
+
+    if commit:
+        db.commit()
+        db.refresh(closure)
+    return closure
+
+def count_unvalidated_records(db: Session, company_id: int, period: str) -> int:
+    """Bulletins de la période ni validés ni payés"""
+    return db.query(func.count(models.PayrollRecord.id)).join(
+        models.Employee, models.Employee.id == models.PayrollRecord.employee_id
+    ).filter(
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period == period,
+        ~models.PayrollRecord.status.in_(YTD_STATUSES)
+    ).scalar()
+
+def refresh_cost_cube(db: Session, company_id: int, period: str):
+    """Recalculer les agrégats (payroll_cost_cube) d'une période de l'entreprise, en une requête
+
+    Appelé à la validation de bulletins et à la clôture de la période ; les brouillons
+    ne sont comptés qu'à ces moments-là.
+    """
+    employer_code = models.PayrollBreakdownKey.code == "cnss_employer"
+    employer = db.query(
+        models.PayrollBreakdownLine.record_id.label("record_id"),
+        func.sum(models.PayrollBreakdownLine.amount).label("amount")
+    ).join(
+        models.PayrollBreakdownKey, models.PayrollBreakdownKey.id == models.PayrollBreakdownLine.key_id
+    ).join(
+        models.PayrollRecord, models.PayrollRecord.id == models.PayrollBreakdownLine.record_id
+    ).join(
+        models.Employee, models.Employee.id == models.PayrollRecord.employee_id
+    ).filter(
+        # Seules les lignes des bulletins de la période sont agrégées, pas toute la table
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period == period,
+        employer_code
+    ).group_by(models.PayrollBreakdownLine.record_id).subquery()
+
+    rows = db.query(
+        func.coalesce(models.Employee.department_id, 0),
+        func.max(models.Department.name),
+        func.count(models.PayrollRecord.id),
+        func.sum(case((models.PayrollRecord.status.in_(YTD_STATUSES), 1), else_=0)),
+        func.sum(case((models.PayrollRecord.status == "draft", 1), else_=0)),
+        func.sum(models.PayrollRecord.gross_salary),
+        func.sum(models.PayrollRecord.net_salary),
+        func.sum(models.PayrollRecord.social_contributions),
+        func.sum(employer.c.amount),
+        func.sum(models.PayrollRecord.tax_amount)
+    ).join(
+        models.Employee, models.Employee.id == models.PayrollRecord.employee_id
+    ).outerjoin(
+        models.Department, models.Department.id == models.Employee.department_id
+    ).outerjoin(
+        employer, employer.c.record_id == models.PayrollRecord.id
+    ).filter(
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period == period
+    ).group_by(func.coalesce(models.Employee.department_id, 0)).all()
+
+    db.query(models.PayrollCostCube).filter(
+        models.PayrollCostCube.company_id == company_id,
+        models.PayrollCostCube.period == period
+    ).delete(synchronize_session=False)
+
+    now = datetime.utcnow()
+    cube = [
+        {
+            "company_id": company_id,
+            "period": period,
+            "department_id": department_id,
+            "department_name": department_name or "Non assigné",
+            "headcount": headcount,
+            "validated_count": int(validated or 0),
+            "draft_count": int(drafts or 0),
+            "gross_salary": float(gross or 0),
+            "net_salary": float(net or 0),
+            "cnss_employee": float(cnss_employee or 0),
+            "cnss_employer": from_minor_units(int(cnss_employer or 0)),
+            "irpp": float(irpp or 0),
+            "refreshed_at": now
+        }
+        for department_id, department_name, headcount, validated, drafts, gross, net, cnss_employee, cnss_employer, irpp in rows
+    ]
+    if cube:
+        db.execute(models.PayrollCostCube.__table__.insert(), cube)
+
+def _refresh_cost_cubes(db: Session, keys: Iterable[tuple]):
+    """Rafraîchir le cube des (entreprise, période) touchées par des bulletins (employee_id, period)"""
+    keys = set(keys)
+    employee_ids = {employee_id for employee_id, _ in keys}
+    companies = dict(
+        db.query(models.Employee.id, models.Employee.company_id).filter(models.Employee.id.in_(employee_ids)).all()
+    )
+    for company_id, period in sorted({(companies[employee_id], period) for employee_id, period in keys if employee_id in companies}):
+        refresh_cost_cube(db, company_id, period)
+
+def get_period_stats(db: Session, company_id: int, period: str) -> Dict[str, Any]:
+    """Compteurs et total net d'une période, lus en direct (une requête d'agrégat, sans charger les bulletins)"""
+    headcount, validated, drafts, net = db.query(
+        func.count(models.PayrollRecord.id),
+        func.sum(case((models.PayrollRecord.status.in_(YTD_STATUSES), 1), else_=0)),
+        func.sum(case((models.PayrollRecord.status == "draft", 1), else_=0)),
+        func.sum(models.PayrollRecord.net_salary)
+    ).join(models.Employee, models.Employee.id == models.PayrollRecord.employee_id).filter(
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period == period
+    ).one()
+    return {
+        "headcount": headcount,
+        "validated_count": int(validated or 0),
+        "draft_count": int(drafts or 0),
+        "net_salary": float(net or 0)
+    }
+
+def get_cost_cube(db: Session, company_id: int, period: str) -> List[models.PayrollCostCube]:
+    return db.query(models.PayrollCostCube).filter(
+        models.PayrollCostCube.company_id == company_id,
+        models.PayrollCostCube.period == period
+    ).order_by(models.PayrollCostCube.department_name).all()
+
+def get_cost_cube_by_period(db: Session, company_id: int, limit: int = 12) -> List[Dict[str, Any]]:
+    """Totaux du cube par période (les plus récentes d'abord)"""
+    rows = db.query(
+        models.PayrollCostCube.period,
+        func.sum(models.PayrollCostCube.headcount),
+        func.sum(models.PayrollCostCube.validated_count),
+        func.sum(models.PayrollCostCube.draft_count),
+        func.sum(models.PayrollCostCube.gross_salary),
+        func.sum(models.PayrollCostCube.net_salary),
+        func.sum(models.PayrollCostCube.cnss_employee),
+        func.sum(models.PayrollCostCube.cnss_employer),
+        func.sum(models.PayrollCostCube.irpp)
+    ).filter(
+        models.PayrollCostCube.company_id == company_id,
+        models.PayrollCostCube.period.like("____-__")
+    ).group_by(models.PayrollCostCube.period).order_by(models.PayrollCostCube.period.desc()).limit(limit).all()
+
+    fields = ("headcount", "validated_count", "draft_count", "gross_salary", "net_salary", "cnss_employee", "cnss_employer", "irpp")
+    return [
+        {"period": period, **{field: value or 0 for field, value in zip(fields, totals)}}
+        for period, *totals in rows
+    ]
+
+# Montants du détail repris dans l'export comptable
+ACCOUNTING_BREAKDOWN_CODES = ("cnss_employee", "cnss_employer", "cout_total")
+
+def iter_accounting_rows(
+    db: Session,
+    company_id: int,
+    period: str,
+    batch_size: int = UPSERT_BATCH_SIZE,
+    statuses: Optional[Iterable[str]] = None
+):
+    """Lignes de l'export comptable, lues par lots avec un curseur serveur
+
+    Projection jointe des seules colonnes utiles : (employé, brut, CNSS employé, IRPP,
+    net, CNSS patronale, coût total), sans charger les objets PayrollRecord.
+    """
+    amounts = db.query(
+        models.PayrollBreakdownLine.record_id.label("record_id"),
+        *(
+            func.sum(case((models.PayrollBreakdownKey.code == code, models.PayrollBreakdownLine.amount))).label(code)
+            for code in ACCOUNTING_BREAKDOWN_CODES
+        )
+    ).join(
+        models.PayrollBreakdownKey, models.PayrollBreakdownKey.id == models.PayrollBreakdownLine.key_id
+    ).join(
+        models.PayrollRecord, models.PayrollRecord.id == models.PayrollBreakdownLine.record_id
+    ).join(
+        models.Employee, models.Employee.id == models.PayrollRecord.employee_id
+    ).filter(
+        # Seules les lignes des bulletins exportés sont agrégées, pas toute la table
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period == period,
+        models.PayrollBreakdownKey.code.in_(ACCOUNTING_BREAKDOWN_CODES)
+    ).group_by(models.PayrollBreakdownLine.record_id).subquery()
+
+    rows = db.query(
+        models.Employee.name,
+        models.PayrollRecord.gross_salary,
+        models.PayrollRecord.tax_amount,
+        models.PayrollRecord.net_salary,
+        models.PayrollRecord.breakdown_json,
+        *(amounts.c[code] for code in ACCOUNTING_BREAKDOWN_CODES)
+    ).join(
+        models.Employee, models.Employee.id == models.PayrollRecord.employee_id
+    ).outerjoin(
+        amounts, amounts.c.record_id == models.PayrollRecord.id
+    ).filter(
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period == period,
+        *([models.PayrollRecord.status.in_(list(statuses))] if statuses else [])
+    ).order_by(models.PayrollRecord.id).execution_options(stream_results=True, yield_per=batch_size)
+
+    for name, gross, tax, net, leftover, *minor_amounts in rows:
+        # Bulletins pas encore compactés : montants restés dans le JSON
+        leftover = leftover or {}
+        cnss_employee, cnss_employer, total_cost = (
+            from_minor_units(int(amount)) if amount is not None else leftover.get(code, 0)
+            for code, amount in zip(ACCOUNTING_BREAKDOWN_CODES, minor_amounts)
+        )
+        yield name, gross, cnss_employee, tax, net, cnss_employer, total_cost
@@ -2,11 +2,12 @@ import enum
 from datetime import datetime
 
 from sqlalchemy import (
-    Column, Integer, String, Boolean, Date, DateTime, Float, Enum as SAEnum,
-    Text, ForeignKey, JSON
+    Column, Integer, BigInteger, SmallInteger, String, Boolean, Date, DateTime, Float, Enum as SAEnum,
+    Text, ForeignKey, JSON, UniqueConstraint
 )
 from sqlalchemy.orm import relationship
 from .database import Base
+from app.core.payroll_breakdown import join_breakdown
 
 # --- Enums ---
 class RoleEnum(str, enum.Enum):
@@ -349,6 +350,10 @@ class CandidateAttachment(Base):
 
 class PayrollRecord(Base):
     __tablename__ = "payroll_records"
+    __table_args__ = (
+        # Un seul bulletin par employé et par période (clé des upserts)
+        UniqueConstraint("employee_id", "period", name="uq_payroll_records_employee_period"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
     period = Column(String(7), nullable=False)  # YYYY-MM
@@ -362,8 +367,9 @@ class PayrollRecord(Base):
     social_contributions = Column(Float, default=0)
     net_salary = Column(Float, nullable=False)
     
-    # Détail des variables (JSON)
-    salary_breakdown = Column(JSON)  # Détail de chaque variable
+    # Détail des variables : lignes compactes (payroll_breakdown_lines)
+    # + JSON pour les valeurs non numériques et les bulletins pas encore compactés
+    breakdown_json = Column("salary_breakdown", JSON)
     
     status = Column(String(50), default="draft")  # draft, validated, paid
     processed_date = Column(DateTime)
@@ -380,6 +386,160 @@ class PayrollRecord(Base):
     employee = relationship("Employee")
     processed_by = relationship("User", foreign_keys=[processed_by_id])
     validated_by = relationship("User", foreign_keys=[validated_by_id])
+    breakdown_lines = relationship(
+        "PayrollBreakdownLine",
+        lazy="selectin",  # Une requête pour les lignes de tous les bulletins chargés
+        order_by="PayrollBreakdownLine.position",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+    
+    @property
+    def salary_breakdown(self):
+        """Détail au format historique (dict), reconstitué depuis les lignes compactes"""
+        if not self.breakdown_lines:
+            return self.breakdown_json
+        return join_breakdown(((line.key.as_tuple(), line.amount) for line in self.breakdown_lines), self.breakdown_json)
+    
+    @salary_breakdown.setter
+    def salary_breakdown(self, value):
+        # Écriture ORM : stocké en JSON (compacté par upsert_payroll_records ou compact_payroll_breakdowns.py)
+        self.breakdown_json = value
+        self.breakdown_lines = []
+
+class PayrollBreakdownKey(Base):
+    __tablename__ = "payroll_breakdown_keys"
+    __table_args__ = (
+        UniqueConstraint(
+            "code", "detailed", "name", "variable_type", "calculation_method",
+            name="uq_payroll_breakdown_keys"
+        ),
+    )
+    
+    # Clé internée d'une ligne de détail : nom, type et méthode ne sont stockés qu'une fois
+    id = Column(Integer, primary_key=True, index=True)
+    code = Column(String(50), nullable=False)
+    detailed = Column(Boolean, nullable=False, default=False)  # Forme {name, type, value, calculation_method}
+    name = Column(String(100), nullable=False, default="")
+    variable_type = Column(String(20), nullable=False, default="")
+    calculation_method = Column(String(20), nullable=False, default="")
+    
+    def as_tuple(self):
+        return (self.code, self.detailed, self.name, self.variable_type, self.calculation_method)
+
+class PayrollBreakdownLine(Base):
+    __tablename__ = "payroll_breakdown_lines"
+    
+    record_id = Column(Integer, ForeignKey("payroll_records.id", ondelete="CASCADE"), primary_key=True)
+    key_id = Column(Integer, ForeignKey("payroll_breakdown_keys.id"), primary_key=True, index=True)
+    position = Column(SmallInteger, nullable=False, default=0)  # Ordre d'origine dans le détail
+    amount = Column(BigInteger, nullable=False)  # Centimes entiers
+    
+    # Relationships
+    key = relationship("PayrollBreakdownKey", lazy="joined")
+
+class PayrollYTDLedger(Base):
+    __tablename__ = "payroll_ytd_ledger"
+    __table_args__ = (
+        # Cumuls d'un employé pour une année civile
+        UniqueConstraint("employee_id", "year", name="uq_payroll_ytd_ledger_employee_year"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
+    year = Column(Integer, nullable=False)
+    
+    # Cumuls des bulletins validés ou payés de l'année
+    gross_salary = Column(Float, default=0)
+    taxable_income = Column(Float, default=0)
+    cnss_employee = Column(Float, default=0)
+    cnss_employer = Column(Float, default=0)
+    irpp = Column(Float, default=0)
+    net_salary = Column(Float, default=0)
+    periods_count = Column(Integer, default=0)  # Nombre de mois cumulés
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    company = relationship("Company")
+    employee = relationship("Employee")
+
+class PayrollRetroAdjustment(Base):
+    __tablename__ = "payroll_retro_adjustments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False, index=True)
+    source_period = Column(String(7), nullable=False)  # Période recalculée (YYYY-MM)
+    target_period = Column(String(7), nullable=False, index=True)  # Période où le rappel est versé
+    
+    # Écarts (recalcul - bulletin enregistré)
+    gross_salary = Column(Float, default=0)
+    cnss_employee = Column(Float, default=0)
+    cnss_employer = Column(Float, default=0)
+    irpp = Column(Float, default=0)
+    net_salary = Column(Float, default=0)
+    
+    status = Column(String(20), default="pending")  # pending, applied
+    applied_at = Column(DateTime, nullable=True)
+    applied_record_id = Column(Integer, ForeignKey("payroll_records.id"), nullable=True)  # Bulletin qui l'a versé
+    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    company = relationship("Company")
+    employee = relationship("Employee")
+    created_by = relationship("User")
+
+class PayrollPeriod(Base):
+    __tablename__ = "payroll_periods"
+    __table_args__ = (
+        UniqueConstraint("company_id", "period", name="uq_payroll_periods_company_period"),
+    )
+    
+    # Période de paie clôturée : ses bulletins sont figés (corrections via les rappels)
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    period = Column(String(7), nullable=False)  # YYYY-MM
+    status = Column(String(20), default="open")  # open, closed
+    closed_at = Column(DateTime, nullable=True)
+    closed_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    company = relationship("Company")
+    closed_by = relationship("User")
+
+class PayrollCostCube(Base):
+    __tablename__ = "payroll_cost_cube"
+    __table_args__ = (
+        # Une ligne par entreprise, période et département (0 = non assigné)
+        UniqueConstraint("company_id", "period", "department_id", name="uq_payroll_cost_cube_company_period_department"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    period = Column(String(7), nullable=False)  # YYYY-MM
+    department_id = Column(Integer, nullable=False, default=0)
+    department_name = Column(String(100), nullable=False, default="Non assigné")
+    
+    # Agrégats des bulletins de la période
+    headcount = Column(Integer, default=0)
+    validated_count = Column(Integer, default=0)  # Bulletins validés ou payés
+    draft_count = Column(Integer, default=0)
+    gross_salary = Column(Float, default=0)
+    net_salary = Column(Float, default=0)
+    cnss_employee = Column(Float, default=0)
+    cnss_employer = Column(Float, default=0)
+    irpp = Column(Float, default=0)
+    
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    company = relationship("Company")
 
 class AttendanceRecord(Base):
     __tablename__ = "attendance_records"
@@ -921,6 +1081,94 @@ class EmployeePayrollData(Base):
     # Relationships
     employee = relationship("Employee")
 
+class PayrollCalculationJob(Base):
+    __tablename__ = "payroll_calculation_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    calculation_id = Column(String(50), unique=True, nullable=False, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    period = Column(String(7), nullable=False)  # YYYY-MM
+    employee_ids = Column(JSON, nullable=True)  # None = tous les employés actifs
+    
+    status = Column(String(20), default="pending")  # pending, in_progress, completed, failed
+    total_employees = Column(Integer, default=0)
+    completed_employees = Column(Integer, default=0)
+    failed_employees = Column(Integer, default=0)
+    cached_employees = Column(Integer, default=0)  # Résultats mémorisés réutilisés
+    
+    # Résultats (format de calculate_batch_payroll)
+    results = Column(JSON)  # Calculs par employé
+    totals = Column(JSON)
+    errors = Column(JSON)  # [{employee_id, error}]
+    error_message = Column(Text)
+    
+    # Worker qui exécute le job et dernier signe de vie (reprise après arrêt d'un processus)
+    claimed_by = Column(String(32), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    
+    requested_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    company = relationship("Company")
+    requested_by = relationship("User")
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=True, index=True)  # settings_smtp utilisés
+    kind = Column(String(30), nullable=False)  # invitation, password_reset, welcome, payslip
+    to_email = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    html_content = Column(Text, nullable=False)
+    text_content = Column(Text)
+    
+    # Objets liés : statut d'invitation mis à jour, bulletin joint au moment de l'envoi
+    invitation_id = Column(Integer, ForeignKey("invitations.id"), nullable=True, index=True)
+    payroll_record_id = Column(Integer, ForeignKey("payroll_records.id"), nullable=True)
+    
+    status = Column(String(20), default="pending", index=True)  # pending, sending, sent, dead, cancelled
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=6)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    claim_id = Column(String(32), nullable=True, index=True)  # Lot du dispatcher qui envoie le message
+    last_error = Column(Text)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    company = relationship("Company")
+    invitation = relationship("Invitation")
+    payroll_record = relationship("PayrollRecord")
+
+class PayrollResultCache(Base):
+    __tablename__ = "payroll_result_cache"
+    __table_args__ = (
+        # Un résultat mémorisé par employé et par période
+        UniqueConstraint("employee_id", "period", name="uq_payroll_result_cache_employee_period"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
+    period = Column(String(7), nullable=False)  # YYYY-MM
+    
+    input_hash = Column(String(64), nullable=False)  # SHA-256 des entrées du calcul
+    result = Column(JSON, nullable=False)  # Sortie de PayrollCalculator.calculate_employee_payroll
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    company = relationship("Company")
+    employee = relationship("Employee")
+
 # External Integrations Models
 class ExternalIntegration(Base):
     __tablename__ = "external_integrations"
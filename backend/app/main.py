@@ -61,6 +61,20 @@ try:
 except Exception as e:
     logger.warning(f"⚠️ Erreur lors de l'initialisation de la surveillance email: {e}")
 
+# 6. Reprendre les calculs de paie interrompus
+try:
+    from app.services.payroll_jobs import payroll_job_worker
+    payroll_job_worker.resume_pending_jobs()
+except Exception as e:
+    logger.warning(f"⚠️ Erreur lors de la reprise des calculs de paie: {e}")
+
+# 7. Démarrer l'envoi des emails en file (y compris ceux laissés en attente)
+try:
+    from app.services.email_outbox import email_outbox_dispatcher
+    email_outbox_dispatcher.start()
+except Exception as e:
+    logger.warning(f"⚠️ Erreur lors du démarrage de l'envoi des emails: {e}")
+
 # Middleware pour capturer les erreurs
 @app.middleware("http")
 async def catch_exceptions_middleware(request: Request, call_next):
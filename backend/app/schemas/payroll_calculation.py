@@ -41,10 +41,16 @@ class PayrollCalculationResult(BaseModel):
 class PayrollCalculationStatus(BaseModel):
     calculation_id: str
     status: CalculationStatus
+    period: Optional[str] = None
     total_employees: int
     completed_employees: int
     failed_employees: int
+    cached_employees: int = 0  # Servis depuis les résultats mémorisés
+    progress: float = 0
+    eta_seconds: Optional[float] = None
     calculations: List[Dict[str, Any]] = []
+    totals: Optional[Dict[str, float]] = None
+    errors: List[Dict[str, Any]] = []
     started_at: datetime
     completed_at: Optional[datetime] = None
     error_message: Optional[str] = None
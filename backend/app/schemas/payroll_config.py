@@ -103,4 +103,9 @@ class PayrollCalculationResult(BaseModel):
     tax_amount: float
     social_contributions: float
     net_salary: float
-    salary_breakdown: Dict[str, Any]
\ No newline at end of file
+    salary_breakdown: Dict[str, Any]
+
+class PayrollRecalculationRequest(BaseModel):
+    previous_result: PayrollCalculationResult
+    variable_values: Dict[str, float]  # code -> value (valeurs complètes après modification)
+    changed_codes: List[str]  # codes des entrées modifiées dans la grille
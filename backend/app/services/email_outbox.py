@@ -0,0 +1,377 @@
+"""File d'envoi des emails : messages enregistrés dans la transaction de l'endpoint, envoyés par un dispatcher
+
+Le dispatcher réclame les messages dus par lots, respecte un débit maximal par serveur SMTP,
+réessaie les échecs temporaires avec un délai croissant et met de côté (statut « dead ») les
+messages refusés définitivement ou ayant épuisé leurs tentatives.
+"""
+
+import logging
+import random
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.email import email_service
+from app.db import models
+from app.db.database import SessionLocal
+from app.services.payslip_bulk import iter_period_payslips, payslip_filename
+from app.services.payslip_cache import payslip_pdf_cache
+from app.services.pdf_generator import PayslipPDFGenerator
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_STATUSES = ("pending", "sending", "sent", "dead", "cancelled")
+
+# Message resté « sending » plus longtemps (serveur arrêté pendant un lot) : remis en file
+SENDING_TIMEOUT = timedelta(minutes=10)
+
+# Moteur de rendu des bulletins joints (le PDF est mis en cache comme au téléchargement)
+PAYSLIP_ATTACHMENT_RENDERER = "canvas"
+
+
+def enqueue_email(
+    db: Session,
+    to_email: str,
+    subject: str,
+    html_content: str,
+    text_content: Optional[str] = None,
+    kind: str = "generic",
+    company_id: Optional[int] = None,
+    invitation_id: Optional[int] = None,
+    payroll_record_id: Optional[int] = None
+) -> models.EmailOutbox:
+    """Ajouter un email à la file dans la transaction en cours ; le commit reste à l'appelant"""
+    message = models.EmailOutbox(
+        company_id=company_id,
+        kind=kind,
+        to_email=to_email,
+        subject=subject,
+        html_content=html_content,
+        text_content=text_content,
+        invitation_id=invitation_id,
+        payroll_record_id=payroll_record_id,
+        status="pending",
+        attempts=0,
+        max_attempts=settings.EMAIL_MAX_ATTEMPTS,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.add(message)
+    return message
+
+
+def enqueue_payslip_email(
+    db: Session,
+    record_id: int,
+    to_email: str,
+    employee_name: str,
+    period: str,
+    company_id: int,
+    company_name: str
+) -> models.EmailOutbox:
+    """Mettre en file l'envoi d'un bulletin ; le PDF est joint par le dispatcher au moment de l'envoi"""
+    return enqueue_email(
+        db,
+        to_email=to_email,
+        kind="payslip",
+        company_id=company_id,
+        payroll_record_id=record_id,
+        **email_service.compose_payslip_email(employee_name, period, company_name)
+    )
+
+
+def cancel_pending_emails(db: Session, invitation_id: int) -> int:
+    """Annuler les envois pas encore partis d'une invitation (lien remplacé lors d'un renvoi)"""
+    return db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.invitation_id == invitation_id,
+        models.EmailOutbox.status == "pending"
+    ).update({"status": "cancelled"}, synchronize_session=False)
+
+
+def detach_invitation_emails(db: Session, invitation_id: int):
+    """Avant suppression d'une invitation : envois en attente annulés, historique conservé sans le lien"""
+    cancel_pending_emails(db, invitation_id)
+    db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.invitation_id == invitation_id
+    ).update({"invitation_id": None}, synchronize_session=False)
+
+
+def retry_email(db: Session, message: models.EmailOutbox):
+    """Remettre en file un message mis de côté, avec un nouveau jeu de tentatives"""
+    message.status = "pending"
+    message.attempts = 0
+    message.next_attempt_at = datetime.utcnow()
+    if message.invitation and message.invitation.email_status == "failed":
+        message.invitation.email_status = "pending"
+
+
+def outbox_stats(db: Session, company_id: int) -> Dict[str, int]:
+    """Nombre de messages de l'entreprise par statut"""
+    counts = dict(db.query(models.EmailOutbox.status, func.count(models.EmailOutbox.id)).filter(
+        models.EmailOutbox.company_id == company_id
+    ).group_by(models.EmailOutbox.status).all())
+    return {status: counts.get(status, 0) for status in OUTBOX_STATUSES}
+
+
+def retry_delay(attempts: int) -> float:
+    """Délai avant la tentative suivante : base × 2^(tentatives - 1), plafonné, avec un peu d'aléa"""
+    delay = min(settings.EMAIL_RETRY_MAX_SECONDS, settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.0)
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Refus définitif du serveur (code 5xx, destinataire refusé) : inutile de réessayer"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # Identifiants à corriger dans settings_smtp : les tentatives suivantes les reliront
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+class SMTPRateLimiter:
+    """Débit maximal par serveur SMTP : un envoi toutes les 60 / EMAIL_RATE_PER_MINUTE secondes
+
+    La limite s'applique par processus : avec plusieurs workers uvicorn, le débit total est multiplié d'autant.
+    """
+
+    def __init__(self, per_minute: int = None):
+        self.per_minute = per_minute or settings.EMAIL_RATE_PER_MINUTE
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, server: str) -> float:
+        """Réserver le prochain créneau du serveur et l'attendre ; retourne l'attente (secondes)"""
+        interval = 60.0 / self.per_minute
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(server, now))
+            self._next_slot[server] = slot + interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class EmailOutboxDispatcher:
+    """Thread unique qui vide la file ; les messages d'un lot partent en parallèle sur le pool SMTP"""
+
+    def __init__(self, session_factory=SessionLocal, sender=email_service, rate_limiter: SMTPRateLimiter = None,
+                 batch_size: int = None, workers: int = None):
+        self.session_factory = session_factory
+        self.sender = sender
+        self.rate_limiter = rate_limiter or SMTPRateLimiter()
+        self.batch_size = batch_size or settings.EMAIL_DISPATCH_BATCH
+        self.workers = workers or settings.EMAIL_DISPATCH_WORKERS
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Démarrer le dispatcher (démarrage du serveur) : les messages en attente partent au premier lot"""
+        self.wake()
+
+    def wake(self):
+        """Signaler de nouveaux messages, à appeler après le commit de l'endpoint"""
+        self._ensure_thread()
+        self._wake.set()
+
+    def drain(self) -> int:
+        """Envoyer tous les messages dus, dans le thread appelant (scripts et tests) ; retourne leur nombre"""
+        total = 0
+        while True:
+            count = self.drain_once()
+            if not count:
+                return total
+            total += count
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="email-outbox", daemon=True)
+                self._thread.start()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="email-send")
+            return self._executor
+
+    def _loop(self):
+        while True:
+            self._wake.clear()
+            try:
+                count = self.drain_once()
+            except Exception:
+                logger.exception("Erreur inattendue du dispatcher d'emails")
+                count = 0
+            if not count:
+                # Rien de dû : attendre un nouveau message ou la prochaine tentative programmée
+                self._wake.wait(settings.EMAIL_POLL_INTERVAL)
+
+    def drain_once(self) -> int:
+        """Réclamer un lot de messages dus, les envoyer et enregistrer les résultats ; retourne la taille du lot"""
+        db = self.session_factory()
+        try:
+            batch = self._claim(db)
+            if not batch:
+                return 0
+            payloads = self._prepare(db, batch)
+            errors = list(self._get_executor().map(self._deliver, payloads))
+            self._record(db, batch, errors)
+            return len(batch)
+        finally:
+            db.close()
+
+    def _claim(self, db: Session) -> List[models.EmailOutbox]:
+        outbox = models.EmailOutbox
+        now = datetime.utcnow()
+
+        db.query(outbox).filter(
+            outbox.status == "sending",
+            outbox.updated_at < now - SENDING_TIMEOUT
+        ).update({"status": "pending", "claim_id": None}, synchronize_session=False)
+
+        ids = [message_id for (message_id,) in db.query(outbox.id).filter(
+            outbox.status == "pending",
+            outbox.next_attempt_at <= now
+        ).order_by(outbox.next_attempt_at, outbox.id).limit(self.batch_size).all()]
+        if not ids:
+            db.commit()
+            return []
+
+        # Condition sur le statut : les lignes réclamées entre-temps par un autre processus lui restent
+        claim_id = uuid.uuid4().hex
+        db.query(outbox).filter(
+            outbox.id.in_(ids),
+            outbox.status == "pending"
+        ).update({"status": "sending", "claim_id": claim_id, "updated_at": now}, synchronize_session=False)
+        db.commit()
+
+        return db.query(outbox).filter(outbox.claim_id == claim_id).order_by(outbox.id).all()
+
+    def _prepare(self, db: Session, batch: List[models.EmailOutbox]) -> List[Dict[str, Any]]:
+        """Données d'envoi de chaque message, lues dans ce thread (les envois n'utilisent pas la session)"""
+        company_ids = {message.company_id for message in batch if message.company_id}
+        smtp_configs = dict(db.query(models.Company.id, models.Company.settings_smtp).filter(
+            models.Company.id.in_(company_ids)
+        ).all()) if company_ids else {}
+
+        payloads = []
+        for message in batch:
+            smtp_config = smtp_configs.get(message.company_id)
+            server = self.sender.smtp_settings(smtp_config)
+            payload = {
+                "to_email": message.to_email,
+                "subject": message.subject,
+                "html_content": message.html_content,
+                "text_content": message.text_content,
+                "smtp_config": smtp_config,
+                "server": f"{server['host']}:{server['port']}",
+                "payslip": None,
+                "error": None
+            }
+            if message.payroll_record_id:
+                try:
+                    payload["payslip"] = self._payslip(db, message.payroll_record_id)
+                except Exception as e:
+                    payload["error"] = e
+            payloads.append(payload)
+        return payloads
+
+    def _payslip(self, db: Session, record_id: int) -> Dict[str, Any]:
+        record = db.query(
+            models.PayrollRecord.employee_id, models.PayrollRecord.period, models.Employee.company_id
+        ).join(models.Employee, models.Employee.id == models.PayrollRecord.employee_id).filter(
+            models.PayrollRecord.id == record_id
+        ).first()
+        if record is None:
+            raise ValueError(f"Bulletin de paie {record_id} introuvable")
+
+        data = next(iter_period_payslips(db, record.company_id, record.period, employee_ids=[record.employee_id]))
+        return {
+            "record_id": record_id,
+            "data": data,
+            "filename": payslip_filename(record.employee_id, data.get("employee_name"), record.period)
+        }
+
+    def _attachment(self, payslip: Dict[str, Any]) -> tuple:
+        """Bulletin PDF joint : rendu une fois puis lu depuis le cache des téléchargements"""
+        key = payslip_pdf_cache.key(payslip["data"], PAYSLIP_ATTACHMENT_RENDERER)
+        path = payslip_pdf_cache.get_or_render(
+            payslip["record_id"], key,
+            lambda: PayslipPDFGenerator().generate_payslip_pdf(payslip["data"], PAYSLIP_ATTACHMENT_RENDERER).getvalue()
+        )
+        with open(path, "rb") as pdf:
+            return payslip["filename"], pdf.read()
+
+    def _deliver(self, payload: Dict[str, Any]) -> Optional[Exception]:
+        """Envoyer un message (thread du pool) ; retourne l'erreur rencontrée, None si envoyé"""
+        if payload["error"] is not None:
+            return payload["error"]
+        try:
+            attachments = [self._attachment(payload["payslip"])] if payload["payslip"] else None
+            self.rate_limiter.wait(payload["server"])
+            self.sender.deliver(
+                payload["to_email"], payload["subject"], payload["html_content"], payload["text_content"],
+                payload["smtp_config"], attachments
+            )
+            return None
+        except Exception as e:
+            return e
+
+    def _record(self, db: Session, batch: List[models.EmailOutbox], errors: List[Optional[Exception]]):
+        """Statut de chaque message et, pour les invitations, statut email de l'invitation"""
+        now = datetime.utcnow()
+        invitation_outcomes: Dict[int, str] = {}
+
+        for message, error in zip(batch, errors):
+            message.attempts = (message.attempts or 0) + 1
+            message.claim_id = None
+            if error is None:
+                message.status = "sent"
+                message.sent_at = now
+                message.last_error = None
+                outcome = "sent"
+            else:
+                message.last_error = f"{type(error).__name__}: {error}"
+                if is_permanent_error(error) or message.attempts >= (message.max_attempts or settings.EMAIL_MAX_ATTEMPTS):
+                    message.status = "dead"
+                    outcome = "failed"
+                    logger.error(f"❌ Email {message.id} ({message.kind}) à {message.to_email} abandonné: {message.last_error}")
+                else:
+                    message.status = "pending"
+                    message.next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts))
+                    outcome = None
+                    logger.warning(
+                        f"Email {message.id} à {message.to_email} en échec (tentative {message.attempts}), "
+                        f"nouvel essai à {message.next_attempt_at:%H:%M:%S}: {message.last_error}"
+                    )
+            if message.invitation_id and outcome:
+                invitation_outcomes[message.invitation_id] = outcome
+
+        if invitation_outcomes:
+            invitations = db.query(models.Invitation).filter(
+                models.Invitation.id.in_(list(invitation_outcomes))
+            ).all()
+            for invitation in invitations:
+                # Ouverture ou acceptation déjà constatées : plus récentes que le résultat d'envoi
+                if invitation.email_status in ("opened", "accepted"):
+                    continue
+                invitation.email_status = invitation_outcomes[invitation.id]
+                if invitation.email_status == "sent":
+                    invitation.email_sent_at = now
+
+        db.commit()
+
+
+# Instance globale
+email_outbox_dispatcher = EmailOutboxDispatcher()
@@ -1,4 +1,4 @@
-import smtplib
+import asyncio
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
@@ -6,6 +6,8 @@ from typing import Optional
 import os
 from io import BytesIO
 
+from app.core.smtp_pool import smtp_pools
+
 class EmailService:
     """Service d'envoi d'emails pour les bulletins de paie"""
     
@@ -57,15 +59,17 @@ class EmailService:
                 print(f"[SIMULATION] Email envoyé à {to_email} pour {employee_name}")
                 return True
             
-            # Envoi réel en production
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.smtp_username, self.smtp_password)
-            server.send_message(msg)
-            server.quit()
+            # Envoi réel en production (session SMTP réutilisée d'un bulletin à l'autre)
+            smtp_pools.get(
+                self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password
+            ).send_message(msg)
             
             return True
             
         except Exception as e:
             print(f"Erreur envoi email: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    async def send_payslip_email_async(self, *args, **kwargs) -> bool:
+        """send_payslip_email sans bloquer la boucle asyncio"""
+        return await asyncio.to_thread(self.send_payslip_email, *args, **kwargs)
@@ -1,5 +1,8 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from decimal import Decimal, ROUND_HALF_UP
+import math
+
+from app.core.tax_table import get_tax_table
 
 class PayrollCalculator:
     """Moteur de calcul de paie avec formules réelles IRPP et CNSS"""
@@ -22,12 +25,41 @@ class PayrollCalculator:
     ACCIDENT_WORK_RATE = 0.01   # 1%
     FAMILY_ALLOWANCE_RATE = 0.07 # 7%
     
-    def __init__(self):
+    # Montants entiers en centimes pour le calcul rapide
+    MINOR_UNITS = 100
+    
+    def __init__(self, audit_mode: bool = False):
         self.calculation_details = []
+        self.tax_table = get_tax_table(self.IRPP_BRACKETS)
+        # Mode audit : tout calcul passe par le chemin Decimal de référence
+        self.audit_mode = audit_mode
+        
+        # Constantes converties une seule fois (Decimal, et fractions exactes pour le calcul en centimes)
+        self._cnss_max_salary = Decimal(str(self.CNSS_MAX_SALARY))
+        self._cnss_employee_rate = Decimal(str(self.CNSS_EMPLOYEE_RATE))
+        self._cnss_employer_rate = Decimal(str(self.CNSS_EMPLOYER_RATE))
+        self._accident_work_rate = Decimal(str(self.ACCIDENT_WORK_RATE))
+        self._family_allowance_rate = Decimal(str(self.FAMILY_ALLOWANCE_RATE))
+        
+        self._cnss_employee_ratio = self._cnss_employee_rate.as_integer_ratio()
+        self._cnss_employer_ratio = self._cnss_employer_rate.as_integer_ratio()
+        self._accident_work_ratio = self._accident_work_rate.as_integer_ratio()
+        self._family_allowance_ratio = self._family_allowance_rate.as_integer_ratio()
+        self._cnss_max_minor = self._to_minor_units(self.CNSS_MAX_SALARY)
     
     def calculate_employee_payroll(self, employee_data: Dict) -> Dict[str, Any]:
         """Calcule la paie complète d'un employé"""
         
+        if not self.audit_mode:
+            calculation_details = self._calculate_minor_units(employee_data)
+            if calculation_details is not None:
+                return calculation_details
+        
+        return self.calculate_employee_payroll_decimal(employee_data)
+    
+    def calculate_employee_payroll_decimal(self, employee_data: Dict) -> Dict[str, Any]:
+        """Calcul de référence en Decimal (mode audit)"""
+        
         base_salary = Decimal(str(employee_data.get('base_salary', 0)))
         overtime_hours = Decimal(str(employee_data.get('overtime_hours', 0)))
         overtime_rate = Decimal(str(employee_data.get('overtime_rate', 1.5)))
@@ -42,17 +74,17 @@ class PayrollCalculator:
         gross_salary = base_salary + overtime_amount - absence_deduction
         
         # Calcul CNSS
-        cnss_base = min(gross_salary, Decimal(str(self.CNSS_MAX_SALARY)))
-        cnss_employee = self._round_amount(cnss_base * Decimal(str(self.CNSS_EMPLOYEE_RATE)))
-        cnss_employer = self._round_amount(cnss_base * Decimal(str(self.CNSS_EMPLOYER_RATE)))
+        cnss_base = min(gross_salary, self._cnss_max_salary)
+        cnss_employee = self._round_amount(cnss_base * self._cnss_employee_rate)
+        cnss_employer = self._round_amount(cnss_base * self._cnss_employer_rate)
         
         # Calcul IRPP
         taxable_income = gross_salary - cnss_employee
         irpp_amount = self._calculate_irpp(taxable_income)
         
         # Autres déductions
-        accident_work = self._round_amount(gross_salary * Decimal(str(self.ACCIDENT_WORK_RATE)))
-        family_allowance = self._round_amount(gross_salary * Decimal(str(self.FAMILY_ALLOWANCE_RATE)))
+        accident_work = self._round_amount(gross_salary * self._accident_work_rate)
+        family_allowance = self._round_amount(gross_salary * self._family_allowance_rate)
         
         # Total déductions
         total_employee_deductions = cnss_employee + irpp_amount
@@ -80,33 +112,89 @@ class PayrollCalculator:
         
         return calculation_details
     
-    def _calculate_irpp(self, taxable_income: Decimal) -> Decimal:
-        """Calcule l'IRPP selon le barème progressif"""
-        
-        if taxable_income <= 0:
-            return Decimal('0')
+    def _to_minor_units(self, amount) -> Optional[int]:
+        """Montant en centimes entiers, None s'il n'est pas exactement représentable (même valeur que Decimal(str(x)))"""
+        if type(amount) is int:
+            return amount * self.MINOR_UNITS
+        if type(amount) is not float or not math.isfinite(amount) or math.copysign(1.0, amount) < 0:
+            return None
+        if amount.is_integer() and abs(amount) < 2 ** 53:
+            return int(amount) * self.MINOR_UNITS
+        
+        text = repr(amount)
+        if 'e' in text:
+            return None
+        whole, fraction = text.split('.')
+        if len(fraction) > 2:
+            return None
+        return int(whole + fraction.ljust(2, '0'))
+    
+    def _round_ratio(self, numerator: int, denominator: int) -> int:
+        """Arrondi half-up (demi s'éloignant de zéro) de numerator / denominator, comme _round_amount"""
+        rounded = (2 * abs(numerator) + denominator) // (2 * denominator)
+        return rounded if numerator >= 0 else -rounded
+    
+    def _calculate_minor_units(self, employee_data: Dict) -> Optional[Dict[str, Any]]:
+        """Calcul rapide en centimes entiers, None si l'employé relève du chemin Decimal
+        
+        Sans heures supplémentaires ni absences, tous les montants sont des décimaux exacts :
+        l'arithmétique entière donne alors exactement les valeurs du calcul Decimal. Le taux
+        horaire (salaire / heures mensuelles) n'étant pas un décimal fini, les autres cas
+        restent en Decimal.
+        """
+        if employee_data.get('overtime_hours', 0) != 0 or employee_data.get('absence_hours', 0) != 0:
+            return None
+        monthly_hours = employee_data.get('monthly_hours', 173.33)
+        overtime_rate = employee_data.get('overtime_rate', 1.5)
+        if type(monthly_hours) not in (int, float) or monthly_hours == 0 or type(overtime_rate) not in (int, float):
+            return None
+        
+        # Salaire négatif : le Decimal produit des zéros signés (-0.0), laissé au chemin de référence
+        gross = self._to_minor_units(employee_data.get('base_salary', 0))
+        if gross is None or gross < 0:
+            return None
+        scale = self.MINOR_UNITS
+        
+        # CNSS plafonnée (montants arrondis en FCFA)
+        cnss_base = min(gross, self._cnss_max_minor)
+        rate_num, rate_den = self._cnss_employee_ratio
+        cnss_employee = self._round_ratio(cnss_base * rate_num, rate_den * scale)
+        rate_num, rate_den = self._cnss_employer_ratio
+        cnss_employer = self._round_ratio(cnss_base * rate_num, rate_den * scale)
+        
+        # IRPP
+        taxable_income = gross - cnss_employee * scale
+        irpp_amount = self._round_ratio(*self.tax_table.tax_minor_units(taxable_income, scale))
+        
+        # Autres charges
+        rate_num, rate_den = self._accident_work_ratio
+        accident_work = self._round_ratio(gross * rate_num, rate_den * scale)
+        rate_num, rate_den = self._family_allowance_ratio
+        family_allowance = self._round_ratio(gross * rate_num, rate_den * scale)
         
-        irpp_total = Decimal('0')
-        remaining_income = taxable_income
+        total_employee_deductions = cnss_employee + irpp_amount
+        total_employer_charges = cnss_employer + accident_work + family_allowance
         
-        for bracket in self.IRPP_BRACKETS:
-            bracket_min = Decimal(str(bracket["min"]))
-            bracket_max = Decimal(str(bracket["max"]))
-            bracket_rate = Decimal(str(bracket["rate"]))
-            
-            if remaining_income <= 0:
-                break
-            
-            if taxable_income > bracket_min:
-                taxable_in_bracket = min(remaining_income, bracket_max - bracket_min)
-                if bracket_max != float('inf'):
-                    taxable_in_bracket = min(taxable_in_bracket, bracket_max - bracket_min)
-                
-                bracket_tax = taxable_in_bracket * bracket_rate
-                irpp_total += bracket_tax
-                remaining_income -= taxable_in_bracket
-        
-        return self._round_amount(irpp_total)
+        # Division entière vraie : flottant correctement arrondi, comme float(Decimal)
+        return {
+            "base_salary": gross / scale,
+            "overtime_amount": 0.0,
+            "absence_deduction": 0.0,
+            "gross_salary": gross / scale,
+            "cnss_employee": float(cnss_employee),
+            "cnss_employer": float(cnss_employer),
+            "irpp_amount": float(irpp_amount),
+            "accident_work": float(accident_work),
+            "family_allowance": float(family_allowance),
+            "total_employee_deductions": float(total_employee_deductions),
+            "total_employer_charges": float(total_employer_charges),
+            "net_salary": (gross - total_employee_deductions * scale) / scale,
+            "cost_to_company": (gross + total_employer_charges * scale) / scale
+        }
+    
+    def _calculate_irpp(self, taxable_income: Decimal) -> Decimal:
+        """Calcule l'IRPP selon le barème progressif"""
+        return self._round_amount(self.tax_table.tax_decimal(taxable_income))
     
     def _round_amount(self, amount: Decimal) -> Decimal:
         """Arrondit un montant à l'entier le plus proche"""
@@ -148,36 +236,4 @@ class PayrollCalculator:
     
     def get_irpp_breakdown(self, taxable_income: float) -> List[Dict]:
         """Retourne le détail du calcul IRPP par tranche"""
-        
-        taxable = Decimal(str(taxable_income))
-        breakdown = []
-        remaining = taxable
-        
-        for i, bracket in enumerate(self.IRPP_BRACKETS):
-            if remaining <= 0:
-                break
-                
-            bracket_min = Decimal(str(bracket["min"]))
-            bracket_max = Decimal(str(bracket["max"]))
-            bracket_rate = Decimal(str(bracket["rate"]))
-            
-            if taxable > bracket_min:
-                if bracket_max == float('inf'):
-                    taxable_in_bracket = remaining
-                else:
-                    taxable_in_bracket = min(remaining, bracket_max - bracket_min)
-                
-                bracket_tax = taxable_in_bracket * bracket_rate
-                
-                breakdown.append({
-                    "tranche": i + 1,
-                    "min": float(bracket_min),
-                    "max": float(bracket_max) if bracket_max != float('inf') else None,
-                    "rate": float(bracket_rate * 100),
-                    "taxable_amount": float(taxable_in_bracket),
-                    "tax_amount": float(bracket_tax)
-                })
-                
-                remaining -= taxable_in_bracket
-        
-        return breakdown
\ No newline at end of file
+        return self.tax_table.breakdown(Decimal(str(taxable_income)))
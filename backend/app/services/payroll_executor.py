@@ -0,0 +1,164 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.payroll_calculator import PayrollCalculator
+from app.services.payroll_vectorized import load_company_inputs
+
+# Champs des entrées compactes (tuples) envoyées aux processus de calcul
+INPUT_FIELDS = ("base_salary", "overtime_hours", "absence_hours", "overtime_rate", "monthly_hours")
+
+# Champs des résultats renvoyés, dans l'ordre de calculate_employee_payroll
+RESULT_FIELDS = (
+    "base_salary", "overtime_amount", "absence_deduction", "gross_salary",
+    "cnss_employee", "cnss_employer", "irpp_amount", "accident_work",
+    "family_allowance", "total_employee_deductions", "total_employer_charges",
+    "net_salary", "cost_to_company"
+)
+
+# Calculateur propre à chaque processus de calcul
+_worker_calculator: Optional[PayrollCalculator] = None
+
+
+def compute_chunk(rows: List[Tuple]) -> List[Tuple]:
+    """Calculer un lot d'entrées compactes (exécuté dans un processus du pool)"""
+    global _worker_calculator
+    if _worker_calculator is None:
+        _worker_calculator = PayrollCalculator()
+
+    results = []
+    for row in rows:
+        calculation = _worker_calculator.calculate_employee_payroll(dict(zip(INPUT_FIELDS, row)))
+        results.append(tuple(calculation[field] for field in RESULT_FIELDS))
+    return results
+
+
+def to_compact_row(employee_data: Dict) -> Tuple:
+    """Entrée compacte d'un employé (valeurs par défaut de PayrollCalculator)"""
+    return (
+        employee_data.get("base_salary", 0),
+        employee_data.get("overtime_hours", 0),
+        employee_data.get("absence_hours", 0),
+        employee_data.get("overtime_rate", 1.5),
+        employee_data.get("monthly_hours", 173.33)
+    )
+
+
+def load_employees_data(
+    db: Session,
+    company_id: int,
+    period: str,
+    employee_ids: Optional[List[int]] = None
+) -> List[Dict]:
+    """Entrées de paie des employés actifs d'une entreprise, au format de calculate_batch_payroll"""
+    inputs = load_company_inputs(db, company_id, period, employee_ids)
+    variables = {code: values.tolist() for code, values in inputs.variables.items()}
+    return [
+        {
+            "employee_id": employee_id,
+            "employee_name": name,
+            "base_salary": base_salary,
+            "overtime_hours": overtime_hours,
+            "absence_hours": absence_hours,
+            "variables": {code: values[position] for code, values in variables.items()}
+        }
+        for position, (employee_id, name, base_salary, overtime_hours, absence_hours) in enumerate(zip(
+            inputs.employee_ids.tolist(),
+            inputs.employee_names,
+            inputs.base_salary.tolist(),
+            inputs.overtime_hours.tolist(),
+            inputs.absence_hours.tolist()
+        ))
+    ]
+
+
+class PayrollRunExecutor:
+    """Exécution d'une paie par lots d'employés répartis sur un pool de processus"""
+
+    def __init__(self, workers: int = None, chunk_size: int = None):
+        self.workers = workers or settings.PAYROLL_WORKERS or os.cpu_count() or 1
+        self.chunk_size = chunk_size or settings.PAYROLL_CHUNK_SIZE
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Pool de processus créé au premier usage puis réutilisé"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def shutdown(self):
+        """Arrêter le pool de processus"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def is_parallel(self, count: int) -> bool:
+        """Le pool n'est utilisé que s'il y a plusieurs processus et plus d'un lot"""
+        return self.workers > 1 and count > self.chunk_size
+
+    def compute_rows(self, rows: List[Tuple]) -> List[Tuple]:
+        """Calculer des entrées compactes, dans l'ordre, en parallèle si cela en vaut la peine"""
+        if not self.is_parallel(len(rows)):
+            return compute_chunk(rows)
+
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+        results = []
+        # map conserve l'ordre des lots : la fusion est déterministe quel que soit le nombre de processus
+        for chunk_results in self._get_pool().map(compute_chunk, chunks):
+            results.extend(chunk_results)
+        return results
+
+    def run(self, employees_data: List[Dict]) -> Dict[str, Any]:
+        """Même entrée et même format de retour que PayrollCalculator.calculate_batch_payroll"""
+        if not self.is_parallel(len(employees_data)):
+            return PayrollCalculator().calculate_batch_payroll(employees_data)
+
+        rows = [to_compact_row(e) for e in employees_data]
+        results = self.compute_rows(rows)
+
+        calculations = []
+        totals = {
+            "total_gross": 0,
+            "total_net": 0,
+            "total_cnss_employee": 0,
+            "total_cnss_employer": 0,
+            "total_irpp": 0,
+            "total_cost_to_company": 0
+        }
+
+        # Cumul dans l'ordre des employés, comme le calcul séquentiel
+        for employee_data, values in zip(employees_data, results):
+            calculation = dict(zip(RESULT_FIELDS, values))
+            calculation["employee_id"] = employee_data.get("employee_id")
+            calculation["employee_name"] = employee_data.get("employee_name")
+            calculations.append(calculation)
+
+            totals["total_gross"] += calculation["gross_salary"]
+            totals["total_net"] += calculation["net_salary"]
+            totals["total_cnss_employee"] += calculation["cnss_employee"]
+            totals["total_cnss_employer"] += calculation["cnss_employer"]
+            totals["total_irpp"] += calculation["irpp_amount"]
+            totals["total_cost_to_company"] += calculation["cost_to_company"]
+
+        return {
+            "calculations": calculations,
+            "totals": totals,
+            "employees_count": len(calculations)
+        }
+
+    def run_company(self, db: Session, company_id: int, period: str) -> Dict[str, Any]:
+        """Paie de tous les employés actifs d'une entreprise pour une période"""
+        result = self.run(load_employees_data(db, company_id, period))
+        result["period"] = period
+        return result
+
+
+# Instance globale
+payroll_executor = PayrollRunExecutor()
@@ -0,0 +1,293 @@
+"""Calculs de paie asynchrones : jobs persistés exécutés par un worker en arrière-plan"""
+
+import logging
+import queue
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.database import SessionLocal
+from app.services.payroll_executor import (
+    payroll_executor, load_employees_data, to_compact_row, compute_chunk, RESULT_FIELDS
+)
+from app.services.payroll_memo import payroll_input_hash, memo_config_version, start_memo_run
+
+logger = logging.getLogger(__name__)
+
+TOTAL_FIELDS = {
+    "total_gross": "gross_salary",
+    "total_net": "net_salary",
+    "total_cnss_employee": "cnss_employee",
+    "total_cnss_employer": "cnss_employer",
+    "total_irpp": "irpp_amount",
+    "total_cost_to_company": "cost_to_company"
+}
+
+
+# Job « in_progress » sans signe de vie depuis plus longtemps (processus arrêté) : repris par un autre worker
+JOB_HEARTBEAT_TIMEOUT = timedelta(minutes=5)
+
+
+def new_calculation_id() -> str:
+    """Identifiant public d'un calcul"""
+    return f"calc_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+def job_status(job: models.PayrollCalculationJob, include_results: bool = False) -> Dict[str, Any]:
+    """État d'un job au format PayrollCalculationStatus, avec progression et temps restant estimé"""
+    processed = (job.completed_employees or 0) + (job.failed_employees or 0)
+    total = job.total_employees or 0
+
+    progress = round(processed / total * 100, 1) if total else (100.0 if job.status == "completed" else 0.0)
+    eta_seconds = None
+    if job.status == "in_progress" and job.started_at and processed:
+        elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+        eta_seconds = round(elapsed / processed * (total - processed), 1)
+
+    return {
+        "calculation_id": job.calculation_id,
+        "status": job.status,
+        "period": job.period,
+        "total_employees": total,
+        "completed_employees": job.completed_employees or 0,
+        "failed_employees": job.failed_employees or 0,
+        "cached_employees": job.cached_employees or 0,
+        "progress": progress,
+        "eta_seconds": eta_seconds,
+        "calculations": (job.results or []) if include_results else [],
+        "totals": job.totals,
+        "errors": job.errors or [],
+        "started_at": job.started_at or job.created_at,
+        "completed_at": job.completed_at,
+        "error_message": job.error_message
+    }
+
+
+class PayrollJobWorker:
+    """Worker unique (thread) qui exécute les jobs de calcul dans l'ordre de soumission"""
+
+    def __init__(self, session_factory=SessionLocal, executor=payroll_executor):
+        self.session_factory = session_factory
+        self.executor = executor
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Identifiant de ce worker : un job n'est exécuté que par le worker qui l'a réclamé
+        self.worker_id = uuid.uuid4().hex
+
+    def submit(
+        self,
+        db: Session,
+        company_id: int,
+        period: str,
+        employee_ids: Optional[List[int]] = None,
+        requested_by_id: Optional[int] = None
+    ) -> models.PayrollCalculationJob:
+        """Enregistrer un job de calcul et le mettre en file d'attente"""
+        job = models.PayrollCalculationJob(
+            calculation_id=new_calculation_id(),
+            company_id=company_id,
+            period=period,
+            employee_ids=employee_ids or None,
+            status="pending",
+            requested_by_id=requested_by_id
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        self._enqueue(job.calculation_id)
+        return job
+
+    def resume_pending_jobs(self):
+        """Remettre en file les jobs en attente et ceux interrompus (redémarrage du serveur)
+
+        Chaque processus uvicorn appelle cette méthode : un job en cours dont le worker donne
+        encore signe de vie n'est pas repris, et _claim garantit qu'un seul worker exécute un job.
+        """
+        job = models.PayrollCalculationJob
+        db = self.session_factory()
+        try:
+            jobs = db.query(job.calculation_id).filter(self._claimable()).order_by(job.created_at).all()
+        finally:
+            db.close()
+
+        for (calculation_id,) in jobs:
+            self._enqueue(calculation_id)
+        if jobs:
+            logger.info(f"🔁 {len(jobs)} calcul(s) de paie remis en file")
+
+    def wait(self):
+        """Attendre que la file soit vide (scripts et tests)"""
+        self._queue.join()
+
+    def _enqueue(self, calculation_id: str):
+        self._ensure_thread()
+        self._queue.put(calculation_id)
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="payroll-jobs", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            calculation_id = self._queue.get()
+            try:
+                self.run_job(calculation_id)
+            except Exception:
+                logger.exception(f"Erreur inattendue du calcul de paie {calculation_id}")
+            finally:
+                self._queue.task_done()
+
+    def _claimable(self):
+        """Jobs exécutables : en attente, ou en cours sans signe de vie récent"""
+        job = models.PayrollCalculationJob
+        stale = datetime.utcnow() - JOB_HEARTBEAT_TIMEOUT
+        return or_(
+            job.status == "pending",
+            and_(job.status == "in_progress", or_(job.heartbeat_at.is_(None), job.heartbeat_at < stale))
+        )
+
+    def _claim(self, db: Session, calculation_id: str) -> bool:
+        """Réclamer le job (UPDATE conditionnel) ; False s'il est terminé ou exécuté par un autre worker"""
+        job = models.PayrollCalculationJob
+        claimed = db.query(job).filter(
+            job.calculation_id == calculation_id,
+            self._claimable()
+        ).update({
+            "status": "in_progress",
+            "claimed_by": self.worker_id,
+            "heartbeat_at": datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+
+    def run_job(self, calculation_id: str):
+        """Exécuter un job par lots, en enregistrant la progression après chaque lot"""
+        db = self.session_factory()
+        try:
+            if not self._claim(db, calculation_id):
+                return
+            job = db.query(models.PayrollCalculationJob).filter(
+                models.PayrollCalculationJob.calculation_id == calculation_id
+            ).first()
+
+            try:
+                self._run(db, job)
+            except Exception as e:
+                db.rollback()
+                job.status = "failed"
+                job.error_message = str(e)
+                job.completed_at = datetime.utcnow()
+                db.commit()
+                logger.error(f"❌ Calcul de paie {calculation_id} échoué: {e}")
+        finally:
+            db.close()
+
+    def _run(self, db: Session, job: models.PayrollCalculationJob):
+        employees_data = load_employees_data(db, job.company_id, job.period, job.employee_ids)
+
+        # Les employés dont les entrées n'ont pas changé sont servis depuis les résultats mémorisés
+        config_version = memo_config_version(db, job.company_id)
+        memo_run = start_memo_run(db, job.company_id, job.period, {
+            e["employee_id"]: payroll_input_hash(
+                config_version, e["base_salary"], e["overtime_hours"], e["absence_hours"], e["variables"]
+            )
+            for e in employees_data
+        })
+
+        job.status = "in_progress"
+        job.started_at = datetime.utcnow()
+        job.total_employees = len(employees_data)
+        job.completed_employees = 0
+        job.failed_employees = 0
+        job.cached_employees = memo_run.hits
+        db.commit()
+
+        calculations = []
+        errors = []
+        # Un lot couvre tous les processus du pool : la progression avance d'un lot à la fois
+        batch_size = self.executor.chunk_size * max(1, self.executor.workers)
+
+        for start in range(0, len(employees_data), batch_size):
+            batch = employees_data[start:start + batch_size]
+            batch_calculations, batch_errors = self._compute_batch(batch, job.period, memo_run)
+            calculations.extend(batch_calculations)
+            errors.extend(batch_errors)
+
+            memo_run.save(db, commit=False)
+            job.completed_employees = len(calculations)
+            job.failed_employees = len(errors)
+            job.heartbeat_at = datetime.utcnow()
+            db.commit()
+
+        totals = {key: 0 for key in TOTAL_FIELDS}
+        for calculation in calculations:
+            for key, field in TOTAL_FIELDS.items():
+                totals[key] += calculation[field]
+
+        job.results = calculations
+        job.totals = totals
+        job.errors = errors
+        job.status = "completed"
+        job.completed_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"✅ Calcul de paie {job.calculation_id}: {len(calculations)} employé(s), {len(errors)} échec(s)")
+
+    def _compute_batch(self, batch: List[Dict], period: str, memo_run=None):
+        """Calculer un lot ; en cas d'erreur, recalculer employé par employé pour isoler les échecs"""
+        cached = {}
+        if memo_run is not None:
+            for employee_data in batch:
+                result = memo_run.lookup(employee_data["employee_id"])
+                if result is not None:
+                    cached[employee_data["employee_id"]] = result
+
+        dirty = [e for e in batch if e["employee_id"] not in cached]
+        rows = [to_compact_row(e) for e in dirty]
+        try:
+            results = self.executor.compute_rows(rows) if rows else []
+        except Exception:
+            results = None
+
+        computed, errors = {}, []
+        for position, employee_data in enumerate(dirty):
+            if results is not None:
+                values = results[position]
+            else:
+                try:
+                    values = compute_chunk([rows[position]])[0]
+                except Exception as e:
+                    errors.append({"employee_id": employee_data["employee_id"], "error": str(e)})
+                    continue
+
+            result = dict(zip(RESULT_FIELDS, values))
+            computed[employee_data["employee_id"]] = result
+            if memo_run is not None:
+                memo_run.store(employee_data["employee_id"], result)
+
+        # Résultats dans l'ordre des employés, qu'ils viennent du cache ou du calcul
+        calculations = []
+        for employee_data in batch:
+            result = cached.get(employee_data["employee_id"]) or computed.get(employee_data["employee_id"])
+            if result is None:
+                continue
+
+            calculation = dict(result)
+            calculation["employee_id"] = employee_data["employee_id"]
+            calculation["employee_name"] = employee_data["employee_name"]
+            calculation["period"] = period
+            calculations.append(calculation)
+
+        return calculations, errors
+
+
+# Instance globale
+payroll_job_worker = PayrollJobWorker()
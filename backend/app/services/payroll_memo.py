@@ -0,0 +1,85 @@
+"""Mémoïsation des calculs de paie : chaque résultat est indexé par l'empreinte de ses entrées"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.payroll_cache import payroll_engine_cache
+from app.crud import crud_payroll
+
+# À incrémenter quand les règles de PayrollCalculator changent : invalide tous les résultats mémorisés
+CALCULATION_VERSION = 1
+
+
+def payroll_input_hash(
+    config_version: Tuple,
+    base_salary: float,
+    overtime_hours: float = 0,
+    absence_hours: float = 0,
+    variables: Optional[Dict[str, float]] = None
+) -> str:
+    """Empreinte SHA-256 des entrées d'un calcul : salaire, heures, variables de la période, version de la config"""
+    payload = [
+        CALCULATION_VERSION,
+        config_version,
+        float(base_salary or 0),
+        float(overtime_hours or 0),
+        float(absence_hours or 0),
+        # Une variable à zéro équivaut à une variable absente
+        sorted((code, float(value)) for code, value in (variables or {}).items() if value)
+    ]
+    return hashlib.sha256(json.dumps(payload, default=str, separators=(",", ":")).encode()).hexdigest()
+
+
+class PayrollMemoRun:
+    """Exécution mémoïsée : résultats encore valides (chargés en une requête) et nouveaux résultats à enregistrer"""
+
+    def __init__(self, company_id: int, period: str, hashes: Dict[int, str], cached: Dict[int, Dict[str, Any]]):
+        self.company_id = company_id
+        self.period = period
+        self.hashes = hashes
+        self.cached = cached
+        self._fresh: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+
+    @property
+    def hits(self) -> int:
+        return len(self.cached)
+
+    @property
+    def recomputed(self) -> int:
+        return len(self.hashes) - len(self.cached)
+
+    def lookup(self, employee_id: int) -> Optional[Dict[str, Any]]:
+        """Résultat mémorisé de l'employé si ses entrées n'ont pas changé"""
+        return self.cached.get(employee_id)
+
+    def store(self, employee_id: int, result: Dict[str, Any]):
+        """Retenir un résultat recalculé (enregistré par save)"""
+        if employee_id in self.hashes:
+            self._fresh[employee_id] = (self.hashes[employee_id], result)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "recomputed": self.recomputed}
+
+    def save(self, db: Session, commit: bool = True):
+        """Enregistrer les résultats recalculés depuis le dernier save"""
+        crud_payroll.upsert_payroll_results(db, self.company_id, self.period, self._fresh, commit=commit)
+        self._fresh = {}
+
+
+def memo_config_version(db: Session, company_id: int) -> Tuple:
+    """Version de la configuration de paie de l'entreprise prise en compte dans les empreintes"""
+    return payroll_engine_cache.config_version(db, company_id)
+
+
+def start_memo_run(db: Session, company_id: int, period: str, hashes: Dict[int, str]) -> PayrollMemoRun:
+    """Charger les résultats mémorisés de la période et ne garder que ceux dont l'empreinte correspond"""
+    stored = crud_payroll.get_cached_payroll_results(db, period, hashes)
+    cached = {
+        employee_id: result
+        for employee_id, (input_hash, result) in stored.items()
+        if hashes.get(employee_id) == input_hash
+    }
+    return PayrollMemoRun(company_id, period, hashes, cached)
@@ -0,0 +1,180 @@
+"""Tirage de paie : un seul PDF multi-pages (bulletins de la période puis journal), écrit au fil des pages
+
+Le canvas reportlab garde toutes les pages en mémoire jusqu'à save() ; ici chaque page est
+dessinée sur un canvas de brouillon, ses opérateurs sont récupérés puis écrits aussitôt.
+Seuls les offsets des objets restent en mémoire (quelques octets par page).
+"""
+
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+from sqlalchemy.orm import Session
+
+from app.crud.crud_payroll import iter_accounting_rows
+from app.services.payslip_bulk import iter_period_payslips
+from app.services.payslip_canvas import (
+    TEMPLATE_FONTS, format_period, payslip_canvas_renderer, register_template_fonts
+)
+from app.services.pdf_writer import IncrementalPDFWriter
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+
+# Lignes d'employés par page du journal
+JOURNAL_ROWS_PER_PAGE = 45
+JOURNAL_ROW_HEIGHT = 14
+JOURNAL_COLUMNS = (
+    ("Employé", 4.6 * cm), ("Brut", 2.1 * cm), ("CNSS sal.", 1.9 * cm), ("IRPP", 1.9 * cm),
+    ("Net", 2.1 * cm), ("CNSS pat.", 1.9 * cm), ("Coût total", 2.5 * cm)
+)
+
+# Taille visée d'un morceau envoyé au client
+PRINT_RUN_CHUNK_SIZE = 64 * 1024
+
+
+def _take_code(c: canvas.Canvas) -> str:
+    """Opérateurs dessinés sur le canvas de brouillon depuis le dernier appel (puis oubliés)"""
+    code = "\n".join(c._code)
+    c._code = []
+    return code
+
+
+def _journal_header(c: canvas.Canvas, company_name: str, period: str, page_number: int) -> float:
+    """Titre et en-tête de colonnes d'une page du journal ; retourne le haut de la première ligne"""
+    left, top = 2 * cm, PAGE_HEIGHT - 2 * cm
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(left, top, f"JOURNAL DE PAIE - {format_period(period)}")
+    c.setFont("Helvetica", 9)
+    c.drawString(left, top - 14, company_name)
+    c.drawRightString(PAGE_WIDTH - 2 * cm, top - 14, f"Page {page_number}")
+
+    y = top - 40
+    c.setFillColor(colors.darkblue)
+    c.rect(left, y - JOURNAL_ROW_HEIGHT, sum(width for _, width in JOURNAL_COLUMNS), JOURNAL_ROW_HEIGHT, stroke=0, fill=1)
+    c.setFillColor(colors.whitesmoke)
+    c.setFont("Helvetica-Bold", 8)
+    _journal_cells(c, [label for label, _ in JOURNAL_COLUMNS], y - JOURNAL_ROW_HEIGHT + 4)
+    return y - JOURNAL_ROW_HEIGHT
+
+
+def _journal_cells(c: canvas.Canvas, cells: Sequence[str], baseline: float):
+    x = 2 * cm
+    for position, ((_, width), cell) in enumerate(zip(JOURNAL_COLUMNS, cells)):
+        if position == 0:
+            c.drawString(x + 3, baseline, cell[:32])
+        else:
+            c.drawRightString(x + width - 3, baseline, cell)
+        x += width
+
+
+def _journal_amounts(values: Sequence[Any]) -> List[str]:
+    return [f"{value or 0:,.0f}" for value in values]
+
+
+def iter_journal_pages(
+    c: canvas.Canvas,
+    rows: Iterable[Sequence[Any]],
+    company_name: str,
+    period: str
+) -> Iterator[str]:
+    """Pages du journal (opérateurs PDF), totaux sur la dernière ; lignes : iter_accounting_rows"""
+    totals = [0.0] * (len(JOURNAL_COLUMNS) - 1)
+    page_number = 0
+    y = None
+    count = 0
+
+    for row in rows:
+        if count % JOURNAL_ROWS_PER_PAGE == 0:
+            if y is not None:
+                yield _take_code(c)
+            page_number += 1
+            y = _journal_header(c, company_name, period, page_number)
+            c.setFont("Helvetica", 8)
+            c.setFillColor(colors.black)
+
+        name, *amounts = row
+        for position, amount in enumerate(amounts):
+            totals[position] += amount or 0
+        y -= JOURNAL_ROW_HEIGHT
+        _journal_cells(c, [str(name or "")] + _journal_amounts(amounts), y + 4)
+        c.setStrokeColor(colors.lightgrey)
+        c.line(2 * cm, y, 2 * cm + sum(width for _, width in JOURNAL_COLUMNS), y)
+        count += 1
+
+    if y is None or count % JOURNAL_ROWS_PER_PAGE == 0:
+        if y is not None:
+            yield _take_code(c)
+        page_number += 1
+        y = _journal_header(c, company_name, period, page_number)
+
+    y -= JOURNAL_ROW_HEIGHT + 4
+    c.setFillColor(colors.lightblue)
+    c.rect(2 * cm, y, sum(width for _, width in JOURNAL_COLUMNS), JOURNAL_ROW_HEIGHT, stroke=0, fill=1)
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Bold", 8)
+    _journal_cells(c, [f"TOTAL ({count} employés)"] + _journal_amounts(totals), y + 4)
+    yield _take_code(c)
+
+
+class PayrollPrintRun:
+    """Document unique d'une période : bulletins (gabarit canvas) puis journal de paie"""
+
+    def __init__(self, include_payslips: bool = True, include_journal: bool = True, compress: bool = True):
+        self.include_payslips = include_payslips
+        self.include_journal = include_journal
+        self.compress = compress
+
+    def iter_pdf(
+        self,
+        db: Session,
+        company_id: int,
+        company_name: str,
+        period: str,
+        statuses: Optional[Iterable[str]] = None
+    ) -> Iterator[bytes]:
+        """Octets du PDF, regroupés en morceaux d'environ PRINT_RUN_CHUNK_SIZE"""
+        scratch = canvas.Canvas(BytesIO(), pagesize=A4)
+        register_template_fonts(scratch)
+        # Polices déclarées sous les noms internes utilisés par le canvas de brouillon
+        fonts = {scratch._doc.getInternalFontName(font)[1:]: font for font in TEMPLATE_FONTS}
+        _take_code(scratch)
+
+        writer = IncrementalPDFWriter(fonts, compress=self.compress)
+        forms = payslip_canvas_renderer.template_code() if self.include_payslips else None
+        buffer = [writer.begin(forms)]
+        size = len(buffer[0])
+
+        def pages() -> Iterator[str]:
+            if self.include_payslips:
+                now = datetime.now()
+                for payslip in iter_period_payslips(db, company_id, period, statuses=statuses):
+                    yield payslip_canvas_renderer.page_code(scratch, payslip, now)
+            if self.include_journal:
+                yield from iter_journal_pages(
+                    scratch, iter_accounting_rows(db, company_id, period, statuses=statuses), company_name, period
+                )
+
+        for code in pages():
+            data = writer.page(code)
+            buffer.append(data)
+            size += len(data)
+            if size >= PRINT_RUN_CHUNK_SIZE:
+                yield b"".join(buffer)
+                buffer, size = [], 0
+        buffer.append(writer.end())
+        yield b"".join(buffer)
+
+    def write_file(self, db: Session, company_id: int, company_name: str, period: str, path: str,
+                   statuses: Optional[Iterable[str]] = None) -> int:
+        """Écrire le PDF dans un fichier, au fil des pages ; retourne la taille écrite"""
+        written = 0
+        with open(path, "wb") as output:
+            for chunk in self.iter_pdf(db, company_id, company_name, period, statuses):
+                output.write(chunk)
+                written += len(chunk)
+        return written
@@ -0,0 +1,291 @@
+"""Rappels de paie : recalcul rétroactif de plusieurs périodes et report des seuls écarts"""
+
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.crud.crud_payroll import YTD_STATUSES, add_retro_amounts, load_breakdowns, upsert_payroll_records
+from app.services.payroll_calculator import PayrollCalculator
+from app.services.payroll_vectorized import VectorizedPayrollCalculator, load_company_inputs_by_period
+
+# Montant du rappel -> colonne de résultat du calcul vectorisé
+RETRO_FIELDS = {
+    "gross_salary": "gross_salary",
+    "cnss_employee": "cnss_employee",
+    "cnss_employer": "cnss_employer",
+    "irpp": "irpp_amount",
+    "net_salary": "net_salary"
+}
+
+# En dessous de cet écart (en valeur absolue), aucun rappel n'est émis
+RETRO_TOLERANCE = 0.005
+
+
+def load_stored_amounts(
+    db: Session,
+    company_id: int,
+    periods: List[str],
+    employee_ids: Optional[List[int]] = None
+) -> Dict[str, Dict[int, tuple]]:
+    """Montants des bulletins validés ou payés des périodes (une requête) : {période: {employee_id: montants}}"""
+    query = db.query(
+        models.PayrollRecord.employee_id,
+        models.PayrollRecord.period,
+        models.PayrollRecord.gross_salary,
+        models.PayrollRecord.social_contributions,
+        models.PayrollRecord.id,
+        models.PayrollRecord.tax_amount,
+        models.PayrollRecord.net_salary,
+        models.PayrollRecord.breakdown_json
+    ).join(models.Employee, models.Employee.id == models.PayrollRecord.employee_id).filter(
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period.in_(periods),
+        models.PayrollRecord.status.in_(YTD_STATUSES)
+    )
+    if employee_ids:
+        query = query.filter(models.PayrollRecord.employee_id.in_(employee_ids))
+
+    records = query.all()
+    breakdowns = load_breakdowns(db, {record.id: record.breakdown_json for record in records})
+
+    stored: Dict[str, Dict[int, tuple]] = {period: {} for period in periods}
+    for employee_id, period, gross, social, record_id, tax, net, _ in records:
+        stored[period][employee_id] = (
+            gross or 0,
+            social or 0,
+            (breakdowns[record_id] or {}).get("cnss_employer") or 0,
+            tax or 0,
+            net or 0
+        )
+    return stored
+
+
+def load_posted_adjustments(
+    db: Session,
+    company_id: int,
+    periods: List[str],
+    employee_ids: Optional[List[int]] = None,
+    replaced_target: Optional[str] = None
+) -> Dict[tuple, np.ndarray]:
+    """Rappels déjà émis, cumulés par (employee_id, période d'origine) : ils ne sont pas réémis
+
+    Versés ou en attente, quelle que soit leur période de versement ; seuls les rappels en attente
+    sur replaced_target (remplacés par le nouveau calcul) sont ignorés.
+    """
+    adjustment = models.PayrollRetroAdjustment
+    query = db.query(
+        adjustment.employee_id,
+        adjustment.source_period,
+        *(getattr(adjustment, field) for field in RETRO_FIELDS)
+    ).filter(
+        adjustment.company_id == company_id,
+        adjustment.source_period.in_(periods)
+    )
+    if replaced_target:
+        query = query.filter(or_(adjustment.status == "applied", adjustment.target_period != replaced_target))
+    if employee_ids:
+        query = query.filter(adjustment.employee_id.in_(employee_ids))
+
+    posted: Dict[tuple, np.ndarray] = {}
+    for employee_id, period, *amounts in query.all():
+        key = (employee_id, period)
+        posted[key] = posted.get(key, 0) + np.array([amount or 0 for amount in amounts], dtype=np.float64)
+    return posted
+
+
+class RetroRecalculation:
+    """Recalcul rétroactif : une passe vectorisée par période, comparée aux bulletins enregistrés"""
+
+    def __init__(self, calculator: Optional[PayrollCalculator] = None):
+        self.vectorized = VectorizedPayrollCalculator(calculator)
+
+    def compute(
+        self,
+        db: Session,
+        company_id: int,
+        periods: List[str],
+        target_period: str,
+        employee_ids: Optional[List[int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Lignes de rappel (écarts non nuls) des périodes, à verser sur target_period"""
+        periods = sorted(set(periods))
+        stored = load_stored_amounts(db, company_id, periods, employee_ids)
+        posted = load_posted_adjustments(db, company_id, periods, employee_ids, replaced_target=target_period)
+
+        # Seuls les employés ayant un bulletin enregistré sur l'une des périodes sont recalculés
+        recorded_ids = sorted({employee_id for amounts in stored.values() for employee_id in amounts})
+        if not recorded_ids:
+            return []
+        inputs_by_period = load_company_inputs_by_period(
+            db, company_id, periods, recorded_ids, active_only=False, with_variables=False
+        )
+
+        lines = []
+        for period in periods:
+            amounts = stored[period]
+            inputs = inputs_by_period[period]
+            if not amounts or not len(inputs):
+                continue
+
+            columns = self.vectorized.calculate_arrays(inputs)
+            ids = inputs.employee_ids
+            positions = np.flatnonzero(np.isin(ids, np.fromiter(amounts, dtype=np.int64, count=len(amounts))))
+
+            recalculated = np.column_stack([columns[column][positions] for column in RETRO_FIELDS.values()])
+            previous = np.array([amounts[employee_id] for employee_id in ids[positions].tolist()], dtype=np.float64)
+            for row, employee_id in enumerate(ids[positions].tolist()):
+                if (employee_id, period) in posted:
+                    previous[row] += posted[(employee_id, period)]
+            deltas = recalculated - previous
+
+            changed = np.flatnonzero(np.any(np.abs(deltas) >= RETRO_TOLERANCE, axis=1))
+            for row in changed.tolist():
+                line = {
+                    "employee_id": int(ids[positions[row]]),
+                    "source_period": period,
+                    "target_period": target_period
+                }
+                line.update(zip(RETRO_FIELDS, (round(value, 2) for value in deltas[row].tolist())))
+                lines.append(line)
+
+        return lines
+
+    def run(
+        self,
+        db: Session,
+        company_id: int,
+        periods: List[str],
+        target_period: str,
+        employee_ids: Optional[List[int]] = None,
+        created_by_id: Optional[int] = None,
+        dry_run: bool = False
+    ) -> Dict[str, Any]:
+        """Calculer les rappels et remplacer ceux encore en attente pour ces périodes"""
+        lines = self.compute(db, company_id, periods, target_period, employee_ids)
+
+        if not dry_run:
+            # Un nouveau calcul remplace les rappels non encore versés des mêmes périodes
+            pending = db.query(models.PayrollRetroAdjustment).filter(
+                models.PayrollRetroAdjustment.company_id == company_id,
+                models.PayrollRetroAdjustment.target_period == target_period,
+                models.PayrollRetroAdjustment.source_period.in_(periods),
+                models.PayrollRetroAdjustment.status == "pending"
+            )
+            if employee_ids:
+                pending = pending.filter(models.PayrollRetroAdjustment.employee_id.in_(employee_ids))
+            pending.delete(synchronize_session=False)
+
+            now = datetime.utcnow()
+            db.bulk_insert_mappings(models.PayrollRetroAdjustment, [
+                {**line, "company_id": company_id, "status": "pending", "created_by_id": created_by_id, "created_at": now}
+                for line in lines
+            ])
+            db.commit()
+
+        totals = {field: round(sum(line[field] for line in lines), 2) for field in RETRO_FIELDS}
+        return {
+            "target_period": target_period,
+            "periods": sorted(set(periods)),
+            "employees_count": len({line["employee_id"] for line in lines}),
+            "lines_count": len(lines),
+            "totals": totals,
+            "lines": lines,
+            "dry_run": dry_run
+        }
+
+    def apply(
+        self,
+        db: Session,
+        company_id: int,
+        target_period: str,
+        employee_ids: Optional[List[int]] = None
+    ) -> Dict[str, Any]:
+        """Verser les rappels en attente sur les bulletins de target_period, puis les marquer appliqués
+
+        À lancer une fois la paie de target_period calculée : les écarts s'ajoutent au bulletin
+        (montants, détail « rappel_* »), cumuls annuels et cube compris. Les employés sans bulletin
+        sur la période, ou dont le bulletin est déjà payé, gardent leurs rappels en attente.
+        """
+        adjustment = models.PayrollRetroAdjustment
+        query = db.query(adjustment).filter(
+            adjustment.company_id == company_id,
+            adjustment.target_period == target_period,
+            adjustment.status == "pending"
+        )
+        if employee_ids:
+            query = query.filter(adjustment.employee_id.in_(employee_ids))
+        pending = query.order_by(adjustment.employee_id, adjustment.source_period).all()
+
+        by_employee: Dict[int, list] = {}
+        for line in pending:
+            by_employee.setdefault(line.employee_id, []).append(line)
+
+        records = {
+            record.employee_id: record
+            for record in db.query(
+                models.PayrollRecord.id,
+                models.PayrollRecord.employee_id,
+                models.PayrollRecord.status,
+                models.PayrollRecord.gross_salary,
+                models.PayrollRecord.taxable_income,
+                models.PayrollRecord.social_contributions,
+                models.PayrollRecord.tax_amount,
+                models.PayrollRecord.net_salary,
+                models.PayrollRecord.breakdown_json
+            ).filter(
+                models.PayrollRecord.period == target_period,
+                models.PayrollRecord.employee_id.in_(list(by_employee))
+            ).all()
+        } if by_employee else {}
+        breakdowns = load_breakdowns(db, {record.id: record.breakdown_json for record in records.values()})
+
+        rows = []
+        applied_lines = []
+        skipped = []
+        for employee_id, lines in by_employee.items():
+            record = records.get(employee_id)
+            if record is None or record.status == "paid":
+                skipped.append(employee_id)
+                continue
+
+            delta = {field: sum(getattr(line, field) or 0 for line in lines) for field in RETRO_FIELDS}
+            rows.append(add_retro_amounts({
+                "employee_id": employee_id,
+                "period": target_period,
+                "status": record.status,
+                "gross_salary": record.gross_salary,
+                "taxable_income": record.taxable_income,
+                "social_contributions": record.social_contributions,
+                "tax_amount": record.tax_amount,
+                "net_salary": record.net_salary,
+                "salary_breakdown": breakdowns[record.id]
+            }, delta))
+            applied_lines.extend((line, record.id) for line in lines)
+
+        if rows:
+            # Même transaction : bulletins réécrits (cumuls, cube, cache PDF) et rappels marqués versés
+            upsert_payroll_records(db, rows, commit=False)
+            now = datetime.utcnow()
+            for line, record_id in applied_lines:
+                line.status = "applied"
+                line.applied_at = now
+                line.applied_record_id = record_id
+            db.commit()
+
+        return {
+            "target_period": target_period,
+            "employees_count": len(rows),
+            "lines_count": len(applied_lines),
+            "totals": {
+                field: round(sum(getattr(line, field) or 0 for line, _ in applied_lines), 2) for field in RETRO_FIELDS
+            },
+            "skipped_employee_ids": sorted(skipped)
+        }
+
+
+# Instance globale
+payroll_retro = RetroRecalculation()
@@ -0,0 +1,363 @@
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.services.payroll_calculator import PayrollCalculator
+
+# Codes des données de paie (EmployeePayrollData) lus comme heures
+OVERTIME_CODES = ("overtime_hours", "HS")
+ABSENCE_CODES = ("absence_hours", "ABS")
+
+# Salaire maximal calculé en centimes int64 (au-delà, les produits par les taux pourraient déborder)
+MAX_MINOR_UNIT_SALARY = 10 ** 12
+
+# Écart à un demi, en ulps du plus grand montant intermédiaire, sous lequel l'arrondi
+# d'un montant flottant est jugé incertain : l'employé est recalculé en Decimal
+HALF_WAY_ULPS = 1024
+
+
+def round_half_up(amounts: np.ndarray, scale: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Arrondi à l'entier, demi s'éloignant de zéro ; retourne (arrondis, incertains)
+
+    Un montant flottant trop proche d'un demi (à HALF_WAY_ULPS ulps de scale près) peut
+    s'arrondir autrement qu'en Decimal : il est signalé plutôt que deviné.
+    """
+    magnitude = np.abs(amounts)
+    rounded = np.floor(magnitude + 0.5)
+    uncertain = np.abs(magnitude - np.floor(magnitude) - 0.5) <= HALF_WAY_ULPS * np.spacing(scale)
+    return np.copysign(rounded, amounts), uncertain
+
+
+def round_ratio(numerators: np.ndarray, denominators) -> np.ndarray:
+    """Arrondi half-up exact de numerators / denominators (entiers int64), comme PayrollCalculator._round_ratio"""
+    rounded = (2 * np.abs(numerators) + denominators) // (2 * denominators)
+    return np.where(numerators >= 0, rounded, -rounded)
+
+
+def split_payroll_values(values: Dict[str, float]) -> Tuple[float, float, Dict[str, float]]:
+    """Heures sup., absences et autres variables d'un employé depuis ses données de paie
+
+    Seule lecture des codes d'heures : calcul par lots, jobs et mémoïsation voient les mêmes entrées.
+    Si deux codes équivalents sont renseignés, le premier de OVERTIME_CODES / ABSENCE_CODES l'emporte.
+    """
+    overtime_hours = next((values[code] for code in OVERTIME_CODES if code in values), 0)
+    absence_hours = next((values[code] for code in ABSENCE_CODES if code in values), 0)
+    variables = {code: value for code, value in values.items() if code not in OVERTIME_CODES + ABSENCE_CODES}
+    return overtime_hours, absence_hours, variables
+
+
+class PayrollBatchInputs:
+    """Entrées de paie d'une entreprise en colonnes (un élément par employé)"""
+
+    def __init__(
+        self,
+        employee_ids: np.ndarray,
+        employee_names: List[str],
+        base_salary: np.ndarray,
+        overtime_hours: np.ndarray,
+        absence_hours: np.ndarray,
+        overtime_rate: np.ndarray = None,
+        monthly_hours: np.ndarray = None,
+        variables: Dict[str, np.ndarray] = None
+    ):
+        count = len(employee_ids)
+        self.employee_ids = employee_ids
+        self.employee_names = employee_names
+        self.base_salary = base_salary
+        self.overtime_hours = overtime_hours
+        self.absence_hours = absence_hours
+        self.overtime_rate = overtime_rate if overtime_rate is not None else np.full(count, 1.5)
+        self.monthly_hours = monthly_hours if monthly_hours is not None else np.full(count, 173.33)
+        self.variables = variables or {}
+
+    def __len__(self) -> int:
+        return len(self.employee_ids)
+
+    @classmethod
+    def from_employees_data(cls, employees_data: List[Dict]) -> "PayrollBatchInputs":
+        """Construire les colonnes depuis la liste de dicts acceptée par PayrollCalculator"""
+
+        def column(key, default):
+            return np.fromiter(
+                (float(e.get(key, default)) for e in employees_data),
+                dtype=np.float64,
+                count=len(employees_data)
+            )
+
+        return cls(
+            employee_ids=np.array([e.get("employee_id") for e in employees_data], dtype=object),
+            employee_names=[e.get("employee_name") for e in employees_data],
+            base_salary=column("base_salary", 0),
+            overtime_hours=column("overtime_hours", 0),
+            absence_hours=column("absence_hours", 0),
+            overtime_rate=column("overtime_rate", 1.5),
+            monthly_hours=column("monthly_hours", 173.33)
+        )
+
+
+def load_company_inputs(
+    db: Session,
+    company_id: int,
+    period: str,
+    employee_ids: Optional[List[int]] = None,
+    with_variables: bool = True
+) -> PayrollBatchInputs:
+    """Charger en deux requêtes les entrées de paie des employés actifs d'une entreprise (tous ou une sélection)"""
+    return load_company_inputs_by_period(db, company_id, [period], employee_ids, with_variables=with_variables)[period]
+
+
+def load_company_inputs_by_period(
+    db: Session,
+    company_id: int,
+    periods: List[str],
+    employee_ids: Optional[List[int]] = None,
+    active_only: bool = True,
+    with_variables: bool = True
+) -> Dict[str, PayrollBatchInputs]:
+    """Charger en deux requêtes les entrées de plusieurs périodes (mêmes employés, dans le même ordre)
+
+    with_variables=False : seules les heures sont lues (le calcul n'utilise pas les autres variables,
+    lues pour l'empreinte de mémoïsation).
+    """
+
+    query = db.query(
+        models.Employee.id,
+        models.Employee.name,
+        models.Employee.salary
+    ).filter(models.Employee.company_id == company_id)
+    if active_only:
+        query = query.filter(models.Employee.status == "active")
+    if employee_ids:
+        query = query.filter(models.Employee.id.in_(employee_ids))
+    employees = query.order_by(models.Employee.id).all()
+
+    count = len(employees)
+    ids = np.fromiter((e.id for e in employees), dtype=np.int64, count=count)
+    base_salary = np.fromiter((e.salary or 0 for e in employees), dtype=np.float64, count=count)
+    names = [e.name for e in employees]
+    index = {employee_id: position for position, employee_id in enumerate(ids.tolist())}
+
+    payroll_data = db.query(
+        models.EmployeePayrollData.employee_id,
+        models.EmployeePayrollData.variable_code,
+        models.EmployeePayrollData.value,
+        models.EmployeePayrollData.period
+    ).join(models.Employee).filter(
+        models.Employee.company_id == company_id,
+        models.EmployeePayrollData.period.in_(list(periods) + ["current"])
+    )
+    if active_only:
+        payroll_data = payroll_data.filter(models.Employee.status == "active")
+    if employee_ids:
+        payroll_data = payroll_data.filter(models.EmployeePayrollData.employee_id.in_(employee_ids))
+    if not with_variables:
+        payroll_data = payroll_data.filter(models.EmployeePayrollData.variable_code.in_(OVERTIME_CODES + ABSENCE_CODES))
+    payroll_data = payroll_data.all()
+
+    # Valeurs "current" d'abord, pour toutes les périodes : la valeur propre à la période l'emporte
+    stored: Dict[str, Dict[int, Dict[str, float]]] = {period: {} for period in periods}
+    for employee_id, code, value, period in sorted(payroll_data, key=lambda row: row.period != "current"):
+        position = index.get(employee_id)
+        if position is None:
+            continue
+        targets = stored.values() if period == "current" else [stored[period]]
+        for target in targets:
+            target.setdefault(position, {})[code] = value
+
+    columns = {
+        period: {"overtime_hours": np.zeros(count), "absence_hours": np.zeros(count), "variables": {}}
+        for period in periods
+    }
+    for period, values_by_position in stored.items():
+        column = columns[period]
+        for position, values in values_by_position.items():
+            overtime_hours, absence_hours, variables = split_payroll_values(values)
+            column["overtime_hours"][position] = overtime_hours
+            column["absence_hours"][position] = absence_hours
+            for code, value in variables.items():
+                if code not in column["variables"]:
+                    column["variables"][code] = np.zeros(count)
+                column["variables"][code][position] = value
+
+    return {
+        period: PayrollBatchInputs(
+            employee_ids=ids,
+            employee_names=names,
+            base_salary=base_salary,
+            overtime_hours=column["overtime_hours"],
+            absence_hours=column["absence_hours"],
+            variables=column["variables"]
+        )
+        for period, column in columns.items()
+    }
+
+
+class VectorizedPayrollCalculator:
+    """Calcul de paie en colonnes (NumPy) équivalent à PayrollCalculator.calculate_employee_payroll"""
+
+    def __init__(self, calculator: Optional[PayrollCalculator] = None):
+        calculator = calculator or PayrollCalculator()
+        self.calculator = calculator
+        self.tax_table = calculator.tax_table
+
+    def calculate_arrays(self, inputs: PayrollBatchInputs) -> Dict[str, np.ndarray]:
+        """Calculer toutes les colonnes de résultat (mêmes clés et mêmes valeurs que calculate_employee_payroll)
+
+        Sans heures et avec un salaire exact en centimes, le calcul se fait en centimes int64 (arrondis
+        exacts). Sinon il se fait en float64 ; les employés dont un arrondi tombe trop près d'un demi
+        sont recalculés par le chemin Decimal de référence.
+        """
+        columns = self._calculate_float(inputs)
+        scale = self.calculator.MINOR_UNITS
+
+        base_salary = inputs.base_salary
+        gross_minor = np.rint(base_salary * scale)
+        exact = (
+            (inputs.overtime_hours == 0) & (inputs.absence_hours == 0)
+            & (base_salary >= 0) & (base_salary < MAX_MINOR_UNIT_SALARY)
+            & (gross_minor / scale == base_salary)
+        )
+        if exact.any():
+            minor_columns = self._calculate_minor_units(gross_minor[exact].astype(np.int64))
+            for key, values in minor_columns.items():
+                columns[key][exact] = values
+
+        uncertain = np.flatnonzero(columns.pop("uncertain") & ~exact)
+        for position in uncertain.tolist():
+            reference = self.calculator.calculate_employee_payroll_decimal({
+                "base_salary": inputs.base_salary[position],
+                "overtime_hours": inputs.overtime_hours[position],
+                "absence_hours": inputs.absence_hours[position],
+                "overtime_rate": inputs.overtime_rate[position],
+                "monthly_hours": inputs.monthly_hours[position]
+            })
+            for key, value in reference.items():
+                columns[key][position] = value
+
+        return columns
+
+    def _calculate_minor_units(self, gross: np.ndarray) -> Dict[str, np.ndarray]:
+        """Montants en centimes int64 (salaire sans heures), comme PayrollCalculator._calculate_minor_units"""
+        c = self.calculator
+        scale = c.MINOR_UNITS
+
+        cnss_base = np.minimum(gross, c._cnss_max_minor)
+        rate_num, rate_den = c._cnss_employee_ratio
+        cnss_employee = round_ratio(cnss_base * rate_num, rate_den * scale)
+        rate_num, rate_den = c._cnss_employer_ratio
+        cnss_employer = round_ratio(cnss_base * rate_num, rate_den * scale)
+
+        taxable_income = gross - cnss_employee * scale
+        irpp_amount = round_ratio(*self.tax_table.tax_minor_units_array(taxable_income, scale))
+
+        rate_num, rate_den = c._accident_work_ratio
+        accident_work = round_ratio(gross * rate_num, rate_den * scale)
+        rate_num, rate_den = c._family_allowance_ratio
+        family_allowance = round_ratio(gross * rate_num, rate_den * scale)
+
+        total_employee_deductions = cnss_employee + irpp_amount
+        total_employer_charges = cnss_employer + accident_work + family_allowance
+
+        return {
+            "base_salary": gross / scale,
+            "overtime_amount": 0.0,
+            "absence_deduction": 0.0,
+            "gross_salary": gross / scale,
+            "cnss_employee": cnss_employee,
+            "cnss_employer": cnss_employer,
+            "irpp_amount": irpp_amount,
+            "accident_work": accident_work,
+            "family_allowance": family_allowance,
+            "total_employee_deductions": total_employee_deductions,
+            "total_employer_charges": total_employer_charges,
+            "net_salary": (gross - total_employee_deductions * scale) / scale,
+            "cost_to_company": (gross + total_employer_charges * scale) / scale
+        }
+
+    def _calculate_float(self, inputs: PayrollBatchInputs) -> Dict[str, np.ndarray]:
+        """Montants en float64 ; "uncertain" signale les employés dont un arrondi est douteux"""
+        c = self.calculator
+
+        base_salary = inputs.base_salary
+        hourly_rate = base_salary / inputs.monthly_hours
+        overtime_amount = inputs.overtime_hours * hourly_rate * inputs.overtime_rate
+        absence_deduction = inputs.absence_hours * hourly_rate
+
+        gross_salary = base_salary + overtime_amount - absence_deduction
+        # Ordre de grandeur des montants intermédiaires, qui borne l'erreur des arrondis
+        magnitude = np.abs(base_salary) + np.abs(overtime_amount) + np.abs(absence_deduction)
+
+        # CNSS plafonnée
+        cnss_base = np.minimum(gross_salary, c.CNSS_MAX_SALARY)
+        cnss_employee, uncertain = round_half_up(cnss_base * c.CNSS_EMPLOYEE_RATE, magnitude)
+        cnss_employer, doubt = round_half_up(cnss_base * c.CNSS_EMPLOYER_RATE, magnitude)
+        uncertain |= doubt
+
+        taxable_income = gross_salary - cnss_employee
+        irpp_amount, doubt = round_half_up(self.tax_table.tax_array(taxable_income), magnitude)
+        uncertain |= doubt
+
+        accident_work, doubt = round_half_up(gross_salary * c.ACCIDENT_WORK_RATE, magnitude)
+        uncertain |= doubt
+        family_allowance, doubt = round_half_up(gross_salary * c.FAMILY_ALLOWANCE_RATE, magnitude)
+        uncertain |= doubt
+
+        total_employee_deductions = cnss_employee + irpp_amount
+        total_employer_charges = cnss_employer + accident_work + family_allowance
+        net_salary = gross_salary - total_employee_deductions
+
+        return {
+            "uncertain": uncertain,
+            "base_salary": base_salary,
+            "overtime_amount": overtime_amount,
+            "absence_deduction": absence_deduction,
+            "gross_salary": gross_salary,
+            "cnss_employee": cnss_employee,
+            "cnss_employer": cnss_employer,
+            "irpp_amount": irpp_amount,
+            "accident_work": accident_work,
+            "family_allowance": family_allowance,
+            "total_employee_deductions": total_employee_deductions,
+            "total_employer_charges": total_employer_charges,
+            "net_salary": net_salary,
+            "cost_to_company": gross_salary + total_employer_charges
+        }
+
+    def calculate_batch_payroll(self, inputs: PayrollBatchInputs) -> Dict[str, Any]:
+        """Même format de retour que PayrollCalculator.calculate_batch_payroll"""
+        columns = self.calculate_arrays(inputs)
+
+        keys = list(columns.keys())
+        rows = zip(*(columns[key].tolist() for key in keys))
+        ids = inputs.employee_ids.tolist()
+
+        calculations = []
+        for position, values in enumerate(rows):
+            calculation = dict(zip(keys, values))
+            calculation["employee_id"] = ids[position]
+            calculation["employee_name"] = inputs.employee_names[position]
+            calculations.append(calculation)
+
+        totals = {
+            "total_gross": float(columns["gross_salary"].sum()),
+            "total_net": float(columns["net_salary"].sum()),
+            "total_cnss_employee": float(columns["cnss_employee"].sum()),
+            "total_cnss_employer": float(columns["cnss_employer"].sum()),
+            "total_irpp": float(columns["irpp_amount"].sum()),
+            "total_cost_to_company": float(columns["cost_to_company"].sum())
+        }
+
+        return {
+            "calculations": calculations,
+            "totals": totals,
+            "employees_count": len(calculations)
+        }
+
+    def calculate_company_payroll(self, db: Session, company_id: int, period: str) -> Dict[str, Any]:
+        """Charger les entrées de l'entreprise en colonnes et calculer toute la période"""
+        inputs = load_company_inputs(db, company_id, period, with_variables=False)
+        result = self.calculate_batch_payroll(inputs)
+        result["period"] = period
+        return result
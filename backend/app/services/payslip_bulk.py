@@ -0,0 +1,269 @@
+"""Génération en masse des bulletins PDF d'une période : pool de processus, ZIP en flux ou dossier local"""
+
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.crud_payroll import YTD_STATUSES, load_breakdowns
+from app.db import models
+
+# Montants du détail repris tels quels sur le bulletin (format de PayrollCalculator)
+PAYSLIP_BREAKDOWN_FIELDS = (
+    "base_salary", "overtime_hours", "overtime_amount", "absence_hours", "absence_deduction",
+    "cnss_employer", "accident_work", "family_allowance", "total_employer_charges", "cost_to_company"
+)
+
+# Bulletins lus par requête
+PAYSLIP_LOAD_BATCH_SIZE = 1000
+
+# Générateur PDF propre à chaque processus
+_worker_generator = None
+
+
+def payslip_filename(employee_id: int, employee_name: str, period: str) -> str:
+    safe_name = re.sub(r"[^A-Za-z0-9]+", "_", employee_name or "").strip("_") or "employe"
+    return f"bulletin_{employee_id}_{safe_name}_{period}.pdf"
+
+
+def render_chunk(payslips: List[Dict[str, Any]], renderer: str = "canvas") -> List[Tuple[str, Optional[bytes], Optional[str]]]:
+    """Rendre un lot de bulletins (exécuté dans un processus du pool) : [(fichier, pdf, erreur)]"""
+    global _worker_generator
+    if _worker_generator is None:
+        from app.services.pdf_generator import PayslipPDFGenerator
+        _worker_generator = PayslipPDFGenerator()
+
+    rendered = []
+    for payslip in payslips:
+        filename = payslip_filename(payslip["employee_id"], payslip.get("employee_name"), payslip.get("period", ""))
+        try:
+            rendered.append((filename, _worker_generator.generate_payslip_pdf(payslip, renderer).getvalue(), None))
+        except Exception as e:
+            rendered.append((filename, None, str(e)))
+    return rendered
+
+
+def _payslip_data(record, breakdown: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Données de generate_payslip_pdf depuis un bulletin enregistré"""
+    breakdown = breakdown or {}
+    data = {
+        field: breakdown[field]
+        for field in PAYSLIP_BREAKDOWN_FIELDS
+        if isinstance(breakdown.get(field), (int, float))
+    }
+    data.update({
+        "employee_id": record.employee_id,
+        "employee_name": record.employee_name,
+        "period": record.period,
+        "gross_salary": record.gross_salary or 0,
+        "cnss_employee": record.social_contributions or 0,
+        "irpp_amount": record.tax_amount or 0,
+        "total_employee_deductions": (record.social_contributions or 0) + (record.tax_amount or 0),
+        "net_salary": record.net_salary or 0
+    })
+    data.setdefault("base_salary", data["gross_salary"])
+    data.setdefault("cost_to_company", data["gross_salary"] + data.get("total_employer_charges", data.get("cnss_employer", 0)))
+
+    # Cumuls à la date du bulletin : mois validés antérieurs de l'année + le bulletin lui-même
+    data["ytd"] = {
+        "year": int(record.period[:4]),
+        "gross_salary": (record.ytd_gross_salary or 0) + (record.gross_salary or 0),
+        "taxable_income": (record.ytd_taxable_income or 0) + (record.taxable_income or 0),
+        "cnss_employee": (record.ytd_cnss_employee or 0) + (record.social_contributions or 0),
+        "irpp": (record.ytd_irpp or 0) + (record.tax_amount or 0),
+        "net_salary": (record.ytd_net_salary or 0) + (record.net_salary or 0)
+    }
+    return data
+
+
+def iter_period_payslips(
+    db: Session,
+    company_id: int,
+    period: str,
+    employee_ids: Optional[List[int]] = None,
+    statuses: Optional[Iterable[str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Données des bulletins d'une période, lues par lots (pagination sur l'id, une requête de détail par lot)
+
+    Les cumuls ne lisent pas payroll_ytd_ledger (toute l'année à ce jour) : un bulletin réimprimé
+    plus tard affiche les mêmes montants.
+    """
+    prior = models.PayrollRecord
+    earlier = db.query(
+        prior.employee_id.label("employee_id"),
+        func.sum(prior.gross_salary).label("gross_salary"),
+        func.sum(prior.taxable_income).label("taxable_income"),
+        func.sum(prior.social_contributions).label("cnss_employee"),
+        func.sum(prior.tax_amount).label("irpp"),
+        func.sum(prior.net_salary).label("net_salary")
+    ).join(
+        models.Employee, models.Employee.id == prior.employee_id
+    ).filter(
+        models.Employee.company_id == company_id,
+        # Bornes plutôt que LIKE : seules les partitions de l'année sont lues
+        prior.period >= f"{period[:4]}-01",
+        prior.period < period,
+        prior.status.in_(YTD_STATUSES)
+    ).group_by(prior.employee_id).subquery()
+
+    query = db.query(
+        models.PayrollRecord.id,
+        models.PayrollRecord.employee_id,
+        models.Employee.name.label("employee_name"),
+        models.PayrollRecord.period,
+        models.PayrollRecord.gross_salary,
+        models.PayrollRecord.taxable_income,
+        models.PayrollRecord.social_contributions,
+        models.PayrollRecord.tax_amount,
+        models.PayrollRecord.net_salary,
+        models.PayrollRecord.breakdown_json,
+        earlier.c.gross_salary.label("ytd_gross_salary"),
+        earlier.c.taxable_income.label("ytd_taxable_income"),
+        earlier.c.cnss_employee.label("ytd_cnss_employee"),
+        earlier.c.irpp.label("ytd_irpp"),
+        earlier.c.net_salary.label("ytd_net_salary")
+    ).join(
+        models.Employee, models.Employee.id == models.PayrollRecord.employee_id
+    ).outerjoin(
+        earlier, earlier.c.employee_id == models.PayrollRecord.employee_id
+    ).filter(
+        models.Employee.company_id == company_id,
+        models.PayrollRecord.period == period
+    )
+    if employee_ids:
+        query = query.filter(models.PayrollRecord.employee_id.in_(employee_ids))
+    if statuses:
+        query = query.filter(models.PayrollRecord.status.in_(list(statuses)))
+
+    last_id = 0
+    while True:
+        records = query.filter(models.PayrollRecord.id > last_id).order_by(
+            models.PayrollRecord.id
+        ).limit(PAYSLIP_LOAD_BATCH_SIZE).all()
+        if not records:
+            return
+        last_id = records[-1].id
+
+        breakdowns = load_breakdowns(db, {record.id: record.breakdown_json for record in records})
+        for record in records:
+            yield _payslip_data(record, breakdowns[record.id])
+
+
+class _ZipSink:
+    """Flux d'écriture non positionnable : zipfile y écrit, les octets sont récupérés après chaque fichier"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+class PayslipBulkRenderer:
+    """Rendu de nombreux bulletins sur un pool de processus, avec un nombre borné de lots en cours"""
+
+    def __init__(self, workers: int = None, chunk_size: int = None):
+        self.workers = workers or settings.PAYSLIP_WORKERS or os.cpu_count() or 1
+        self.chunk_size = chunk_size or settings.PAYSLIP_CHUNK_SIZE
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Pool de processus créé au premier usage puis réutilisé"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def shutdown(self):
+        """Arrêter le pool de processus"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _chunks(self, payslips: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        chunk = []
+        for payslip in payslips:
+            chunk.append(payslip)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def render(
+        self, payslips: Iterable[Dict[str, Any]], renderer: str = "canvas"
+    ) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+        """Bulletins rendus dans l'ordre où ils se terminent : (fichier, pdf, erreur)
+
+        Au plus deux lots par processus sont en cours : la mémoire ne dépend pas du nombre de bulletins.
+        """
+        chunks = self._chunks(payslips)
+        if self.workers <= 1:
+            for chunk in chunks:
+                yield from render_chunk(chunk, renderer)
+            return
+
+        pool = self._get_pool()
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(render_chunk, chunk, renderer))
+            if len(pending) >= 2 * self.workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+    def stream_zip(self, payslips: Iterable[Dict[str, Any]], renderer: str = "canvas") -> Iterator[bytes]:
+        """Archive ZIP envoyée au fil des bulletins terminés ; les erreurs sont listées dans erreurs.txt"""
+        sink = _ZipSink()
+        errors = []
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            for filename, pdf, error in self.render(payslips, renderer):
+                if error:
+                    errors.append(f"{filename}: {error}")
+                    continue
+                archive.writestr(filename, pdf)
+                yield sink.drain()
+            if errors:
+                archive.writestr("erreurs.txt", "\n".join(errors))
+        yield sink.drain()
+
+    def write_directory(
+        self, payslips: Iterable[Dict[str, Any]], output_dir: str, renderer: str = "canvas"
+    ) -> Dict[str, Any]:
+        """Écrire les bulletins dans un dossier local, au fil de l'eau"""
+        os.makedirs(output_dir, exist_ok=True)
+        written = 0
+        errors = []
+        for filename, pdf, error in self.render(payslips, renderer):
+            if error:
+                errors.append(f"{filename}: {error}")
+                continue
+            with open(os.path.join(output_dir, filename), "wb") as output:
+                output.write(pdf)
+            written += 1
+        return {"directory": os.path.abspath(output_dir), "written": written, "errors": errors}
+
+
+# Instance globale
+payslip_bulk_renderer = PayslipBulkRenderer()
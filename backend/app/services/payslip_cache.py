@@ -0,0 +1,114 @@
+"""Cache disque des bulletins PDF, adressé par le contenu : empreinte des données et version du gabarit"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from app.core.config import settings
+
+# À incrémenter à chaque modification de la mise en page : les anciens fichiers ne sont plus servis
+PAYSLIP_TEMPLATE_VERSION = 1
+
+
+def payslip_etag(key: str) -> str:
+    return f'"{key}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match contient-il l'ETag (ou "*") ?"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+class PayslipPDFCache:
+    """Bulletins rendus rangés par bulletin de paie : <dossier>/<record_id>/<empreinte>.pdf
+
+    Un bulletin modifié donne une autre empreinte ; invalidate() supprime les fichiers
+    devenus inutiles lorsqu'un bulletin est réécrit ou revalidé.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or settings.PAYSLIP_CACHE_DIR
+
+    def key(self, payslip_data: Dict[str, Any], renderer: str) -> str:
+        """Empreinte des données du bulletin, du moteur de rendu et de la version du gabarit"""
+        content = json.dumps(
+            {"template": PAYSLIP_TEMPLATE_VERSION, "renderer": renderer, "data": payslip_data},
+            sort_keys=True, default=str, separators=(",", ":")
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def path(self, record_id: int, key: str) -> str:
+        return os.path.join(self.directory, str(record_id), f"{key}.pdf")
+
+    def get_or_render(self, record_id: int, key: str, render: Callable[[], bytes]) -> str:
+        """Chemin du PDF en cache, rendu et écrit (atomiquement) s'il n'existe pas encore"""
+        path = self.path(record_id, key)
+        if os.path.exists(path):
+            return path
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Fichier temporaire dans le même dossier : os.replace reste atomique
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as output:
+                output.write(render())
+            os.replace(temporary, path)
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return path
+
+    def invalidate(self, record_ids: Iterable[int]) -> int:
+        """Supprimer les PDF en cache des bulletins ; retourne le nombre de bulletins purgés"""
+        purged = 0
+        for record_id in set(record_ids):
+            directory = os.path.join(self.directory, str(record_id))
+            if os.path.isdir(directory):
+                shutil.rmtree(directory, ignore_errors=True)
+                purged += 1
+        return purged
+
+
+def serve_payslip_pdf(
+    request: Request,
+    record_id: int,
+    payslip_data: Dict[str, Any],
+    render: Callable[[], bytes],
+    filename: str,
+    renderer: str = "platypus",
+    store: bool = True,
+    cache: Optional[PayslipPDFCache] = None
+) -> Response:
+    """Réponse de téléchargement : 304 si le client a déjà cette version, sinon le fichier en cache
+
+    store=False (bulletin encore modifiable) : rendu à la volée, sans écriture sur disque.
+    """
+    cache = cache or payslip_pdf_cache
+    key = cache.key(payslip_data, renderer)
+    headers = {"ETag": payslip_etag(key), "Cache-Control": "private, no-cache"}
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = f"attachment; filename={filename}"
+    if not store:
+        return Response(render(), media_type="application/pdf", headers=headers)
+
+    # FileResponse : envoi par morceaux depuis le disque (sendfile si le serveur le permet)
+    path = cache.get_or_render(record_id, key, render)
+    return FileResponse(path, media_type="application/pdf", headers=headers)
+
+
+# Instance globale
+payslip_pdf_cache = PayslipPDFCache()
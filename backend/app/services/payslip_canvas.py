@@ -0,0 +1,323 @@
+"""Rendu rapide des bulletins sur un canvas reportlab : gabarit fixe en form XObject, seules les valeurs varient"""
+
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfbase.pdfmetrics import getFont, stringWidth
+from reportlab.pdfgen import canvas
+
+from app.services.pdf_writer import IncrementalPDFWriter
+
+# Noms des form XObjects du gabarit (définis une fois par document)
+TEMPLATE_FORM = "payslip_template"
+YTD_FORM = "payslip_ytd"
+
+# Polices du gabarit, enregistrées dans cet ordre dans chaque document
+TEMPLATE_FONTS = ("Helvetica", "Helvetica-Bold")
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+LEFT = 2 * cm
+TOP = PAGE_HEIGHT - 2 * cm
+CELL_PADDING = 6
+
+# Cellule : texte fixe (dessiné dans le gabarit) ou fonction des données (dessinée par bulletin)
+Cell = Union[str, Callable[[Dict[str, Any]], str]]
+
+MONTHS = {
+    '01': 'Janvier', '02': 'Février', '03': 'Mars', '04': 'Avril',
+    '05': 'Mai', '06': 'Juin', '07': 'Juillet', '08': 'Août',
+    '09': 'Septembre', '10': 'Octobre', '11': 'Novembre', '12': 'Décembre'
+}
+
+
+def format_period(period: str) -> str:
+    """Formate la période pour l'affichage (même rendu que PayslipPDFGenerator)"""
+    try:
+        year, month = period.split('-')
+        return f"{MONTHS.get(month, month)} {year}"
+    except (AttributeError, ValueError):
+        return period
+
+
+def _amount(key: str, prefix: str = "") -> Callable[[Dict[str, Any]], str]:
+    return lambda data: f"{prefix}{data.get(key, 0) or 0:,.0f}"
+
+
+def _ytd_amount(key: str) -> Callable[[Dict[str, Any]], str]:
+    return lambda data: f"{(data.get('ytd') or {}).get(key, 0) or 0:,.0f}"
+
+
+class _Row:
+    def __init__(self, cells: Sequence[Cell], height: float, background=None, font: str = "Helvetica",
+                 size: float = 10, color=colors.black):
+        self.cells = cells
+        self.height = height
+        self.background = background
+        self.font = font
+        self.size = size
+        self.color = color
+
+
+class PayslipTemplate:
+    """Gabarit précalculé : opérations fixes (fonds, grilles, libellés) et emplacements des valeurs"""
+
+    def __init__(self):
+        self.static: List[Tuple] = []
+        self.ytd_static: List[Tuple] = []
+        self.slots: List[Tuple] = []
+        self.ytd_slots: List[Tuple] = []
+        self._build()
+
+    def _table(self, top: float, widths: Sequence[float], rows: Sequence[_Row], align: Sequence[str],
+               grid: bool = True, static: List[Tuple] = None, slots: List[Tuple] = None) -> float:
+        """Placer un tableau sous `top` ; retourne le bas du tableau"""
+        static = self.static if static is None else static
+        slots = self.slots if slots is None else slots
+        y = top
+        for row in rows:
+            y -= row.height
+            if row.background is not None:
+                static.append(("rect", row.background, LEFT, y, sum(widths), row.height))
+            baseline = y + (row.height - row.size * 0.7) / 2
+            x = LEFT
+            for width, cell, alignment in zip(widths, row.cells, align):
+                if alignment == "LEFT":
+                    anchor = x + CELL_PADDING
+                elif alignment == "RIGHT":
+                    anchor = x + width - CELL_PADDING
+                else:
+                    anchor = x + width / 2
+                operation = (row.font, row.size, row.color, alignment, anchor, baseline, cell)
+                if callable(cell):
+                    slots.append(operation)
+                elif cell:
+                    static.append(("text",) + operation)
+                x += width
+
+        if grid:
+            x_positions = [LEFT]
+            for width in widths:
+                x_positions.append(x_positions[-1] + width)
+            y_positions = [top]
+            for row in rows:
+                y_positions.append(y_positions[-1] - row.height)
+            static.append(("grid", x_positions, y_positions))
+        return y
+
+    def _build(self):
+        period = lambda data: f"Période: {format_period(data.get('period', ''))}"
+
+        # En-tête
+        y = self._table(TOP, [8 * cm, 8 * cm], [
+            _Row(["NOVACORE SARL", "BULLETIN DE PAIE"], 30, colors.darkblue, "Helvetica-Bold", 14, colors.whitesmoke),
+            _Row(["Système de Gestion RH", period], 24, colors.darkblue, size=10, color=colors.whitesmoke),
+            _Row(["Dakar, Sénégal", lambda data: f"Généré le: {data['_generated_on']}"], 24, colors.darkblue,
+                 size=10, color=colors.whitesmoke)
+        ], ["LEFT", "RIGHT"], grid=False)
+        y -= 0.5 * cm
+
+        # Entreprise et employé
+        y = self._table(y, [8 * cm, 8 * cm], [
+            _Row(["ENTREPRISE", "EMPLOYÉ"], 26, colors.grey, "Helvetica-Bold", 12, colors.whitesmoke),
+            _Row(["NovaCore SARL", lambda data: str(data.get('employee_name', 'N/A'))], 18, colors.beige),
+            _Row(["Dakar, Sénégal", lambda data: f"ID: {data.get('employee_id', 'N/A')}"], 18, colors.beige),
+            _Row(["NINEA: 123456789", period], 18, colors.beige)
+        ], ["LEFT", "LEFT"])
+        y -= 1 * cm
+
+        amounts = [6 * cm, 3 * cm, 2 * cm, 5 * cm]
+        centered = ["CENTER"] * 4
+
+        # Salaire brut (heures supplémentaires et absences toujours présentes : gabarit fixe)
+        y = self._table(y, amounts, [
+            _Row(["ÉLÉMENTS", "BASE", "TAUX", "MONTANT"], 24, colors.darkblue, "Helvetica-Bold", 10, colors.whitesmoke),
+            _Row(["Salaire de base", _amount('base_salary'), "100%", _amount('base_salary')], 18),
+            _Row(["Heures supplémentaires", lambda data: f"{data.get('overtime_hours', 0)} h", "150%",
+                  _amount('overtime_amount')], 18),
+            _Row(["Déduction absences", lambda data: f"{data.get('absence_hours', 0)} h", "-100%",
+                  _amount('absence_deduction', "-")], 18),
+            _Row(["SALAIRE BRUT", "", "", _amount('gross_salary')], 18, colors.lightblue, "Helvetica-Bold")
+        ], centered)
+        y -= 0.5 * cm
+
+        # Déductions
+        y = self._table(y, amounts, [
+            _Row(["DÉDUCTIONS", "BASE", "TAUX", "MONTANT"], 24, colors.darkred, "Helvetica-Bold", 10, colors.whitesmoke),
+            _Row(["CNSS Employé", lambda data: f"{min(data.get('gross_salary', 0), 1800000):,.0f}", "5.6%",
+                  _amount('cnss_employee')], 18),
+            _Row(["IRPP", lambda data: f"{data.get('gross_salary', 0) - data.get('cnss_employee', 0):,.0f}",
+                  "Variable", _amount('irpp_amount')], 18),
+            _Row(["TOTAL DÉDUCTIONS", "", "", _amount('total_employee_deductions')], 18, colors.lightcoral,
+                 "Helvetica-Bold")
+        ], centered)
+        y -= 0.5 * cm
+
+        # Charges patronales
+        y = self._table(y, amounts, [
+            _Row(["CHARGES PATRONALES", "BASE", "TAUX", "MONTANT"], 24, colors.darkorange, "Helvetica-Bold", 10,
+                 colors.whitesmoke),
+            _Row(["CNSS Employeur", lambda data: f"{min(data.get('gross_salary', 0), 1800000):,.0f}", "8.4%",
+                  _amount('cnss_employer')], 18),
+            _Row(["Accident du travail", _amount('gross_salary'), "1%", _amount('accident_work')], 18),
+            _Row(["Allocations familiales", _amount('gross_salary'), "7%", _amount('family_allowance')], 18),
+            _Row(["TOTAL CHARGES", "", "", _amount('total_employer_charges')], 18, colors.orange, "Helvetica-Bold")
+        ], centered)
+        y -= 1 * cm
+
+        # Cumuls annuels : form séparé, dessiné seulement si disponibles (place toujours réservée)
+        y = self._table(y, [3.5 * cm] + [2.5 * cm] * 5, [
+            _Row([lambda data: f"CUMULS {(data.get('ytd') or {}).get('year', '')}", "BRUT", "IMPOSABLE", "CNSS",
+                  "IRPP", "NET"], 16, colors.grey, "Helvetica-Bold", 9, colors.whitesmoke),
+            _Row(["Depuis janvier", _ytd_amount('gross_salary'), _ytd_amount('taxable_income'),
+                  _ytd_amount('cnss_employee'), _ytd_amount('irpp'), _ytd_amount('net_salary')], 16, size=9)
+        ], ["CENTER"] * 6, static=self.ytd_static, slots=self.ytd_slots)
+        y -= 1 * cm
+
+        # Résumé
+        y = self._table(y, [10 * cm, 6 * cm], [
+            _Row(["SALAIRE BRUT", lambda data: f"{data.get('gross_salary', 0):,.0f} FCFA"], 18, colors.lightgrey),
+            _Row(["TOTAL DÉDUCTIONS", lambda data: f"-{data.get('total_employee_deductions', 0):,.0f} FCFA"], 18,
+                 colors.lightgrey),
+            _Row(["SALAIRE NET À PAYER", lambda data: f"{data.get('net_salary', 0):,.0f} FCFA"], 22,
+                 colors.darkgreen, "Helvetica-Bold", 12, colors.whitesmoke),
+            _Row(["COÛT TOTAL EMPLOYEUR", lambda data: f"{data.get('cost_to_company', 0):,.0f} FCFA"], 22,
+                 colors.lightyellow, "Helvetica-Bold", 12)
+        ], ["CENTER", "CENTER"])
+        y -= 1 * cm
+
+        # Pied de page
+        self.slots.append(("Helvetica", 10, colors.black, "LEFT", LEFT, y,
+                           lambda data: f"Bulletin généré le {data['_generated_at']}"))
+
+
+def _text_x(font: str, size: float, alignment: str, x: float, text: str) -> float:
+    if alignment == "LEFT":
+        return x
+    width = stringWidth(text, font, size)
+    return x - width if alignment == "RIGHT" else x - width / 2
+
+
+def _draw_static(c: canvas.Canvas, operations: List[Tuple]):
+    c.setStrokeColor(colors.black)
+    c.setLineWidth(1)
+    for operation in operations:
+        kind = operation[0]
+        if kind == "rect":
+            _, color, x, y, width, height = operation
+            c.setFillColor(color)
+            c.rect(x, y, width, height, stroke=0, fill=1)
+        elif kind == "grid":
+            c.grid(operation[1], operation[2])
+        else:
+            _, font, size, color, alignment, x, y, text = operation
+            c.setFont(font, size)
+            c.setFillColor(color)
+            c.drawString(_text_x(font, size, alignment, x, text), y, text)
+
+
+def register_template_fonts(c: canvas.Canvas):
+    """Même ordre d'enregistrement dans chaque document : mêmes noms internes (/F1, /F2...)"""
+    for font in TEMPLATE_FONTS:
+        c.setFont(font, 10)
+
+
+def _fill_code(color) -> str:
+    return f"{fp_str(color.red, color.green, color.blue)} rg"
+
+
+def _values_code(c: canvas.Canvas, slots: List[Tuple], data: Dict[str, Any]) -> str:
+    """Toutes les valeurs dans un seul objet texte, opérateurs écrits directement
+
+    Largeurs calculées sur les métriques de la police (pas de stringWidth par valeur) ; police et
+    couleur émises seulement quand elles changent. Les caractères hors WinAnsi deviennent « ? » :
+    aucune police de substitution n'est ajoutée au document.
+    """
+    code = ["BT"]
+    current_font = current_color = None
+    widths = encoding = None
+    for font, size, color, alignment, x, y, value in slots:
+        if (font, size) != current_font:
+            code.append(f"{c._doc.getInternalFontName(font)} {fp_str(size)} Tf")
+            current_font = (font, size)
+            metrics = getFont(font)
+            widths, encoding = metrics.widths, metrics.encName
+        if color is not current_color:
+            code.append(_fill_code(color))
+            current_color = color
+        text = value(data).encode(encoding, "replace")
+        if alignment != "LEFT":
+            width = sum(widths[char] for char in text) * size * 0.001
+            x -= width if alignment == "RIGHT" else width / 2
+        code.append(f"1 0 0 1 {x:.2f} {y:.2f} Tm ({c._escape(text)}) Tj")
+    code.append("ET")
+    return "\n".join(code)
+
+
+class PayslipCanvasRenderer:
+    """Bulletins dessinés à partir du gabarit précalculé : seules les valeurs sont produites par page"""
+
+    def __init__(self, template: Optional[PayslipTemplate] = None):
+        self.template = template or PayslipTemplate()
+        self._form_code: Optional[Dict[str, str]] = None
+        self._scratch: Optional[canvas.Canvas] = None
+
+    def template_code(self) -> Dict[str, str]:
+        """Opérateurs PDF du gabarit, produits une seule fois puis recopiés dans chaque document"""
+        if self._form_code is None:
+            scratch = canvas.Canvas(BytesIO(), pagesize=A4)
+            register_template_fonts(scratch)
+            form_code = {}
+            for name, operations in ((TEMPLATE_FORM, self.template.static), (YTD_FORM, self.template.ytd_static)):
+                scratch.beginForm(name)
+                _draw_static(scratch, operations)
+                form_code[name] = "\n".join(scratch._code)
+                scratch.endForm()
+            self._form_code = form_code
+        return self._form_code
+
+    def scratch_canvas(self) -> canvas.Canvas:
+        """Canvas de brouillon (polices du gabarit enregistrées) qui ne sert qu'au codage du texte"""
+        if self._scratch is None:
+            scratch = canvas.Canvas(BytesIO(), pagesize=A4)
+            register_template_fonts(scratch)
+            self._scratch = scratch
+        return self._scratch
+
+    def _page(self, payslip_data: Dict[str, Any], now: Optional[datetime]) -> Tuple[Dict[str, Any], List[str], List[Tuple]]:
+        """Données complétées, forms à afficher et emplacements des valeurs d'une page"""
+        now = now or datetime.now()
+        data = dict(payslip_data, _generated_on=now.strftime('%d/%m/%Y'),
+                    _generated_at=now.strftime('%d/%m/%Y à %H:%M'))
+        if data.get('ytd'):
+            return data, [TEMPLATE_FORM, YTD_FORM], self.template.slots + self.template.ytd_slots
+        return data, [TEMPLATE_FORM], self.template.slots
+
+    def page_code(self, c: canvas.Canvas, payslip_data: Dict[str, Any], now: Optional[datetime] = None) -> str:
+        """Opérateurs PDF d'une page pour un document écrit hors canvas (forms nommés comme TEMPLATE_FORM)
+
+        c ne sert qu'au codage du texte : ses polices doivent avoir été enregistrées par register_template_fonts.
+        """
+        data, forms, slots = self._page(payslip_data, now)
+        return "\n".join([f"/{name} Do" for name in forms] + [_values_code(c, slots, data)])
+
+    def generate_payslip_pdf(self, payslip_data: Dict[str, Any]) -> BytesIO:
+        """Même entrée et même sortie que PayslipPDFGenerator.generate_payslip_pdf"""
+        scratch = self.scratch_canvas()
+        fonts = {scratch._doc.getInternalFontName(font)[1:]: font for font in TEMPLATE_FONTS}
+        # Flux non compressés : une page seule, la compression coûterait plus qu'elle ne rapporte
+        writer = IncrementalPDFWriter(fonts, compress=False)
+        buffer = BytesIO()
+        buffer.write(writer.begin(self.template_code()))
+        buffer.write(writer.page(self.page_code(scratch, payslip_data)))
+        buffer.write(writer.end())
+        buffer.seek(0)
+        return buffer
+
+
+# Instance globale
+payslip_canvas_renderer = PayslipCanvasRenderer()
@@ -8,6 +8,11 @@ from io import BytesIO
 from datetime import datetime
 from typing import Dict, Any
 
+from app.services.payslip_canvas import payslip_canvas_renderer
+
+# Moteurs de rendu des bulletins
+PAYSLIP_RENDERERS = ("platypus", "canvas")
+
 class PayslipPDFGenerator:
     """Générateur de bulletins de paie en PDF"""
     
@@ -21,8 +26,13 @@ class PayslipPDFGenerator:
             alignment=1  # Center
         )
         
-    def generate_payslip_pdf(self, payslip_data: Dict[str, Any]) -> BytesIO:
-        """Génère un bulletin de paie en PDF"""
+    def generate_payslip_pdf(self, payslip_data: Dict[str, Any], renderer: str = "platypus") -> BytesIO:
+        """Génère un bulletin de paie en PDF (renderer="canvas" : gabarit précalculé, bien plus rapide)"""
+        
+        if renderer == "canvas":
+            return payslip_canvas_renderer.generate_payslip_pdf(payslip_data)
+        if renderer not in PAYSLIP_RENDERERS:
+            raise ValueError(f"Moteur de rendu inconnu : {renderer}")
         
         buffer = BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, 
@@ -170,6 +180,32 @@ class PayslipPDFGenerator:
         story.append(employer_table)
         story.append(Spacer(1, 1*cm))
         
+        # Cumuls annuels (si disponibles)
+        ytd = payslip_data.get('ytd')
+        if ytd:
+            ytd_data = [
+                [f"CUMULS {ytd.get('year', '')}", "BRUT", "IMPOSABLE", "CNSS", "IRPP", "NET"],
+                ["Depuis janvier",
+                 f"{ytd.get('gross_salary', 0):,.0f}",
+                 f"{ytd.get('taxable_income', 0):,.0f}",
+                 f"{ytd.get('cnss_employee', 0):,.0f}",
+                 f"{ytd.get('irpp', 0):,.0f}",
+                 f"{ytd.get('net_salary', 0):,.0f}"]
+            ]
+            
+            ytd_table = Table(ytd_data, colWidths=[3.5*cm, 2.5*cm, 2.5*cm, 2.5*cm, 2.5*cm, 2.5*cm])
+            ytd_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            
+            story.append(ytd_table)
+            story.append(Spacer(1, 1*cm))
+        
         # Résumé final
         summary_data = [
             ["SALAIRE BRUT", f"{payslip_data.get('gross_salary', 0):,.0f} FCFA"],
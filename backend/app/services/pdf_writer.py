@@ -0,0 +1,105 @@
+"""Écriture d'un PDF objet par objet, sans canvas reportlab : polices standard, form XObjects et pages"""
+
+import zlib
+from typing import Dict, List, Optional
+
+from reportlab.lib.pagesizes import A4
+
+
+class IncrementalPDFWriter:
+    """PDF écrit objet par objet : begin(), page() autant que nécessaire, end()
+
+    Chaque appel retourne les octets à écrire à la suite ; le catalogue et l'arbre des pages
+    (numéros d'objets réservés au départ) sont écrits à la fin avec la table xref.
+    """
+
+    def __init__(self, fonts: Dict[str, str], page_size=A4, compress: bool = True):
+        self.fonts = fonts  # nom interne (F1...) -> police standard
+        self.width, self.height = page_size
+        self.compress = compress
+        self._offsets: List[int] = [0]
+        self._position = 0
+        self._page_ids: List[int] = []
+        self._catalog = self._reserve()
+        self._pages = self._reserve()
+        self._resources = None
+
+    def _reserve(self) -> int:
+        self._offsets.append(0)
+        return len(self._offsets) - 1
+
+    def _object(self, number: int, body: bytes) -> bytes:
+        data = b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        self._offsets[number] = self._position
+        self._position += len(data)
+        return data
+
+    def _stream(self, number: int, dictionary: str, code: str) -> bytes:
+        content = code.encode("latin-1")
+        if self.compress:
+            content = zlib.compress(content)
+            dictionary += " /Filter /FlateDecode"
+        return self._object(number, b"<< %s /Length %d >>\nstream\n%s\nendstream" % (
+            dictionary.encode("ascii"), len(content), content
+        ))
+
+    def _header(self, data: bytes) -> bytes:
+        self._position += len(data)
+        return data
+
+    def begin(self, forms: Optional[Dict[str, str]] = None) -> bytes:
+        """En-tête, polices et form XObjects (gabarits partagés par toutes les pages)"""
+        parts = [self._header(b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n")]
+
+        font_refs = []
+        for name, font in self.fonts.items():
+            number = self._reserve()
+            parts.append(self._object(number, (
+                f"<< /Type /Font /Subtype /Type1 /Name /{name} /BaseFont /{font} /Encoding /WinAnsiEncoding >>"
+            ).encode("ascii")))
+            font_refs.append(f"/{name} {number} 0 R")
+        font_dict = f"/Font << {' '.join(font_refs)} >>"
+
+        form_refs = []
+        for name, code in (forms or {}).items():
+            number = self._reserve()
+            parts.append(self._stream(
+                number,
+                f"/Type /XObject /Subtype /Form /FormType 1 /BBox [0 0 {self.width:.2f} {self.height:.2f}] "
+                f"/Resources << {font_dict} >>",
+                code
+            ))
+            form_refs.append(f"/{name} {number} 0 R")
+
+        self._resources = self._reserve()
+        xobjects = f" /XObject << {' '.join(form_refs)} >>" if form_refs else ""
+        parts.append(self._object(
+            self._resources, f"<< /ProcSet [/PDF /Text] {font_dict}{xobjects} >>".encode("ascii")
+        ))
+        return b"".join(parts)
+
+    def page(self, code: str) -> bytes:
+        """Une page : flux de contenu puis objet page"""
+        contents = self._reserve()
+        page = self._reserve()
+        self._page_ids.append(page)
+        return self._stream(contents, "", code) + self._object(page, (
+            f"<< /Type /Page /Parent {self._pages} 0 R /MediaBox [0 0 {self.width:.2f} {self.height:.2f}] "
+            f"/Resources {self._resources} 0 R /Contents {contents} 0 R >>"
+        ).encode("ascii"))
+
+    def end(self) -> bytes:
+        """Arbre des pages, catalogue, table xref et trailer"""
+        kids = " ".join(f"{page} 0 R" for page in self._page_ids)
+        parts = [
+            self._object(self._pages, f"<< /Type /Pages /Count {len(self._page_ids)} /Kids [{kids}] >>".encode("ascii")),
+            self._object(self._catalog, f"<< /Type /Catalog /Pages {self._pages} 0 R >>".encode("ascii"))
+        ]
+        xref = self._position
+        entries = ["xref", f"0 {len(self._offsets)}", "0000000000 65535 f "]
+        entries.extend(f"{offset:010d} 00000 n " for offset in self._offsets[1:])
+        parts.append(("\n".join(entries) + "\n").encode("ascii"))
+        parts.append(
+            f"trailer\n<< /Size {len(self._offsets)} /Root {self._catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+        )
+        return b"".join(parts)
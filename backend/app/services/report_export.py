@@ -0,0 +1,221 @@
+"""Export de rapports en flux : requête SQLAlchemy ou générateur de lignes -> CSV, JSON, NDJSON, XLSX"""
+
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy.orm import Query, Session
+
+from app.db.database import SessionLocal
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # Export XLSX indisponible sans openpyxl
+    Workbook = None
+
+# Taille visée d'un morceau envoyé au client
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Lignes lues par aller-retour avec la base (curseur serveur)
+EXPORT_BATCH_SIZE = 1000
+
+# Format -> (type MIME, extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx")
+}
+
+
+class ReportExportError(ValueError):
+    """Format, colonne ou limite d'export invalide"""
+
+
+def _json_value(value: Any):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _cell_value(value: Any):
+    # openpyxl n'accepte que les types simples
+    if value is None or isinstance(value, (str, int, float, bool, date, datetime, Decimal)):
+        return value
+    return str(value)
+
+
+class ReportExport:
+    """Source de lignes projetée et limitée, sérialisée en flux (mémoire constante)
+
+    source : requête SQLAlchemy (lue avec yield_per) ou itérable de dicts.
+    columns : colonnes à exporter, dans l'ordre (toutes par défaut).
+    """
+
+    def __init__(
+        self,
+        source: Any,
+        columns: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None,
+        available_columns: Optional[Sequence[str]] = None
+    ):
+        if limit is not None and limit < 0:
+            raise ReportExportError("La limite doit être positive")
+
+        if isinstance(source, Query):
+            available_columns = available_columns or [column["name"] for column in source.column_descriptions]
+            if limit is not None:
+                source = source.limit(limit)
+            source = (row._asdict() for row in source.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+        else:
+            source = iter(source)
+            if available_columns is None:
+                # Générateur sans colonnes déclarées : celles de la première ligne
+                first = next(source, None)
+                available_columns = list(first) if first is not None else []
+                source = source if first is None else _chain_first(first, source)
+            if limit is not None:
+                source = islice(source, limit)
+
+        if columns:
+            unknown = [column for column in columns if column not in available_columns]
+            if unknown:
+                raise ReportExportError(f"Colonne(s) inconnue(s) : {', '.join(unknown)}")
+        self.columns: List[str] = list(columns or available_columns)
+        self._source = source
+
+    def rows(self) -> Iterator[tuple]:
+        """Lignes projetées sur les colonnes demandées"""
+        columns = self.columns
+        for row in self._source:
+            yield tuple(row.get(column) for column in columns)
+
+    def dicts(self) -> Iterator[Dict[str, Any]]:
+        columns = self.columns
+        for row in self.rows():
+            yield dict(zip(columns, row))
+
+    def iter_csv(self) -> Iterator[bytes]:
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(self.columns)
+        for row in self.rows():
+            writer.writerow(row)
+            if output.tell() >= EXPORT_CHUNK_SIZE:
+                yield output.getvalue().encode("utf-8")
+                output.seek(0)
+                output.truncate()
+        yield output.getvalue().encode("utf-8")
+
+    def iter_ndjson(self) -> Iterator[bytes]:
+        return _chunked(
+            json.dumps(row, default=_json_value, ensure_ascii=False) + "\n"
+            for row in self.dicts()
+        )
+
+    def iter_json(self) -> Iterator[bytes]:
+        def parts():
+            yield "["
+            for position, row in enumerate(self.dicts()):
+                yield ("," if position else "") + json.dumps(row, default=_json_value, ensure_ascii=False)
+            yield "]"
+        return _chunked(parts())
+
+    def iter_xlsx(self, title: str = "Rapport") -> Iterator[bytes]:
+        """Classeur en mode write-only : les lignes partent sur disque, le fichier est envoyé par morceaux"""
+        if Workbook is None:
+            raise ReportExportError("Export XLSX indisponible : installer openpyxl")
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title=title[:31])
+        sheet.append(self.columns)
+        for row in self.rows():
+            sheet.append([_cell_value(value) for value in row])
+
+        with tempfile.SpooledTemporaryFile(max_size=16 * EXPORT_CHUNK_SIZE) as output:
+            workbook.save(output)
+            output.seek(0)
+            while True:
+                chunk = output.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def stream(self, format: str, title: str = "Rapport") -> Iterator[bytes]:
+        """Contenu de l'export au format demandé, par morceaux"""
+        format = format.lower()
+        if format == "csv":
+            return self.iter_csv()
+        if format == "ndjson":
+            return self.iter_ndjson()
+        if format == "json":
+            return self.iter_json()
+        if format == "xlsx":
+            return self.iter_xlsx(title)
+        raise ReportExportError(f"Format non supporté : {format}")
+
+
+def _chain_first(first: Dict[str, Any], rest: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    yield first
+    yield from rest
+
+
+def _chunked(parts: Iterable[str]) -> Iterator[bytes]:
+    """Regrouper de petits morceaux de texte en blocs d'environ EXPORT_CHUNK_SIZE octets"""
+    buffer: List[str] = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def export_format(format: str) -> tuple:
+    """(type MIME, extension) d'un format d'export"""
+    try:
+        return EXPORT_FORMATS[format.lower()]
+    except KeyError:
+        raise ReportExportError(f"Format non supporté : {format}")
+
+
+def stream_report(
+    build_source: Callable[[Session], Any],
+    format: str,
+    columns: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    title: str = "Rapport",
+    available_columns: Optional[Sequence[str]] = None
+) -> Iterator[bytes]:
+    """Flux d'export lu dans une session dédiée, fermée à la fin du flux
+
+    La source et les paramètres sont validés avant le premier octet : une erreur
+    (colonne, format) est levée par cet appel et non au milieu de la réponse.
+    """
+    export_format(format)
+    db = SessionLocal()
+    try:
+        export = ReportExport(build_source(db), columns, limit, available_columns)
+        if format.lower() == "xlsx" and Workbook is None:
+            raise ReportExportError("Export XLSX indisponible : installer openpyxl")
+    except Exception:
+        db.close()
+        raise
+
+    def body():
+        try:
+            yield from export.stream(format, title)
+        finally:
+            db.close()
+
+    return body()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark : évaluation des formules de paie
+Compare l'ancien chemin (str.replace + eval) avec les formules compilées.
+
+Usage : python benchmarks/bench_formula_eval.py [nb_employes]
+"""
+import sys
+import os
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.payroll_formula import FormulaCache
+
+FORMULAS = [
+    "heures_sup_25 * (salaire_base / 173.33) * 1.25",
+    "heures_sup_50 * (salaire_base / 173.33) * 1.5",
+    "salaire_base / 12",
+    "max(0, pt + pa - 10000)",
+    "sb * 0.02 * anciennete",
+]
+
+
+def legacy_evaluate(formula, input_values, calculated_values):
+    """Ancienne implémentation de PayrollCalculationEngine._evaluate_formula"""
+    try:
+        eval_formula = formula
+        for code, value in input_values.items():
+            eval_formula = eval_formula.replace(code.lower(), str(value))
+        for code, value in calculated_values.items():
+            eval_formula = eval_formula.replace(code.lower(), str(value))
+        eval_formula = eval_formula.replace("salaire_base", str(input_values.get("SB", 0)))
+        return float(eval(eval_formula))
+    except Exception:
+        return 0
+
+
+def build_inputs(count):
+    rng = random.Random(42)
+    return [
+        {
+            "SB": rng.randrange(150000, 3000000, 1000),
+            "PT": rng.choice([0, 15000, 25000]),
+            "PA": rng.choice([0, 10000, 20000]),
+            "HEURES_SUP_25": rng.randint(0, 20),
+            "HEURES_SUP_50": rng.randint(0, 10),
+            "ANCIENNETE": rng.randint(0, 30),
+        }
+        for _ in range(count)
+    ]
+
+
+def run(count):
+    variables = [
+        SimpleNamespace(id=i + 1, formula=f, updated_at=datetime(2025, 1, 1))
+        for i, f in enumerate(FORMULAS)
+    ]
+    employees = build_inputs(count)
+
+    start = time.perf_counter()
+    legacy_results = []
+    for inputs in employees:
+        legacy_results.append([legacy_evaluate(v.formula, inputs, {}) for v in variables])
+    legacy_time = time.perf_counter() - start
+
+    cache = FormulaCache()
+    start = time.perf_counter()
+    compiled_results = []
+    for inputs in employees:
+        values = {code.lower(): value for code, value in inputs.items()}
+        compiled_results.append([cache.get(v)(values) for v in variables])
+    compiled_time = time.perf_counter() - start
+
+    mismatches = sum(
+        1 for a, b in zip(legacy_results, compiled_results)
+        for x, y in zip(a, b) if abs(x - y) > 1e-6 * max(1.0, abs(x))
+    )
+
+    evaluations = count * len(variables)
+    print(f"Employés: {count} | formules: {len(variables)} | évaluations: {evaluations}")
+    print(f"  str.replace + eval : {legacy_time:.3f}s ({evaluations / legacy_time:,.0f} éval/s)")
+    print(f"  formules compilées : {compiled_time:.3f}s ({evaluations / compiled_time:,.0f} éval/s)")
+    print(f"  accélération       : x{legacy_time / compiled_time:.1f}")
+    print(f"  écarts de résultat : {mismatches}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
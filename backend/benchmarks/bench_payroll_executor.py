@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark : mise à l'échelle du calcul de paie par lots sur 1/2/4/8 processus
+
+Usage : python benchmarks/bench_payroll_executor.py [nb_employes] [taille_lot]
+"""
+import sys
+import os
+import random
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.payroll_calculator import PayrollCalculator
+from app.services.payroll_executor import PayrollRunExecutor
+
+
+def build_employees(count):
+    rng = random.Random(42)
+    return [
+        {
+            "employee_id": i + 1,
+            "employee_name": f"Employé {i + 1}",
+            "base_salary": rng.randrange(150000, 6000000, 500),
+            "overtime_hours": rng.choice([0, 0, 0, rng.randint(1, 20)]),
+            "absence_hours": rng.choice([0, 0, 0, 0, 8]),
+        }
+        for i in range(count)
+    ]
+
+
+def run(count, chunk_size):
+    employees = build_employees(count)
+
+    start = time.perf_counter()
+    reference = PayrollCalculator().calculate_batch_payroll(employees)
+    sequential_time = time.perf_counter() - start
+
+    print(f"Employés: {count} | lots de {chunk_size} | processeurs disponibles: {os.cpu_count()}")
+    print(f"  calculate_batch_payroll séquentiel : {sequential_time:.2f}s")
+
+    for workers in (1, 2, 4, 8):
+        executor = PayrollRunExecutor(workers=workers, chunk_size=chunk_size)
+        executor.run(employees[:chunk_size * workers])  # démarrage du pool hors mesure
+
+        start = time.perf_counter()
+        result = executor.run(employees)
+        elapsed = time.perf_counter() - start
+        executor.shutdown()
+
+        identical = result["totals"] == reference["totals"]
+        print(f"  {workers} processus : {elapsed:.2f}s | x{sequential_time / elapsed:.2f} "
+              f"| {count / elapsed:,.0f} employés/s | totaux identiques: {'oui' if identical else 'NON'}")
+
+
+if __name__ == "__main__":
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    )
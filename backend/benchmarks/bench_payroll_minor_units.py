@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark : coût par employé de PayrollCalculator, centimes entiers vs Decimal (mode audit)
+
+Usage : python benchmarks/bench_payroll_minor_units.py [nb_employes]
+"""
+import sys
+import os
+import random
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.payroll_calculator import PayrollCalculator
+
+
+def build_employees(count, overtime_share):
+    rng = random.Random(42)
+    employees = []
+    for _ in range(count):
+        employee = {"base_salary": rng.randrange(150000, 6000000, 500)}
+        if rng.random() < overtime_share:
+            employee["overtime_hours"] = rng.randint(1, 20)
+        employees.append(employee)
+    return employees
+
+
+def per_employee_cost(calculator, employees):
+    start = time.perf_counter()
+    for employee in employees:
+        calculator.calculate_employee_payroll(employee)
+    return (time.perf_counter() - start) / len(employees) * 1e6
+
+
+def run(count):
+    fast = PayrollCalculator()
+    audit = PayrollCalculator(audit_mode=True)
+
+    print(f"Employés: {count}")
+    for overtime_share in (0.0, 0.2, 1.0):
+        employees = build_employees(count, overtime_share)
+        decimal_cost = per_employee_cost(audit, employees)
+        minor_cost = per_employee_cost(fast, employees)
+        print(f"  {overtime_share:>4.0%} avec heures sup. | Decimal: {decimal_cost:6.2f} µs/employé "
+              f"| centimes: {minor_cost:6.2f} µs/employé | x{decimal_cost / minor_cost:.1f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
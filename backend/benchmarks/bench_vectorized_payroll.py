@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark : paie mensuelle d'une entreprise, boucle Decimal vs calcul vectorisé NumPy
+
+Usage : python benchmarks/bench_vectorized_payroll.py [nb_employes]
+"""
+import sys
+import os
+import random
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.payroll_calculator import PayrollCalculator
+from app.services.payroll_vectorized import VectorizedPayrollCalculator, PayrollBatchInputs
+
+
+def build_employees(count):
+    rng = random.Random(42)
+    return [
+        {
+            "employee_id": i + 1,
+            "employee_name": f"Employé {i + 1}",
+            "base_salary": rng.randrange(150000, 6000000, 500),
+            "overtime_hours": rng.randint(0, 20),
+            "absence_hours": rng.choice([0, 0, 0, 8, 16]),
+        }
+        for i in range(count)
+    ]
+
+
+def run(count):
+    employees = build_employees(count)
+
+    start = time.process_time()
+    PayrollCalculator().calculate_batch_payroll(employees)
+    scalar_time = time.process_time() - start
+
+    calculator = VectorizedPayrollCalculator()
+    inputs = PayrollBatchInputs.from_employees_data(employees)
+
+    start = time.process_time()
+    calculator.calculate_arrays(inputs)
+    arrays_time = time.process_time() - start
+
+    start = time.process_time()
+    calculator.calculate_batch_payroll(inputs)
+    batch_time = time.process_time() - start
+
+    print(f"Employés: {count} (NumPy {np.__version__})")
+    print(f"  Decimal, boucle par employé      : {scalar_time:.3f}s CPU")
+    print(f"  NumPy, colonnes seules           : {arrays_time:.4f}s CPU")
+    print(f"  NumPy, avec résultats par employé: {batch_time:.3f}s CPU")
+    print(f"  accélération                     : x{scalar_time / batch_time:.1f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
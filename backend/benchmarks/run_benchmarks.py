@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks de la paie sur des entreprises synthétiques (100 / 1k / 10k / 50k employés)
+
+Mesure PayrollCalculator, PayrollCalculationEngine, l'endpoint /payroll/calculate-batch
+et les générateurs de bulletins PDF (platypus, canvas) ; écrit un artefact JSON (employés/s, p50/p99, pic RSS)
+comparable d'une exécution à l'autre.
+
+Chaque cas tourne dans un processus neuf (base SQLite en mémoire) : le pic RSS mesuré
+est celui du cas seul.
+
+Usage :
+  python benchmarks/run_benchmarks.py [--sizes 100,1000,10000,50000] [--cases calculator,engine,batch,pdf,pdf_canvas]
+                                      [--template PME] [--output benchmarks/results/run.json]
+                                      [--compare benchmarks/results/precedent.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+CASES = ("calculator", "engine", "batch", "pdf", "pdf_canvas")
+DEFAULT_SIZES = (100, 1000, 10000, 50000)
+PERIOD = "2024-03"
+SEED = 42
+
+# Entrées des formules des modèles (app/data/payroll_templates.json)
+FORMULA_INPUTS = {
+    "salaire_base": lambda salary, rng: salary,
+    "heures_sup_25": lambda salary, rng: rng.choice([0, 0, 0, 2, 4, 8]),
+}
+
+
+def load_json(relative_path):
+    with open(os.path.join(BACKEND_DIR, relative_path), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_tenant(db, template_name, size):
+    """Créer une entreprise avec la configuration du modèle, ses variables et `size` employés"""
+    from sqlalchemy import insert
+    from app.db import models
+
+    template = load_json("app/data/payroll_templates.json")[template_name]
+    tax_rates = load_json("app/data/tax_rates.json")["benin"]
+
+    company = models.Company(name=f"Bench {template_name} {size}", email=f"bench{size}@example.com")
+    db.add(company)
+    db.flush()
+
+    db.add(models.PayrollConfig(
+        company_id=company.id,
+        company_type=template_name,
+        tax_rates={"irpp": tax_rates["irpp"], "cnss": tax_rates["cnss"]},
+        formulas={},
+        is_active=True
+    ))
+    for variable in template["variables"]:
+        db.add(models.PayrollVariable(
+            company_id=company.id,
+            code=variable["code"],
+            name=variable["name"],
+            variable_type=variable["type"],
+            is_mandatory=variable.get("mandatory", False),
+            calculation_method=variable["calculation_method"],
+            fixed_amount=variable.get("fixed_amount"),
+            percentage_rate=variable.get("percentage_rate"),
+            formula=variable.get("formula"),
+            display_order=variable.get("display_order", 0)
+        ))
+    db.flush()
+
+    rng = random.Random(SEED)
+    employees = [
+        {
+            "id": i + 1,
+            "name": f"Employé {i + 1}",
+            "email": f"employe{i + 1}@bench.example.com",
+            "status": "active",
+            "salary": rng.randrange(150000, 6000000, 500),
+            "company_id": company.id
+        }
+        for i in range(size)
+    ]
+    db.execute(insert(models.Employee), employees)
+
+    # Primes et indemnités fixes saisies par employé, heures sup. de la période
+    fixed_codes = [
+        v["code"] for v in template["variables"]
+        if v["calculation_method"] == "fixed" and v["code"] != "SB"
+    ]
+    payroll_data = []
+    for employee in employees:
+        for code in fixed_codes:
+            if rng.random() < 0.6:
+                payroll_data.append({
+                    "employee_id": employee["id"], "variable_code": code,
+                    "value": rng.randrange(5000, 100000, 500), "period": PERIOD
+                })
+        if rng.random() < 0.25:
+            payroll_data.append({
+                "employee_id": employee["id"], "variable_code": "overtime_hours",
+                "value": rng.randint(1, 20), "period": PERIOD
+            })
+    if payroll_data:
+        db.execute(insert(models.EmployeePayrollData), payroll_data)
+    db.commit()
+
+    return company, employees, payroll_data, template
+
+
+def engine_inputs(employees, payroll_data, template):
+    """Valeurs d'entrée de PayrollCalculationEngine par employé"""
+    rng = random.Random(SEED)
+    values = {e["id"]: {"SB": e["salary"]} for e in employees}
+    for row in payroll_data:
+        values[row["employee_id"]][row["variable_code"]] = row["value"]
+
+    formula_names = [name for name in FORMULA_INPUTS if any(
+        name in (v.get("formula") or "") for v in template["variables"]
+    )]
+    for employee in employees:
+        for name in formula_names:
+            values[employee["id"]][name] = FORMULA_INPUTS[name](employee["salary"], rng)
+    return values
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[position]
+
+
+def summarize(latencies, employees, total_seconds):
+    """employés/s sur la durée totale, p50/p99 des latences (ms)"""
+    latencies = sorted(latencies)
+    return {
+        "samples": len(latencies),
+        "total_seconds": round(total_seconds, 4),
+        "employees_per_second": round(employees / total_seconds, 1) if total_seconds else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+    }
+
+
+def bench_calculator(db, company, employees, payroll_data, template, options):
+    from app.services.payroll_calculator import PayrollCalculator
+
+    overtime = {row["employee_id"]: row["value"] for row in payroll_data if row["variable_code"] == "overtime_hours"}
+    calculator = PayrollCalculator()
+    latencies = []
+    start = time.perf_counter()
+    for employee in employees:
+        t0 = time.perf_counter()
+        calculator.calculate_employee_payroll({
+            "base_salary": employee["salary"],
+            "overtime_hours": overtime.get(employee["id"], 0)
+        })
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, len(employees), time.perf_counter() - start)
+
+
+def bench_engine(db, company, employees, payroll_data, template, options):
+    from app.core.payroll_engine import PayrollCalculationEngine
+
+    inputs = engine_inputs(employees, payroll_data, template)
+    engine = PayrollCalculationEngine(db, company.id)
+    latencies = []
+    start = time.perf_counter()
+    for employee in employees:
+        t0 = time.perf_counter()
+        engine.calculate_payroll(employee["id"], PERIOD, inputs[employee["id"]])
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, len(employees), time.perf_counter() - start)
+
+
+def bench_batch(db, company, employees, payroll_data, template, options):
+    """Endpoint appelé directement (sans HTTP) : une latence par requête couvrant toute l'entreprise"""
+    from app.api.v1.endpoints.payroll_batch import calculate_batch_payroll
+    from app.db import models
+
+    user = SimpleNamespace(id=None, company_id=company.id)
+    payload = {"period": PERIOD}
+
+    def call():
+        t0 = time.perf_counter()
+        response = asyncio.run(calculate_batch_payroll(payload, stream=False, db=db, current_user=user))
+        return time.perf_counter() - t0, response
+
+    # À froid : résultats mémorisés effacés avant chaque requête
+    latencies = []
+    for _ in range(options.repeats):
+        db.query(models.PayrollResultCache).delete()
+        db.commit()
+        elapsed, response = call()
+        latencies.append(elapsed)
+    result = summarize(latencies, len(employees) * len(latencies), sum(latencies))
+
+    # À chaud : tous les employés servis par la mémoïsation
+    warm_elapsed, response = call()
+    result["warm_employees_per_second"] = round(len(employees) / warm_elapsed, 1)
+    result["warm_cache"] = response["cache"]
+    return result
+
+
+def bench_pdf(db, company, employees, payroll_data, template, options, renderer="platypus"):
+    from app.services.payroll_calculator import PayrollCalculator
+    from app.services.pdf_generator import PayslipPDFGenerator
+
+    calculator = PayrollCalculator()
+    generator = PayslipPDFGenerator()
+    sample = employees[:options.pdf_limit]
+    payslips = []
+    for employee in sample:
+        payslip = calculator.calculate_employee_payroll({"base_salary": employee["salary"]})
+        payslip.update(employee_id=employee["id"], employee_name=employee["name"], period=PERIOD)
+        payslips.append(payslip)
+
+    latencies = []
+    start = time.perf_counter()
+    for payslip in payslips:
+        t0 = time.perf_counter()
+        generator.generate_payslip_pdf(payslip, renderer)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, len(sample), time.perf_counter() - start)
+
+
+def bench_pdf_canvas(db, company, employees, payroll_data, template, options):
+    return bench_pdf(db, company, employees, payroll_data, template, options, renderer="canvas")
+
+
+BENCHMARKS = {
+    "calculator": bench_calculator,
+    "engine": bench_engine,
+    "batch": bench_batch,
+    "pdf": bench_pdf,
+    "pdf_canvas": bench_pdf_canvas,
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case(case, size, options):
+    """Exécuté dans un processus dédié : crée l'entreprise synthétique puis mesure le cas"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.db.models import Base  # importer les modèles enregistre les tables dans Base.metadata
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        company, employees, payroll_data, template = build_tenant(db, options.template, size)
+        rss_before = peak_rss_mb()
+        result = BENCHMARKS[case](db, company, employees, payroll_data, template, options)
+    finally:
+        db.close()
+
+    result.update(benchmark=case, employees=size, rss_after_setup_mb=rss_before, peak_rss_mb=peak_rss_mb())
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, previous_path):
+    """Afficher l'évolution des employés/s par rapport à un artefact précédent"""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {(r["benchmark"], r["employees"]): r for r in json.load(f)["results"]}
+
+    print(f"\nComparaison avec {previous_path}")
+    for result in results:
+        before = previous.get((result["benchmark"], result["employees"]))
+        if not before or not before.get("employees_per_second") or not result.get("employees_per_second"):
+            continue
+        ratio = result["employees_per_second"] / before["employees_per_second"]
+        flag = "  <-- régression" if ratio < 0.9 else ""
+        print(f"  {result['benchmark']:<10} {result['employees']:>6} employés : x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de la paie sur des entreprises synthétiques")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--template", default="PME")
+    parser.add_argument("--repeats", type=int, default=3, help="requêtes /calculate-batch à froid par taille")
+    parser.add_argument("--pdf-limit", type=int, default=500, help="nombre maximal de bulletins PDF par taille")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    options = parser.parse_args()
+
+    sizes = [int(size) for size in options.sizes.split(",")]
+    cases = [case for case in options.cases.split(",") if case]
+    unknown = set(cases) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"cas inconnus : {', '.join(sorted(unknown))}")
+
+    results = []
+    for size in sizes:
+        for case in cases:
+            # Un processus neuf par cas : pic RSS isolé, pas de cache hérité
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(run_case, case, size, options).result()
+            results.append(result)
+            print(f"{case:<10} {size:>6} employés | {result['employees_per_second'] or 0:>10,.0f} employés/s "
+                  f"| p50 {result['p50_ms']:.3f} ms | p99 {result['p99_ms']:.3f} ms "
+                  f"| pic RSS {result['peak_rss_mb']:.0f} Mo")
+
+    artifact = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "template": options.template,
+        "period": PERIOD,
+        "results": results
+    }
+
+    output = options.output or os.path.join(
+        BACKEND_DIR, "benchmarks", "results", f"payroll_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats écrits dans {output}")
+
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == "__main__":
+    main()
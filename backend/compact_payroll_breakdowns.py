@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Script pour créer les tables payroll_breakdown_keys / payroll_breakdown_lines
+et compacter les détails de bulletins encore stockés en JSON
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import engine, SessionLocal
+from app.db.models import PayrollBreakdownKey, PayrollBreakdownLine
+from app.crud import crud_payroll
+
+def compact_payroll_breakdowns():
+    """Créer les tables si besoin puis convertir les salary_breakdown JSON en lignes (par lots)"""
+    try:
+        print("[INFO] Création des tables payroll_breakdown_keys et payroll_breakdown_lines...")
+        PayrollBreakdownKey.__table__.create(engine, checkfirst=True)
+        PayrollBreakdownLine.__table__.create(engine, checkfirst=True)
+
+        print("[INFO] Compactage des détails de bulletins...")
+        db = SessionLocal()
+        try:
+            compacted = crud_payroll.compact_payroll_breakdowns(db)
+        finally:
+            db.close()
+
+        print(f"[SUCCESS] {compacted} bulletin(s) compacté(s) !")
+        print("Les valeurs non numériques restent dans la colonne JSON salary_breakdown")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la migration: {e}")
+
+if __name__ == "__main__":
+    compact_payroll_breakdowns()
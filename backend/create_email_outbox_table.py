@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Script pour créer la table email_outbox (file d'envoi des emails)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import engine
+from app.db.models import EmailOutbox
+
+def create_email_outbox_table():
+    """Créer la table email_outbox si elle n'existe pas"""
+    try:
+        print("[INFO] Création de la table email_outbox...")
+        EmailOutbox.__table__.create(engine, checkfirst=True)
+
+        print("[SUCCESS] Table email_outbox prête !")
+        print("Colonnes disponibles :")
+        print("  - id, company_id, kind, to_email, subject, html_content, text_content")
+        print("  - invitation_id, payroll_record_id")
+        print("  - status, attempts, max_attempts, next_attempt_at, claim_id, last_error")
+        print("  - created_at, sent_at, updated_at")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la création: {e}")
+
+if __name__ == "__main__":
+    create_email_outbox_table()
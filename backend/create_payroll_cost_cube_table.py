@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Script pour créer la table payroll_cost_cube (agrégats par entreprise, période et département)
+et la remplir depuis les bulletins existants
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import engine, SessionLocal
+from app.db.models import PayrollCostCube, PayrollRecord, Employee
+from app.crud import crud_payroll
+
+def create_payroll_cost_cube_table():
+    """Créer la table payroll_cost_cube si elle n'existe pas, puis agréger toutes les périodes"""
+    try:
+        print("[INFO] Création de la table payroll_cost_cube...")
+        PayrollCostCube.__table__.create(engine, checkfirst=True)
+
+        db = SessionLocal()
+        try:
+            periods = db.query(Employee.company_id, PayrollRecord.period).join(
+                Employee, Employee.id == PayrollRecord.employee_id
+            ).distinct().all()
+            for company_id, period in periods:
+                crud_payroll.refresh_cost_cube(db, company_id, period)
+                db.commit()
+            print(f"[INFO] {len(periods)} période(s) agrégée(s)")
+        finally:
+            db.close()
+
+        print("[SUCCESS] Table payroll_cost_cube prête !")
+        print("Colonnes disponibles :")
+        print("  - id, company_id, period, department_id (0 = non assigné), department_name")
+        print("  - headcount, validated_count, draft_count")
+        print("  - gross_salary, net_salary, cnss_employee, cnss_employer, irpp, refreshed_at")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la création: {e}")
+
+if __name__ == "__main__":
+    create_payroll_cost_cube_table()
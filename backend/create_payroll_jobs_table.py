@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Script pour créer la table payroll_calculation_jobs (calculs de paie asynchrones)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import engine
+from app.db.models import PayrollCalculationJob
+
+def create_payroll_jobs_table():
+    """Créer la table payroll_calculation_jobs si elle n'existe pas"""
+    try:
+        print("[INFO] Création de la table payroll_calculation_jobs...")
+        PayrollCalculationJob.__table__.create(engine, checkfirst=True)
+
+        print("[SUCCESS] Table payroll_calculation_jobs prête !")
+        print("Colonnes disponibles :")
+        print("  - id, calculation_id, company_id, period, employee_ids")
+        print("  - status, total_employees, completed_employees, failed_employees, cached_employees")
+        print("  - results, totals, errors (JSON), error_message")
+        print("  - claimed_by, heartbeat_at")
+        print("  - requested_by_id, created_at, started_at, completed_at, updated_at")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la création: {e}")
+
+if __name__ == "__main__":
+    create_payroll_jobs_table()
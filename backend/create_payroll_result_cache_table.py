@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Script pour créer la table payroll_result_cache (résultats de paie mémorisés)
+et la colonne cached_employees des calculs asynchrones
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from app.db.database import engine
+from app.db.models import PayrollResultCache
+
+def create_payroll_result_cache_table():
+    """Créer la table payroll_result_cache si elle n'existe pas"""
+    try:
+        print("[INFO] Création de la table payroll_result_cache...")
+        PayrollResultCache.__table__.create(engine, checkfirst=True)
+
+        columns = {column["name"] for column in inspect(engine).get_columns("payroll_calculation_jobs")}
+        if "cached_employees" not in columns:
+            print("[INFO] Ajout de la colonne payroll_calculation_jobs.cached_employees...")
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE payroll_calculation_jobs ADD COLUMN cached_employees INTEGER DEFAULT 0"))
+
+        print("[SUCCESS] Table payroll_result_cache prête !")
+        print("Colonnes disponibles :")
+        print("  - id, company_id, employee_id, period")
+        print("  - input_hash (SHA-256 des entrées), result (JSON)")
+        print("  - created_at, updated_at")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la création: {e}")
+
+if __name__ == "__main__":
+    create_payroll_result_cache_table()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Script pour créer la table payroll_retro_adjustments (rappels de paie)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.database import engine
+from app.db.models import PayrollRetroAdjustment
+
+def create_payroll_retro_table():
+    """Créer la table payroll_retro_adjustments si elle n'existe pas"""
+    try:
+        print("[INFO] Création de la table payroll_retro_adjustments...")
+        PayrollRetroAdjustment.__table__.create(engine, checkfirst=True)
+
+        print("[SUCCESS] Table payroll_retro_adjustments prête !")
+        print("Colonnes disponibles :")
+        print("  - id, company_id, employee_id, source_period, target_period")
+        print("  - gross_salary, cnss_employee, cnss_employer, irpp, net_salary (écarts)")
+        print("  - status (pending, applied), applied_at, applied_record_id")
+        print("  - created_by_id, created_at")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la création: {e}")
+
+if __name__ == "__main__":
+    create_payroll_retro_table()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Script pour créer la table payroll_ytd_ledger (cumuls annuels par employé)
+et reprendre les cumuls des bulletins déjà validés
+
+Usage : python create_payroll_ytd_ledger_table.py [annee ...]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime
+from app.db.database import engine, SessionLocal
+from app.db.models import PayrollYTDLedger
+from app.crud import crud_payroll
+
+def create_payroll_ytd_ledger_table(years):
+    """Créer la table payroll_ytd_ledger si elle n'existe pas, puis recalculer les années demandées"""
+    try:
+        print("[INFO] Création de la table payroll_ytd_ledger...")
+        PayrollYTDLedger.__table__.create(engine, checkfirst=True)
+
+        db = SessionLocal()
+        try:
+            for year in years:
+                count = crud_payroll.rebuild_ytd_ledger(db, year)
+                print(f"[INFO] Cumuls {year} recalculés pour {count} employé(s)")
+        finally:
+            db.close()
+
+        print("[SUCCESS] Table payroll_ytd_ledger prête !")
+        print("Colonnes disponibles :")
+        print("  - id, company_id, employee_id, year")
+        print("  - gross_salary, taxable_income, cnss_employee, cnss_employer, irpp, net_salary")
+        print("  - periods_count, updated_at")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la création: {e}")
+
+if __name__ == "__main__":
+    create_payroll_ytd_ledger_table([int(year) for year in sys.argv[1:]] or [datetime.now().year])
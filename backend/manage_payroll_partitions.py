@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Partitionnement de payroll_records par période (MySQL, RANGE COLUMNS(period))
+
+  - années passées : une partition par année (archives, bulletins clôturés)
+  - année en cours et mois à venir : une partition par mois
+  - p_future : au-delà (dont les bulletins de période "current")
+
+Usage :
+  python manage_payroll_partitions.py init  [--months-ahead 3] [--dry-run]
+  python manage_payroll_partitions.py roll  [--months-ahead 3] [--close-after 2] [--dry-run]
+  python manage_payroll_partitions.py status
+
+"roll" est à lancer chaque mois (cron) : il crée les partitions des mois à venir,
+regroupe les mois des années terminées en une partition annuelle et, avec --close-after,
+clôture les périodes entièrement validées de plus de N mois.
+
+MySQL n'accepte ni clé étrangère sur une table partitionnée ni clé étrangère vers elle :
+"init" supprime celles de payroll_records et de payroll_breakdown_lines (les suppressions
+en cascade sont assurées par l'ORM) et passe la clé primaire à (id, period).
+"""
+import argparse
+import re
+import sys
+import os
+from datetime import date
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import case, func, text
+from app.db.database import engine, SessionLocal
+from app.db import models
+from app.crud import crud_payroll
+
+TABLE = "payroll_records"
+FUTURE = "p_future"
+MONTHLY = re.compile(r"^p\d{4}_\d{2}$")
+
+def _next_month(year: int, month: int) -> tuple:
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+def _add_months(year: int, month: int, months: int) -> tuple:
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+def desired_partitions(first_year: int, today: date, months_ahead: int) -> list:
+    """Partitions attendues [(nom, borne exclue)] : une par année passée, une par mois ensuite"""
+    partitions = [(f"p{year}", f"{year + 1}-01") for year in range(first_year, today.year)]
+
+    last = _add_months(today.year, today.month, months_ahead)
+    year, month = today.year, 1
+    while (year, month) <= last:
+        upper = _next_month(year, month)
+        partitions.append((f"p{year}_{month:02d}", f"{upper[0]}-{upper[1]:02d}"))
+        year, month = upper
+    return partitions
+
+def _partition_sql(partitions: list) -> str:
+    clauses = [f"PARTITION {name} VALUES LESS THAN ('{bound}')" for name, bound in partitions]
+    clauses.append(f"PARTITION {FUTURE} VALUES LESS THAN (MAXVALUE)")
+    return ",\n    ".join(clauses)
+
+def _existing_partitions(conn) -> list:
+    """Partitions actuelles [(nom, borne, lignes estimées)] dans l'ordre des bornes"""
+    rows = conn.execute(text("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """), {"table": TABLE}).all()
+    return [(name, description.strip("'"), table_rows) for name, description, table_rows in rows]
+
+def _first_year(conn, today: date) -> int:
+    first_period = conn.execute(text(
+        f"SELECT MIN(period) FROM {TABLE} WHERE period REGEXP '^[0-9]{{4}}-[0-9]{{2}}$'"
+    )).scalar()
+    return int(first_period[:4]) if first_period else today.year
+
+def init_statements(conn, today: date, months_ahead: int) -> list:
+    """Instructions de conversion de payroll_records en table partitionnée"""
+    statements = []
+    foreign_keys = conn.execute(text("""
+        SELECT TABLE_NAME, CONSTRAINT_NAME
+        FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND (TABLE_NAME = :table OR REFERENCED_TABLE_NAME = :table)
+    """), {"table": TABLE}).all()
+    for table_name, constraint_name in foreign_keys:
+        statements.append(f"ALTER TABLE {table_name} DROP FOREIGN KEY {constraint_name}")
+
+    statements.append(f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, period)")
+    partitions = desired_partitions(_first_year(conn, today), today, months_ahead)
+    statements.append(
+        f"ALTER TABLE {TABLE} PARTITION BY RANGE COLUMNS(period) (\n    {_partition_sql(partitions)}\n)"
+    )
+    return statements
+
+def roll_statements(existing: list, today: date, months_ahead: int) -> list:
+    """Instructions de roulement : archivage des années terminées, création des mois à venir"""
+    statements = []
+    names = [name for name, _, _ in existing]
+
+    # Archivage : les mois d'une année terminée sont regroupés en une partition annuelle
+    monthly_years = {int(name[1:5]) for name in names if MONTHLY.match(name)}
+    for year in sorted(year for year in monthly_years if year < today.year):
+        months = [(name, bound) for name, bound, _ in existing if name.startswith(f"p{year}_")]
+        statements.append(
+            f"ALTER TABLE {TABLE} REORGANIZE PARTITION {', '.join(name for name, _ in months)} INTO "
+            f"(PARTITION p{year} VALUES LESS THAN ('{max(bound for _, bound in months)}'))"
+        )
+
+    # Mois à venir : découpés dans p_future
+    last_bound = max((bound for name, bound, _ in existing if name != FUTURE), default="")
+    upcoming = [
+        (name, bound) for name, bound in desired_partitions(today.year, today, months_ahead)
+        if bound > last_bound and name not in names
+    ]
+    if upcoming:
+        statements.append(
+            f"ALTER TABLE {TABLE} REORGANIZE PARTITION {FUTURE} INTO (\n    {_partition_sql(upcoming)}\n)"
+        )
+    return statements
+
+def close_old_periods(close_after: int, today: date, dry_run: bool) -> list:
+    """Clôturer les périodes de plus de close_after mois dont tous les bulletins sont validés ou payés"""
+    last_year, last_month = _add_months(today.year, today.month, -close_after)
+    limit = f"{last_year}-{last_month:02d}"
+
+    db = SessionLocal()
+    try:
+        candidates = db.query(
+            models.Employee.company_id,
+            models.PayrollRecord.period,
+            func.count(models.PayrollRecord.id),
+            func.sum(case((models.PayrollRecord.status.in_(crud_payroll.YTD_STATUSES), 1), else_=0))
+        ).join(models.Employee, models.Employee.id == models.PayrollRecord.employee_id).filter(
+            models.PayrollRecord.period <= limit,
+            models.PayrollRecord.period.op("REGEXP")("^[0-9]{4}-[0-9]{2}$")
+        ).group_by(models.Employee.company_id, models.PayrollRecord.period).all()
+        closed = {
+            (closure.company_id, closure.period)
+            for closure in db.query(models.PayrollPeriod).filter(models.PayrollPeriod.status == "closed").all()
+        }
+
+        to_close = [
+            (company_id, period) for company_id, period, count, validated in candidates
+            if count == int(validated or 0) and (company_id, period) not in closed
+        ]
+        if not dry_run:
+            for company_id, period in to_close:
+                crud_payroll.set_payroll_period_status(db, company_id, period, "closed", commit=False)
+            db.commit()
+        return to_close
+    finally:
+        db.close()
+
+def _execute(statements: list, dry_run: bool):
+    for statement in statements:
+        print(f"[SQL] {statement};")
+        if not dry_run:
+            with engine.begin() as conn:
+                conn.execute(text(statement))
+
+def manage_payroll_partitions(command: str, months_ahead: int = 3, close_after: int = None, dry_run: bool = False):
+    """Initialiser, faire rouler ou afficher les partitions de payroll_records"""
+    try:
+        if engine.dialect.name != "mysql":
+            print(f"[INFO] Partitionnement non disponible pour {engine.dialect.name} (MySQL requis)")
+            return
+
+        models.PayrollPeriod.__table__.create(engine, checkfirst=True)
+        today = date.today()
+
+        with engine.connect() as conn:
+            existing = _existing_partitions(conn)
+
+            if command == "status":
+                for name, bound, table_rows in existing:
+                    print(f"  - {name:<12} < {bound:<10} ~{table_rows} ligne(s)")
+                if not existing:
+                    print(f"[INFO] La table {TABLE} n'est pas partitionnée")
+                return
+
+            if command == "init":
+                if existing:
+                    print(f"[INFO] La table {TABLE} est déjà partitionnée ({len(existing)} partitions)")
+                    return
+                statements = init_statements(conn, today, months_ahead)
+            else:
+                if not existing:
+                    print(f"[ERROR] La table {TABLE} n'est pas partitionnée : lancer d'abord 'init'")
+                    return
+                statements = roll_statements(existing, today, months_ahead)
+
+        print(f"[INFO] {len(statements)} instruction(s){' (simulation)' if dry_run else ''}...")
+        _execute(statements, dry_run)
+
+        if command == "roll" and close_after is not None:
+            to_close = close_old_periods(close_after, today, dry_run)
+            print(f"[INFO] {len(to_close)} période(s) clôturée(s) : {', '.join(f'{c}/{p}' for c, p in to_close) or '-'}")
+
+        print(f"[SUCCESS] Partitions de {TABLE} à jour !")
+
+    except Exception as e:
+        print(f"[ERROR] Erreur lors de la maintenance des partitions: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partitions mensuelles de payroll_records")
+    parser.add_argument("command", choices=["init", "roll", "status"])
+    parser.add_argument("--months-ahead", type=int, default=3, help="Mois futurs à pré-créer")
+    parser.add_argument("--close-after", type=int, default=None, help="Clôturer les périodes validées de plus de N mois")
+    parser.add_argument("--dry-run", action="store_true", help="Afficher les instructions sans les exécuter")
+    args = parser.parse_args()
+
+    manage_payroll_partitions(args.command, args.months_ahead, args.close_after, args.dry_run)
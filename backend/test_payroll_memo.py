@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Test des empreintes de mémoïsation : mêmes entrées => même empreinte, toute entrée modifiée => nouvelle empreinte
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime
+from app.services.payroll_memo import payroll_input_hash
+
+VERSION = (datetime(2024, 1, 1, 8, 0), 5, datetime(2024, 1, 2, 9, 30))
+
+
+def test_payroll_memo():
+    print("[TEST] Empreintes des entrées de paie")
+    reference = payroll_input_hash(VERSION, 450000, 4, 0, {"PRIME": 25000, "AVANCE": 0})
+
+    same_inputs = [
+        ("entiers / flottants", payroll_input_hash(VERSION, 450000.0, 4.0, 0.0, {"PRIME": 25000.0})),
+        ("ordre des variables", payroll_input_hash(VERSION, 450000, 4, 0, {"AVANCE": 0, "PRIME": 25000})),
+        ("variable à zéro omise", payroll_input_hash(VERSION, 450000, 4, None, {"PRIME": 25000})),
+    ]
+    for label, value in same_inputs:
+        print(f"  [{'OK' if value == reference else 'NOK'}] même empreinte : {label}")
+        assert value == reference, label
+
+    changed_inputs = [
+        ("salaire", payroll_input_hash(VERSION, 450001, 4, 0, {"PRIME": 25000})),
+        ("heures sup.", payroll_input_hash(VERSION, 450000, 5, 0, {"PRIME": 25000})),
+        ("absences", payroll_input_hash(VERSION, 450000, 4, 8, {"PRIME": 25000})),
+        ("variable de période", payroll_input_hash(VERSION, 450000, 4, 0, {"PRIME": 30000})),
+        ("nouvelle variable", payroll_input_hash(VERSION, 450000, 4, 0, {"PRIME": 25000, "AVANCE": 1})),
+        ("version de config", payroll_input_hash(VERSION[:2] + (datetime(2024, 2, 1),), 450000, 4, 0, {"PRIME": 25000})),
+    ]
+    for label, value in changed_inputs:
+        print(f"  [{'OK' if value != reference else 'NOK'}] nouvelle empreinte : {label}")
+        assert value != reference, label
+
+    print("[TEST] Résultat: OK")
+
+
+if __name__ == "__main__":
+    test_payroll_memo()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test d'identité : calcul rapide en centimes entiers vs calcul Decimal de référence (mode audit)
+Chaque champ doit être identique au bit près (comparaison des repr des flottants).
+"""
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.payroll_calculator import PayrollCalculator
+
+
+def random_employees(count, seed):
+    """Salaires entiers, décimaux (centimes) ou flottants quelconques ; avec ou sans heures"""
+    rng = random.Random(seed)
+    employees = []
+    for _ in range(count):
+        employee = {
+            "base_salary": rng.choice([
+                rng.randrange(0, 12000000, 1),
+                rng.randrange(0, 1200000000) / 100,
+                float(rng.randrange(50000, 3000000, 500)),
+                rng.uniform(50000, 12000000),
+            ])
+        }
+        if rng.random() < 0.3:
+            employee["overtime_hours"] = rng.randint(0, 20)
+        if rng.random() < 0.2:
+            employee["absence_hours"] = rng.choice([0, 0.0, 8, 16])
+        if rng.random() < 0.1:
+            employee["monthly_hours"] = rng.choice([151.67, 160, 173.33])
+        employees.append(employee)
+    return employees
+
+
+def boundary_employees():
+    """Plafond CNSS, bornes IRPP, demis exacts, zéros signés, entrées en chaîne"""
+    calculator = PayrollCalculator()
+    salaries = [0, 0.0, -0.0, 1, 0.01, 0.5, 125, 1800000, 1799999.99, 1800000.01, -150000, "800000"]
+    for bracket in calculator.IRPP_BRACKETS:
+        if bracket["max"] != float("inf"):
+            salaries.append(round(bracket["max"] / (1 - calculator.CNSS_EMPLOYEE_RATE)))
+            salaries.append(bracket["max"] / (1 - calculator.CNSS_EMPLOYEE_RATE))
+    salaries += [k * 125 for k in range(1, 400, 37)]
+    salaries += [k * 12.5 for k in range(1, 400, 41)]
+    return [{"base_salary": salary} for salary in salaries]
+
+
+def same(a, b):
+    return repr(a) == repr(b)
+
+
+def compare(employees, label):
+    fast = PayrollCalculator()
+    audit = PayrollCalculator(audit_mode=True)
+
+    mismatches = 0
+    fast_path = 0
+    for employee in employees:
+        expected = audit.calculate_employee_payroll(employee)
+        actual = fast.calculate_employee_payroll(employee)
+        if fast._calculate_minor_units(employee) is not None:
+            fast_path += 1
+        for field, value in expected.items():
+            if not same(value, actual[field]):
+                mismatches += 1
+                print(f"  [NOK] {field} pour {employee}: {value!r} != {actual[field]!r}")
+
+    print(f"[TEST] {label}: {len(employees)} employés ({fast_path} en centimes), "
+          f"{mismatches} écart(s) -> {'OK' if mismatches == 0 else 'NOK'}")
+    return mismatches == 0
+
+
+def test_minor_units_identity():
+    """Comparer le calcul en centimes au calcul Decimal"""
+
+    print("=== TEST CALCUL EN CENTIMES ===\n")
+
+    results = [compare(boundary_employees(), "cas limites")]
+    for seed in range(5):
+        results.append(compare(random_employees(5000, seed), f"aléatoire (graine {seed})"))
+
+    print(f"\n=== {'SUCCES' if all(results) else 'ECHEC'} ===")
+    assert all(results), "écarts entre le calcul en centimes et le calcul Decimal"
+
+
+if __name__ == "__main__":
+    test_minor_units_identity()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test d'équivalence : calcul de paie vectorisé (NumPy) vs PayrollCalculator (Decimal)
+Propriété vérifiée sur des entrées aléatoires et des cas limites :
+les montants arrondis sont identiques, les montants non arrondis égaux à 1e-9 près.
+"""
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.payroll_calculator import PayrollCalculator
+from app.services.payroll_vectorized import VectorizedPayrollCalculator, PayrollBatchInputs
+
+ROUNDED_FIELDS = [
+    "cnss_employee", "cnss_employer", "irpp_amount", "accident_work",
+    "family_allowance", "total_employee_deductions", "total_employer_charges"
+]
+CONTINUOUS_FIELDS = [
+    "base_salary", "overtime_amount", "absence_deduction", "gross_salary",
+    "net_salary", "cost_to_company"
+]
+
+
+def random_employees(count, seed):
+    """Employés aléatoires (salaires entiers ou décimaux, heures entières ou demi-heures)"""
+    rng = random.Random(seed)
+    employees = []
+    for i in range(count):
+        base = rng.choice([
+            rng.randrange(50000, 10000000, 500),
+            round(rng.uniform(50000, 10000000), 2),
+        ])
+        employees.append({
+            "employee_id": i + 1,
+            "employee_name": f"Employé {i + 1}",
+            "base_salary": base,
+            "overtime_hours": rng.choice([0, rng.randint(0, 40), rng.randint(0, 80) / 2]),
+            "absence_hours": rng.choice([0, 0, rng.randint(0, 60)]),
+            "overtime_rate": rng.choice([1.25, 1.5, 2]),
+        })
+    return employees
+
+
+def boundary_employees():
+    """Cas limites : plafond CNSS, bornes des tranches IRPP, demis exacts, gros salaires, revenu négatif"""
+    calculator = PayrollCalculator()
+    salaries = [0, 1, 125, 250, 1800000, 1799999, 1800001, 630000, 1500000, 4000000, 8300000]
+    for bracket in calculator.IRPP_BRACKETS:
+        if bracket["max"] != float("inf"):
+            # Brut tel que le revenu imposable (brut - CNSS) tombe sur la borne
+            salaries.append(round(bracket["max"] / (1 - calculator.CNSS_EMPLOYEE_RATE)))
+    salaries += [k * 125 for k in range(1, 400, 37)]  # k * 0.084 = x.5 pour k impair
+
+    # Demis centimes et montants juste sous un demi (1730.4999999999 ne s'arrondit pas à 1731)
+    salaries += [50.0, 1250.05, 0.005, 8928.575, 173049.999999999]
+    # Gros salaires : au-delà de 2**53 centimes, le flottant ne suffit plus
+    salaries += [999999999999.99, 123456789012.5, 5e14 + 50]
+
+    employees = []
+    for i, salary in enumerate(salaries):
+        employees.append({"employee_id": i + 1, "base_salary": salary})
+    # Heures tombant sur un demi ou juste en dessous (taux horaire exact : 173330 / 173.33 = 1000)
+    for hours in (0.28, 0.2800000000001, 0.3):
+        employees.append({"employee_id": len(employees) + 1, "base_salary": 173330, "absence_hours": hours})
+        employees.append({"employee_id": len(employees) + 1, "base_salary": 173330, "overtime_hours": hours})
+    employees.append({"employee_id": len(employees) + 1, "base_salary": 2.5e11, "overtime_hours": 3})
+    # Absences supérieures au temps de travail : brut et revenu imposable négatifs
+    employees.append({"employee_id": len(employees) + 1, "base_salary": 300000, "absence_hours": 200})
+    return employees
+
+
+def compare(employees, label):
+    scalar = PayrollCalculator().calculate_batch_payroll(employees)
+    vectorized = VectorizedPayrollCalculator().calculate_batch_payroll(
+        PayrollBatchInputs.from_employees_data(employees)
+    )
+
+    mismatches = 0
+    for expected, actual in zip(scalar["calculations"], vectorized["calculations"]):
+        for field in ROUNDED_FIELDS:
+            if expected[field] != actual[field]:
+                mismatches += 1
+                print(f"  [NOK] {field} employé {expected['employee_id']}: {expected[field]} != {actual[field]}")
+        for field in CONTINUOUS_FIELDS:
+            if abs(expected[field] - actual[field]) > 1e-9 * max(1.0, abs(expected[field])):
+                mismatches += 1
+                print(f"  [NOK] {field} employé {expected['employee_id']}: {expected[field]} != {actual[field]}")
+
+    for key, value in scalar["totals"].items():
+        if abs(value - vectorized["totals"][key]) > 1e-9 * max(1.0, abs(value)):
+            mismatches += 1
+            print(f"  [NOK] total {key}: {value} != {vectorized['totals'][key]}")
+
+    print(f"[TEST] {label}: {len(employees)} employés, {mismatches} écart(s) -> {'OK' if mismatches == 0 else 'NOK'}")
+    return mismatches == 0
+
+
+def test_vectorized_equivalence():
+    """Comparer les deux chemins de calcul"""
+
+    print("=== TEST EQUIVALENCE PAIE VECTORISEE ===\n")
+
+    results = [compare(boundary_employees(), "cas limites")]
+    for seed in range(5):
+        results.append(compare(random_employees(2000, seed), f"aléatoire (graine {seed})"))
+
+    print(f"\n=== {'SUCCES' if all(results) else 'ECHEC'} ===")
+    assert all(results), "écarts entre le calcul vectorisé et le calcul Decimal"
+
+
+if __name__ == "__main__":
+    test_vectorized_equivalence()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test des cumuls annuels (payroll_ytd_ledger) tenus par les écritures CRUD des bulletins
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.crud import crud_payroll
+from app.db.models import Base, Company, Employee, PayrollRecord
+from app.schemas.payroll import PayrollRecordUpdate
+from app.services.payslip_bulk import iter_period_payslips
+
+
+def make_session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def make_employee(db):
+    company = Company(name="Cumuls", email="cumuls@example.com")
+    db.add(company)
+    db.flush()
+    employee = Employee(name="Employé", email="employe@example.com", salary=300000, company_id=company.id, status="active")
+    db.add(employee)
+    db.flush()
+    return company, employee
+
+
+def test_crud_validation_updates_ytd_ledger():
+    print("[TEST] Cumuls annuels après validation par le CRUD")
+    db = make_session()
+    company, employee = make_employee(db)
+    record = PayrollRecord(
+        employee_id=employee.id, period="2024-03", status="draft",
+        gross_salary=300000, taxable_income=289200, social_contributions=10800,
+        tax_amount=15920, net_salary=273280, salary_breakdown={"cnss_employer": 46800}
+    )
+    db.add(record)
+    db.commit()
+    assert crud_payroll.get_ytd_ledger(db, employee.id, 2024) is None
+
+    crud_payroll.update_payroll_record(db, record, PayrollRecordUpdate(status="validated"))
+    ledger = crud_payroll.get_ytd_ledger(db, employee.id, 2024)
+    assert ledger is not None
+    assert ledger.periods_count == 1
+    assert ledger.gross_salary == 300000
+    assert ledger.cnss_employee == 10800
+    assert ledger.cnss_employer == 46800
+    assert ledger.irpp == 15920
+    assert ledger.net_salary == 273280
+    print("  [OK] bulletin validé reporté dans le cumul")
+
+    crud_payroll.update_payroll_record(db, record, PayrollRecordUpdate(status="draft"))
+    db.refresh(ledger)
+    assert ledger.periods_count == 0
+    assert ledger.gross_salary == 0
+    assert ledger.net_salary == 0
+    print("  [OK] bulletin dévalidé retiré du cumul")
+
+
+def test_payslip_ytd_stops_at_record_period():
+    print("[TEST] Cumuls du bulletin arrêtés à sa période")
+    db = make_session()
+    company, employee = make_employee(db)
+    for period, gross, status in (("2023-12", 900, "validated"), ("2024-01", 100, "validated"),
+                                  ("2024-02", 200, "validated"), ("2024-03", 400, "draft"),
+                                  ("2024-04", 800, "validated")):
+        db.add(PayrollRecord(
+            employee_id=employee.id, period=period, status=status, gross_salary=gross,
+            taxable_income=gross, social_contributions=0, tax_amount=0, net_salary=gross
+        ))
+    db.commit()
+
+    expected = {"2024-01": 100, "2024-02": 300, "2024-03": 700, "2024-04": 1100}
+    for period, gross in expected.items():
+        payslip = next(iter_period_payslips(db, company.id, period))
+        assert payslip["ytd"]["year"] == 2024
+        assert payslip["ytd"]["gross_salary"] == gross, (period, payslip["ytd"])
+        assert payslip["ytd"]["net_salary"] == gross
+        print(f"  [OK] {period} : {gross}")
+
+
+if __name__ == "__main__":
+    test_crud_validation_updates_ytd_ledger()
+    test_payslip_ytd_stops_at_record_period()
+    print("[TEST] Résultat: OK")